@@ -0,0 +1,83 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# number of results kept by default
+CACHE_SIZE = 1024
+
+T = TypeVar('T')
+
+
+class ResultCache:
+    """
+    Bounded cache of computed results, e.g. rendered comparisons, for one version of the parsed data. The least
+    recently used results are dropped once the cache is full, and all of them as soon as a different version is
+    requested. Concurrent requests for a result that is being computed wait for this computation instead of starting
+    their own.
+    """
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self.version: Optional[Hashable] = None
+        self.results: Dict[Hashable, object] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, Future] = {}
+
+    def get(self, version: Hashable, key: Hashable, compute: Callable[[], T]) -> T:
+        """
+        Returns the cached result for a key, or computes and caches it. If the same result is being computed by
+        another thread, waits for it. Errors are raised to all waiting threads and are not cached.
+        :param version: the version of the data the result is computed from, see compare.data_version()
+        :param key: the key of the result, e.g. the normalized query
+        :param compute: function computing the result
+        :return: the result
+        """
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    logger.info(f"The data changed, dropping {len(self.results)} cached results.")
+                self.results.clear()
+                self.version = version
+            if key in self.results:
+                self.hits += 1
+                self.results.move_to_end(key)
+                return self.results[key]
+            future = self._pending.get((version, key))
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = self._pending[(version, key)] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = compute()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            with self._lock:
+                # the data might have changed while the result was computed
+                if version == self.version:
+                    self.results[key] = result
+                    while len(self.results) > self.maxsize:
+                        self.results.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                del self._pending[(version, key)]
+
+    def clear(self) -> None:
+        """Drops all cached results."""
+        with self._lock:
+            self.results.clear()
+            self.version = None
@@ -1,71 +1,219 @@
 import click
-from dbinspector.compare import compare_entries, summary_statistics
-from dbinspector.parse import parse_all
 from dbinspector.utils import clear_dir, determine_identifier_type, check_data_age
 import logging
 import os.path as osp
-import pandas as pd
-from dbinspector.startup import DATA, UNIPROT, REFSEQ
+from itertools import chain, islice
+from typing import Iterable, Iterator
+from dbinspector.client import DaemonClient, BATCH_SIZE
+from dbinspector.exceptions import DaemonUnavailableError
+import dbinspector.startup
+from dbinspector.startup import DATA, UNIPROT, REFSEQ, STORE, BACKEND, MEMORY_LIMIT, SOCKET, OUTPUT_FORMATS
+
+# The commands import the modules they need (and with them pandas, lxml, ftputil and tqdm) when they are invoked,
+# so that the help and the commands answered by the daemon start quickly.
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# number of queries not found by compare --input that are listed by name
+NOT_FOUND_SHOWN = 20
+
+
+class SetupCommand(click.Command):
+    """A command which creates the cache directories and sets up logging when it runs, but not for its help."""
+    def invoke(self, ctx: click.Context):
+        dbinspector.startup.setup()
+        return super().invoke(ctx)
+
 
-@click.group()
+class SetupGroup(click.Group):
+    """The commands of the CLI, see SetupCommand."""
+    command_class = SetupCommand
+
+
+@click.group(cls=SetupGroup)
 def cli():
     """Entry method for the CLI."""
-    pass
 
 
 @cli.command()
-def parse():
+@click.option("-b", "--backend", type=click.Choice(['json', 'sqlite']), default=BACKEND,
+              help="Storage backend for the parsed data. With sqlite, an indexed SQLite store is written as well.")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              help="Number of worker processes used to parse the UniProt XML and RefSeq FASTA files in parallel.")
+@click.option("-f", "--force", default=False, is_flag=True,
+              help="Parse all downloaded files again, also those that did not change since the last parse.")
+@click.option("-t", "--trembl", default=False, is_flag=True,
+              help="Also download and parse the unreviewed UniProt entries (TrEMBL) into the SQLite store.")
+@click.option("-m", "--memory-limit", type=click.IntRange(min=1), default=MEMORY_LIMIT,
+              help="Approximate memory in MB for the batches of TrEMBL entries written to the store.")
+def parse(backend: str = BACKEND, jobs: int = 1, force: bool = False, trembl: bool = False,
+          memory_limit: int = MEMORY_LIMIT):
     """Parse the downloaded database data."""
-    parse_all()
+    if trembl and backend != 'sqlite':
+        raise click.BadParameter("TrEMBL entries are only kept in the SQLite store, use -b sqlite.",
+                                 param_hint="'-t' / '--trembl'")
+    from dbinspector.parse import parse_all
+    parse_all(backend=backend, jobs=jobs, force=force, trembl=trembl, memory_limit=memory_limit)
     click.echo("UniProt and RefSeq downloaded data parsed. Consider clearing large downloads with clear-cache.")
 
 
+@cli.command()
+@click.option("-b", "--backend", type=click.Choice(['json', 'sqlite']), default=BACKEND,
+              help="Storage backend for the parsed data. With sqlite, an indexed SQLite store is written as well.")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1,
+              help="Number of worker processes used to parse the UniProt XML and RefSeq FASTA files in parallel.")
+@click.option("-t", "--trembl", default=False, is_flag=True,
+              help="Also refresh the unreviewed UniProt entries (TrEMBL) in the SQLite store.")
+def refresh(backend: str = BACKEND, jobs: int = 1, trembl: bool = False):
+    """
+    Download only the database files that changed upstream and parse again if any did.
+    """
+    if trembl and backend != 'sqlite':
+        raise click.BadParameter("TrEMBL entries are only kept in the SQLite store, use -b sqlite.",
+                                 param_hint="'-t' / '--trembl'")
+    from dbinspector.parse import parse_all, refresh_data
+    reports = refresh_data(trembl=trembl)
+    downloaded = [report for report in reports if not report['skipped']]
+    click.echo(f"{len(downloaded)} of {len(reports)} database files changed upstream and were downloaded.")
+    parsed = [osp.join(REFSEQ, 'refseq.json'), osp.join(UNIPROT, 'uniprot.json')]
+    if downloaded or not all(osp.exists(path) for path in parsed):
+        parse_all(backend=backend, jobs=jobs, trembl=trembl)
+        click.echo("UniProt and RefSeq data parsed.")
+    else:
+        click.echo("The parsed data is up to date.")
+
+
 @cli.command()
 @click.option("-q", "--query", type=str,
               help="UniProt ID, RefSeq ID, or gene symbol to compare entries in RefSeq and Uniprot.")
+@click.option("-i", "--input", "infile", type=click.File('r'), default=None,
+              help="File with one UniProt ID, RefSeq ID, or gene symbol per line to compare all at once ('-' for "
+                   "stdin). One line per query is written to the outfile, or printed.")
 @click.option("-o", "--outfile", type=str, default=None,
               help="The filepath to which the comparison table should be written as tsv file.")
-def compare(query: str, outfile: str = None):
+@click.option("-f", "--format", "output_format", type=click.Choice(OUTPUT_FORMATS), default=None,
+              help="Output format for --input, by default jsonl for outfiles ending in .jsonl and tsv otherwise.")
+@click.option("-s", "--socket", "socket_path", type=str, default=SOCKET,
+              help="Socket of the daemon started with serve, which is used if it is running.")
+def compare(query: str, infile=None, outfile: str = None, output_format: str = None, socket_path: str = SOCKET):
     """
     Searches databases for matches of given query, compares entries across databases and prints results.
     Query can be UniProt ID, RefSeq ID, or gene symbol. Optionally saves results to a file
     :param str query: Database accession identifier or symbol to be compared.
+    :param infile: File with one query per line, compared with compare_entries_batch().
     :param str outfile: Filepath for saving the results as a tsv.
+    :param str output_format: 'tsv' or 'jsonl', for --input only.
+    :param str socket_path: Filepath of the socket of the daemon.
     """
+    if infile is not None:
+        if query:
+            raise click.UsageError("Give either a single query with -q or a file of queries with -i, not both.")
+        compare_batch(infile, outfile, output_format, socket_path)
+        return
     if not query:
         params = {"uniprot_id": None, "refseq_id": None, "symbol": None}
     else:
         params = determine_identifier_type(query)
-    comparison_df = compare_entries(refseq_id=params["refseq_id"],
-                                    uniprot_id=params["uniprot_id"],
-                                    symbol=params["symbol"])
-    comparison_df.loc["sequence"] = comparison_df.loc["sequence"].str.wrap(30)
-    pd.set_option('display.max_colwidth', 60, "display.max_columns", None, "expand_frame_repr", False)
-    print(comparison_df)
+    try:
+        with DaemonClient(socket_path) as client:
+            text, tsv = client.request('compare', render=True, **params)
+    except DaemonUnavailableError:
+        from dbinspector.compare import compare_entries, render_table
+        text, tsv = render_table(compare_entries(refseq_id=params["refseq_id"],
+                                                 uniprot_id=params["uniprot_id"],
+                                                 symbol=params["symbol"]))
+    print(text)
     if outfile:
-        comparison_df.to_csv(outfile, sep='\t')
+        with open(outfile, 'w') as filehandle:
+            filehandle.write(tsv)
         logger.info(f"comparison for {query} saved at {outfile}")
 
+
+def compare_batch(infile, outfile: str = None, output_format: str = None, socket_path: str = SOCKET) -> None:
+    """
+    Compares the entries of all queries in a file and streams one record per query to the outfile or stdout, then
+    reports the queries that were not found.
+    :param infile: File with one query per line.
+    :param str outfile: Filepath for saving the results, printed if not given.
+    :param str output_format: 'tsv' or 'jsonl', by default derived from the outfile extension.
+    :param str socket_path: Filepath of the socket of the daemon, used if it is running.
+    """
+    if output_format is None:
+        output_format = 'jsonl' if outfile and outfile.endswith('.jsonl') else 'tsv'
+    from dbinspector.compare import write_comparisons
+    with click.open_file(outfile or '-', 'w') as filehandle:
+        not_found = write_comparisons(batch_records(infile, socket_path), filehandle, output_format)
+    if outfile:
+        logger.info(f"comparisons saved at {outfile}")
+    if not_found:
+        shown = ', '.join(not_found[:NOT_FOUND_SHOWN]) + (', ...' if len(not_found) > NOT_FOUND_SHOWN else '')
+        click.echo(f"{len(not_found)} queries could not be found in either database: {shown}", err=True)
+    else:
+        click.echo("All queries were found.", err=True)
+
+
+def batch_records(queries: Iterable[str], socket_path: str = SOCKET) -> Iterator[dict]:
+    """
+    Gives the records of compare_entries_batch() from the daemon, BATCH_SIZE queries at a time. If no daemon is
+    running, or it stops answering, the remaining queries are compared in-process.
+    :param queries: the queries, one per line
+    :param str socket_path: Filepath of the socket of the daemon.
+    """
+    from dbinspector.compare import compare_entries_batch
+    queries, pending = iter(queries), []
+    try:
+        with DaemonClient(socket_path) as client:
+            for batch in iter(lambda: list(islice(queries, BATCH_SIZE)), []):
+                pending = batch
+                records = client.request('compare_batch', queries=batch)
+                pending = []
+                yield from records
+    except DaemonUnavailableError as error:
+        if pending:
+            logger.warning(f"{error} Comparing the remaining queries in-process.")
+        yield from compare_entries_batch(chain(pending, queries))
+
+
 @cli.command()
 @click.option("-o", "--outfile", type=str, default=None,
               help="The filepath to which the database summary should be written as tsv file, if desired.")
-def database_summary(outfile: str = None):
+@click.option("-s", "--socket", "socket_path", type=str, default=SOCKET,
+              help="Socket of the daemon started with serve, which is used if it is running.")
+def database_summary(outfile: str = None, socket_path: str = SOCKET):
     """
-    Calculates summary statistics comparing the entries in the UniProt and RefSeq databases.
-    Optionally saves results to a file.
+    Shows summary statistics comparing the entries in the UniProt and RefSeq databases, as stored by dbi parse.
+    They are only calculated again if the parsed data changed since. Optionally saves results to a file.
     """
-    stats_tab = summary_statistics()
-    pd.set_option('display.max_colwidth', 60, "display.max_columns", None, "expand_frame_repr", False)
-    print(stats_tab)
+    try:
+        with DaemonClient(socket_path) as client:
+            text, tsv = client.request('summary', render=True)
+    except DaemonUnavailableError:
+        from dbinspector.compare import get_summary, render_table
+        text, tsv = render_table(get_summary())
+    print(text)
     if outfile:
-        stats_tab.to_csv(outfile, sep='\t')
+        with open(outfile, 'w') as filehandle:
+            filehandle.write(tsv)
         logger.info(f"Database summary statistics saved at {outfile}")
 
 
+@cli.command()
+@click.option("-s", "--socket", "socket_path", type=str, default=SOCKET,
+              help="Filepath of the Unix domain socket to listen on.")
+def serve(socket_path: str = SOCKET):
+    """
+    Runs a daemon which holds the parsed data in memory and answers compare and database-summary (and lookup)
+    requests over a Unix domain socket, until it is interrupted. compare and database-summary use it if it is running.
+    """
+    from dbinspector.daemon import serve as serve_socket
+    click.echo(f"Loading the parsed data and listening on {socket_path}, stop with Ctrl+C.")
+    try:
+        serve_socket(socket_path)
+    except KeyboardInterrupt:
+        click.echo("Daemon stopped.")
+
+
 @cli.command()
 @click.option('-p', '--parsed', default=False, is_flag=True,
               help="A flag indicating that user wants to see age of parsed data.")
@@ -98,6 +246,7 @@ def clear_cache(all_data=False):
             click.echo('Clearing parsed data files from cache...')
             clear_dir(REFSEQ)
             clear_dir(UNIPROT)
+            clear_dir(STORE)
     else:
         click.confirm('WARNING: Are you sure you want to delete the downloaded data files? '
                       + 'Project functionality remains, running parse after this will download/parse new, updated data',
@@ -0,0 +1,73 @@
+import socket
+from dbinspector.startup import SOCKET, DAEMON_TIMEOUT
+from dbinspector.exceptions import InputError, QueryNotFoundError, FileMissingError, DaemonUnavailableError
+import logging
+from typing import Any
+
+import json
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# errors raised by a request, which the client raises again instead of running the request in-process
+EXCEPTIONS = {error.__name__: error for error in [InputError, QueryNotFoundError, FileMissingError]}
+# seconds to wait for the daemon to accept a connection before running requests in-process
+CONNECT_TIMEOUT = 1
+# number of queries sent to the daemon at once by cli.batch_records()
+BATCH_SIZE = 1000
+
+
+class DaemonClient:
+    """
+    Connection to a running daemon. Errors of the daemon's code are raised again as their own exceptions, while
+    DaemonUnavailableError is raised if no daemon answers, or if it does not answer a request in time, so that
+    callers can run the request in-process instead.
+    """
+    def __init__(self, path: str = SOCKET, timeout: float = DAEMON_TIMEOUT):
+        """
+        :param str path: the filepath of the socket of the daemon
+        :param float timeout: seconds to wait for the answer to a request
+        """
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(CONNECT_TIMEOUT)
+            self.sock.connect(path)
+        except OSError as error:
+            self.sock.close()
+            logger.debug(f"No daemon on {path}: {error!r}")
+            raise DaemonUnavailableError(f"No daemon is listening on {path}.") from error
+        self.sock.settimeout(timeout)
+        self.rfile = self.sock.makefile('rb')
+
+    def request(self, command: str, **args) -> Any:
+        """
+        Sends a request and waits for its result, see daemon.handle_request().
+        :param str command: 'compare', 'compare_batch', 'summary' or 'lookup'
+        :raises DaemonUnavailableError: if the daemon closed the connection or did not answer in time
+        """
+        try:
+            self.sock.sendall(json.dumps({'command': command, 'args': args}).encode() + b'\n')
+            line = self.rfile.readline()
+        except socket.timeout as error:
+            # a late answer would be read as the answer to the next request
+            self.close()
+            raise DaemonUnavailableError(f"The daemon did not answer within {self.timeout} seconds.") from error
+        except OSError as error:
+            raise DaemonUnavailableError("The daemon closed the connection.") from error
+        if not line:
+            raise DaemonUnavailableError("The daemon closed the connection.")
+        response = json.loads(line)
+        if 'error' in response:
+            raise EXCEPTIONS.get(response['error'], RuntimeError)(response['message'])
+        return response['result']
+
+    def close(self) -> None:
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self) -> 'DaemonClient':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
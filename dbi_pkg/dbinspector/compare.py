@@ -1,9 +1,26 @@
-from dbinspector.map import find_entries, read_uniprot_data, read_refseq_data
-import pandas as pd
+from dbinspector.map import find_entries, read_uniprot_data, read_refseq_data, use_sqlite, hashed_entry, EntryLookup
 from dbinspector.exceptions import QueryNotFoundError, InputError
 import dbinspector.startup
+from dbinspector.startup import setup, OUTPUT_FORMATS
+import dbinspector.store
+from dbinspector.snapshot import PARSED_FILES
+from dbinspector.sequences import SEQUENCE_FILES, CHECKSUM_FILES
+from dbinspector.index import SYMBOL_INDEX_FILES
+from dbinspector.fingerprints import fingerprint
+from dbinspector.utils import determine_identifier_type, format_list_entry
+import csv
+import hashlib
 import logging
-from typing import Dict, Optional, List
+import os
+import os.path as osp
+from collections import defaultdict
+from typing import Any, Dict, Optional, List, Tuple, Iterable, Iterator, TextIO, TYPE_CHECKING
+
+import json
+
+# pandas (and numpy) are imported by the functions returning tables, lookups and batch comparisons do without them
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -31,9 +48,9 @@ def extract_query(arguments: List[str]) -> Optional[str]:
     return query
 
 
-def compare_entries(refseq_id: str = None, uniprot_id: str = None, symbol: str = None) -> pd.DataFrame:
+def compare_entries(refseq_id: str = None, uniprot_id: str = None, symbol: str = None) -> 'pd.DataFrame':
     """Finds equivalent entries in RefSeq and UniProt based on a single query as a RefSeqID, UniProtID, or gene symbol.
-    Results structured in a dataframe.
+    Results structured in a dataframe, see compare_entries_dict() for the same without pandas.
 
     :param str refseq_id: RefSeq ID to search for in the databases
     :param str uniprot_id: UniProt ID to search for in the databases
@@ -43,6 +60,22 @@ def compare_entries(refseq_id: str = None, uniprot_id: str = None, symbol: str =
     :raises QueryNotFoundError: if query not found in either database
     :raises InputError: if more than one or no queries entered.
     """
+    import pandas as pd
+    return pd.DataFrame(compare_entries_dict(refseq_id, uniprot_id, symbol))
+
+
+def compare_entries_dict(refseq_id: str = None, uniprot_id: str = None,
+                         symbol: str = None) -> Dict[str, Dict[str, Any]]:
+    """Finds equivalent entries in RefSeq and UniProt like compare_entries(), as plain dictionaries.
+
+    :param str refseq_id: RefSeq ID to search for in the databases
+    :param str uniprot_id: UniProt ID to search for in the databases
+    :param str symbol: Gene symbol to search for in the databases
+    :return: dictionary of column ('UniProt entry 1', ..., 'RefSeq entry 1', ...): {row ('symbol', 'UniProt ID',
+             'RefSeq ID', 'sequence', 'sequence matches', 'sequence length'): value}
+    :raises QueryNotFoundError: if query not found in either database
+    :raises InputError: if more than one or no queries entered.
+    """
     query = extract_query([refseq_id, uniprot_id, symbol])
     logger.info(f"Searching for entries matching query: {query}")
     entries = find_entries(refseq_id, uniprot_id, symbol)
@@ -62,46 +95,248 @@ def compare_entries(refseq_id: str = None, uniprot_id: str = None, symbol: str =
         entries["RefSeq"] = [{k: [] for k in entries["UniProt"][0].keys()}]
     columns = col_uniprot+col_refseq
     flattened_entries = entries["UniProt"] + entries["RefSeq"]
-    entry_d = {'symbol': [],
-         'UniProt ID': [],
-         'RefSeq ID': [],
-         'sequence': [],
-         'sequence matches': [None]*len(flattened_entries),
-         'sequence length': []}
-    for i in range(len(flattened_entries)):
-        entry_d['symbol'].append(flattened_entries[i]['symbol'])
-        entry_d['UniProt ID'].append(flattened_entries[i]['UniProt ID'])
-        entry_d['RefSeq ID'].append(flattened_entries[i]['RefSeq ID'])
-        sequence = flattened_entries[i]['sequence']
-        # check for sequence matches
-        if sequence in entry_d['sequence']:
-            all_index_matches = [index for index, seq in enumerate(entry_d['sequence']) if seq == sequence]
-            all_index_matches.append(i)
+    entry_d = {'symbol': [entry['symbol'] for entry in flattened_entries],
+               'UniProt ID': [entry['UniProt ID'] for entry in flattened_entries],
+               'RefSeq ID': [entry['RefSeq ID'] for entry in flattened_entries],
+               'sequence': [entry['sequence'] for entry in flattened_entries],
+               'sequence matches': [None]*len(flattened_entries),
+               'sequence length': [len(entry['sequence']) for entry in flattened_entries]}
+    # check for sequence matches: group the columns by sequence in a single pass
+    groups = defaultdict(list)
+    for i, sequence in enumerate(entry_d['sequence']):
+        if not isinstance(sequence, list):  # the placeholder of a missing database never matches
+            groups[sequence].append(i)
+    for all_index_matches in groups.values():
+        if len(all_index_matches) > 1:
             for j in all_index_matches:
                 entry_d['sequence matches'][j] = [columns[k] for k in all_index_matches if k != j]
-        entry_d['sequence'].append(sequence)
-        entry_d['sequence length'].append(len(sequence))
-    df = pd.DataFrame.from_dict(entry_d, orient="index", columns=columns)
-    # pd.set_option("display.max_rows", None, "display.max_columns", None)
     logger.info(f"Found entries for {query}")
-    return df
+    return {column: {row: values[i] for row, values in entry_d.items()} for i, column in enumerate(columns)}
+
+
+def render_table(table: 'pd.DataFrame') -> Tuple[str, str]:
+    """
+    Renders a table as the CLI prints it, with sequences wrapped, and as tsv. The daemon renders tables for the CLI,
+    which then does not need to import pandas.
+    :param pd.DataFrame table: e.g. the table of compare_entries() or summary_statistics()
+    :return: (text, tsv)
+    """
+    import pandas as pd
+    if 'sequence' in table.index:
+        table = table.copy()
+        table.loc["sequence"] = table.loc["sequence"].str.wrap(30)
+    with pd.option_context('display.max_colwidth', 60, "display.max_columns", None, "expand_frame_repr", False):
+        return str(table), table.to_csv(sep='\t')
+
 
+# columns of the per-query records of compare_entries_batch(), in the order they are written
+BATCH_COLUMNS = ['query', 'identifier type', 'found', 'UniProt ID', 'RefSeq ID', 'symbol', 'UniProt sequence length',
+                 'RefSeq sequence length', 'sequence matches']
+# names of the keys given by determine_identifier_type()
+IDENTIFIER_TYPES = {'refseq_id': 'RefSeq ID', 'uniprot_id': 'UniProt ID', 'symbol': 'symbol'}
 
-def summary_statistics() -> pd.DataFrame:
+
+def compare_entries_batch(queries: Iterable[str]) -> Iterator[dict]:
+    """
+    Finds and compares equivalent entries in RefSeq and UniProt for many queries, e.g. a gene panel or a list of
+    accession IDs. The type of each query is determined with determine_identifier_type(), and all lookups are
+    answered from a single snapshot of the parsed data (see map.EntryLookup), comparing sequences by their hashes.
+    Results are given one query at a time, so they can be written while the remaining queries are looked up.
+
+    :param iterable queries: RefSeq IDs, UniProt IDs or gene symbols, empty queries are skipped
+    :return: iterator of one record per query with the keys of BATCH_COLUMNS, in the order of the queries: the
+             accession IDs, symbols and sequence lengths of all entries found, and the groups of entries (by
+             accession ID) with the same sequence. 'found' is False if the query is in neither database.
+    """
+    lookup = EntryLookup()
+    count = 0
+    for query in queries:
+        query = query.strip()
+        if not query:
+            continue
+        params = determine_identifier_type(query)
+        entries = lookup.find(**params)
+        uniprot, refseq = entries['UniProt'], entries['RefSeq']
+        flattened_entries = [(entry['UniProt ID'], entry) for entry in uniprot] + \
+                            [(entry['RefSeq ID'][0], entry) for entry in refseq]
+        groups = defaultdict(list)
+        for acc, entry in flattened_entries:
+            groups[entry['sequence']].append(acc)
+        count += 1
+        yield {'query': query,
+               'identifier type': IDENTIFIER_TYPES[next(key for key, value in params.items() if value)],
+               'found': bool(flattened_entries),
+               'UniProt ID': [entry['UniProt ID'] for entry in uniprot],
+               'RefSeq ID': [entry['RefSeq ID'][0] for entry in refseq],
+               'symbol': list(dict.fromkeys(symbol for acc, entry in flattened_entries for symbol in entry['symbol'])),
+               'UniProt sequence length': [_length(entry) for entry in uniprot],
+               'RefSeq sequence length': [_length(entry) for entry in refseq],
+               'sequence matches': [accessions for accessions in groups.values() if len(accessions) > 1]}
+    logger.info(f"Compared entries for {count} queries")
+
+
+def _length(entry: dict) -> Optional[int]:
+    """Returns the sequence length of an entry with hashed sequence, None if it has no sequence."""
+    return None if entry['sequence'] is None else entry['sequence'].length
+
+
+def write_comparisons(records: Iterable[dict], filehandle: TextIO, output_format: str = 'tsv') -> List[str]:
+    """
+    Writes the records of compare_entries_batch() as they come in, either as a tab separated table with a header
+    line (lists are separated by commas, groups of sequence matches by semicolons) or as JSON Lines.
+    :param iterable records: records with the keys of BATCH_COLUMNS
+    :param filehandle: the text file to write to
+    :param str output_format: 'tsv' or 'jsonl'
+    :return: the queries that were found in neither database
+    :raises InputError: if the output format is not supported
+    """
+    if output_format not in OUTPUT_FORMATS:
+        logger.error(f"Unknown output format {output_format}")
+        raise InputError(f"Output format must be one of {', '.join(OUTPUT_FORMATS)}")
+    not_found = []
+    writer = csv.writer(filehandle, delimiter='\t', lineterminator='\n')
+    if output_format == 'tsv':
+        writer.writerow(BATCH_COLUMNS)
+    for record in records:
+        if not record['found']:
+            not_found.append(record['query'])
+        if output_format == 'jsonl':
+            filehandle.write(json.dumps(record) + '\n')
+            continue
+        writer.writerow([record['query'], record['identifier type'], record['found'],
+                         *[format_list_entry(record[key]) for key in ['UniProt ID', 'RefSeq ID', 'symbol']],
+                         *[format_list_entry(['' if length is None else str(length) for length in record[key]])
+                           for key in ['UniProt sequence length', 'RefSeq sequence length']],
+                         '; '.join(format_list_entry(accessions) for accessions in record['sequence matches'])])
+    return not_found
+
+
+def summary_statistics(backend: Optional[str] = None) -> 'pd.DataFrame':
     """
     Compares and summarizes matches between metadata of human protein entries across databases.
 
     Checks matching gene symbol, UniProt accession ID, RefSeq accession ID, amino acid sequence and sequence length
     and gives a percentage of matches for each. The results are returned as a pandas DatFrame type.
+    Both databases are read into columns once and all pairs are compared at once, see summary.summary_counts().
+    Use get_summary() for the table stored at the end of parsing.
 
+    :param str backend: 'json' or 'sqlite' to read the entries from, by default the configured backend
     :return: table summarizing matching entries between databases
     :rtype: pd.DataFrame
     """
+    from dbinspector.summary import summary_counts, json_columns, store_columns
     logger.info("Producing database summary statistics")
+    backend = backend or dbinspector.startup.BACKEND
+    columns = store_columns if backend == 'sqlite' else json_columns
+    refseq, uniprot = columns('refseq'), columns('uniprot')
+    return format_stats(summary_counts(refseq, uniprot), len(uniprot.accessions), len(refseq.accessions))
+
+
+def summary_inputs(backend: str) -> List[str]:
+    """Returns the filepaths of the parsed data the summary statistics of a backend are computed from."""
+    if backend == 'sqlite':
+        return [dbinspector.startup.SQLITE]
+    return [path for database in ['uniprot', 'refseq'] for path in
+            [PARSED_FILES[database], *SEQUENCE_FILES[database], CHECKSUM_FILES[database]]]
+
+
+def data_version(backend: Optional[str] = None) -> Tuple[str, Optional[float]]:
+    """
+    Identifies the version of the parsed data read by the lookups and comparisons of a backend, e.g. to cache their
+    results: the parsed, sequence, checksum and symbol index files, or the SQLite store.
+    :param str backend: 'json' or 'sqlite', by default the configured backend
+    :return: a digest of the fingerprints of the files, which changes whenever one of them is rewritten, and the time
+        the newest of them was modified as POSIX timestamp (None if there is no parsed data)
+    """
+    backend = backend or dbinspector.startup.BACKEND
+    paths = summary_inputs(backend)
+    if backend != 'sqlite':
+        paths += [SYMBOL_INDEX_FILES[database] for database in ['uniprot', 'refseq']]
+    fingerprints = [fingerprint(path) for path in paths]
+    digest = hashlib.blake2b(json.dumps([backend, fingerprints]).encode(), digest_size=16).hexdigest()
+    return digest, max((mtime_ns / 1e9 for _, mtime_ns in filter(None, fingerprints)), default=None)
+
+
+def read_summary(backend: Optional[str] = None, path: Optional[str] = None) -> Optional['pd.DataFrame']:
+    """
+    Reads the stored summary statistics of a backend, if they were computed from the current parsed data.
+    :param str backend: 'json' or 'sqlite', by default the configured backend
+    :param str path: the filepath of the stored summary statistics, startup.SUMMARY by default
+    :return: table summarizing matching entries between databases, None if not stored or outdated
+    """
+    backend = backend or dbinspector.startup.BACKEND
+    path = path or dbinspector.startup.SUMMARY
+    if not osp.exists(path):
+        return None
+    with open(path) as filehandle:
+        stored = json.load(filehandle).get(backend)
+    if stored is None or stored['inputs'] != {path: fingerprint(path) for path in summary_inputs(backend)}:
+        return None
+    import pandas as pd
+    return pd.DataFrame(**stored['table'])
+
+
+def write_summary(backend: Optional[str] = None, path: Optional[str] = None) -> 'pd.DataFrame':
+    """
+    Computes the summary statistics of a backend and stores them together with the fingerprints of the parsed data
+    they were computed from. The summary statistics of the other backend are kept.
+    :param str backend: 'json' or 'sqlite', by default the configured backend
+    :param str path: the filepath of the stored summary statistics, startup.SUMMARY by default
+    :return: table summarizing matching entries between databases
+    """
+    backend = backend or dbinspector.startup.BACKEND
+    path = path or dbinspector.startup.SUMMARY
+    setup()
+    inputs = {path: fingerprint(path) for path in summary_inputs(backend)}
+    table = summary_statistics(backend)
+    stored = {}
+    if osp.exists(path):
+        with open(path) as filehandle:
+            stored = json.load(filehandle)
+    stored[backend] = {'inputs': inputs, 'table': table.to_dict(orient='split')}
+    with open(path + '.tmp', 'w') as filehandle:
+        json.dump(stored, filehandle, indent=1)
+    os.replace(path + '.tmp', path)
+    logger.info(f"Stored the {backend} summary statistics in {path}.")
+    return table
+
+
+def get_summary(backend: Optional[str] = None) -> 'pd.DataFrame':
+    """
+    Returns the summary statistics stored at the end of parsing. They are only computed (and stored) again if the
+    parsed data changed since, so the time taken does not depend on the size of the databases.
+    :param str backend: 'json' or 'sqlite', by default the configured backend
+    :return: table summarizing matching entries between databases
+    :rtype: pd.DataFrame
+    """
+    table = read_summary(backend)
+    if table is None:
+        logger.info("The stored summary statistics are missing or outdated.")
+        table = write_summary(backend)
+    return table
+
+
+def pairwise_statistics() -> 'pd.DataFrame':
+    """
+    Computes the same table as summary_statistics() one pair of entries at a time with update_stats(), as a reference
+    for the vectorized implementation.
+
+    :return: table summarizing matching entries between databases
+    :rtype: pd.DataFrame
+    """
     # uniprot often has several refseq equivalents
     # -> need to keep track of only unique entry matches or the percentage will be >100%
     consensus = {key: {"matches": 0, "UniProt entry": set()}
                  for key in ["Symbol", "RefSeq ID", "UniProt ID", "Sequence", "Sequence length"]}
+    if use_sqlite():
+        # stream the linked entries from the indexed store instead of holding both databases in memory
+        for refseq_id, uniprot_id, first_db_searched in dbinspector.store.linked_pairs():
+            consensus = update_stats(dbinspector.store.get_entry('refseq', refseq_id, hashed=True),
+                                     dbinspector.store.get_entry('uniprot', uniprot_id, hashed=True),
+                                     refseq_id, uniprot_id, first_db_searched, consensus)
+        return finalize_stats(consensus, dbinspector.store.count_entries('uniprot'),
+                              dbinspector.store.count_entries('refseq'))
+
     uniprot_data = read_uniprot_data()
     refseq_data = read_refseq_data()
 
@@ -109,7 +344,8 @@ def summary_statistics() -> pd.DataFrame:
     for refseq_id in refseq_data:
         uniprot_id = refseq_data[refseq_id]["UniProt ID"]
         if uniprot_id and uniprot_id in uniprot_data:
-            consensus = update_stats(refseq_data[refseq_id], uniprot_data[uniprot_id],
+            consensus = update_stats(hashed_entry('refseq', refseq_id, refseq_data[refseq_id]),
+                                     hashed_entry('uniprot', uniprot_id, uniprot_data[uniprot_id]),
                                      refseq_id, uniprot_id, "refseq", consensus)
 
     # check the other direction: RefSeq IDs in UniProt entries in case this db shows equivalents that RefSeq doesn't
@@ -118,7 +354,8 @@ def summary_statistics() -> pd.DataFrame:
         for refseq_id in counterpart_ids:
             if refseq_id in refseq_data and uniprot_id != refseq_data[refseq_id]["UniProt ID"]:
                 # this only happens in one case
-                consensus = update_stats(refseq_data[refseq_id], uniprot_data[uniprot_id],
+                consensus = update_stats(hashed_entry('refseq', refseq_id, refseq_data[refseq_id]),
+                                         hashed_entry('uniprot', uniprot_id, uniprot_data[uniprot_id]),
                                          refseq_id, uniprot_id, "uniprot", consensus)
 
     return finalize_stats(consensus, len(uniprot_data), len(refseq_data))
@@ -126,7 +363,10 @@ def summary_statistics() -> pd.DataFrame:
 
 def update_stats(refseq_data: dict, uniprot_data: dict, rsid: str, upid: str, first_db_searched: str, consensus: dict
                  ) -> Dict[str, int]:
-    """Helper function used by summary_statistics(), not to be called by user."""
+    """
+    Helper function used by summary_statistics(), not to be called by user.
+    The sequences of the entries can be given as strings or as SequenceHash, which compare in the same way.
+    """
     # symbol match- refseq only has one (or no) symbol listed, uniprot has several (includng synonyms)
     if refseq_data['symbol'] and refseq_data['symbol'][0] in uniprot_data['symbol']:
         consensus["Symbol"]["matches"] += 1
@@ -161,12 +401,24 @@ def update_stats(refseq_data: dict, uniprot_data: dict, rsid: str, upid: str, fi
     return consensus
 
 
-def finalize_stats(consensus: Dict[str, int], num_entries_in_uniprot: int, num_entries_in_refseq: int) -> pd.DataFrame:
+def finalize_stats(consensus: Dict[str, int], num_entries_in_uniprot: int,
+                   num_entries_in_refseq: int) -> 'pd.DataFrame':
     """Helper function used by summary_statistics(), not to be called by user."""
-    stats = {category: [value["matches"],
-                        f"{len(value['UniProt entry'])/num_entries_in_uniprot:.2%}",
-                        f"{value['matches']/num_entries_in_refseq:.2%}"]
-             for category, value in consensus.items()}
+    return format_stats({category: (value["matches"], len(value["UniProt entry"]))
+                         for category, value in consensus.items()}, num_entries_in_uniprot, num_entries_in_refseq)
+
+
+def format_stats(counts: Dict[str, Tuple[int, int]], num_entries_in_uniprot: int,
+                 num_entries_in_refseq: int) -> 'pd.DataFrame':
+    """
+    Helper function used by summary_statistics(), not to be called by user.
+    :param dict counts: dictionary of category: (number of matches, number of matching UniProt entries)
+    """
+    import pandas as pd
+    stats = {category: [matches,
+                        f"{uniprot_entries/num_entries_in_uniprot:.2%}",
+                        f"{matches/num_entries_in_refseq:.2%}"]
+             for category, (matches, uniprot_entries) in counts.items()}
     stats_df = pd.DataFrame.from_dict(stats, orient="index", columns=["Number of matches",
                                                                       "Matching UniProt entries [%]",
                                                                       "Matching RefSeq entries [%]"])
@@ -0,0 +1,102 @@
+import importlib
+import os
+import os.path as osp
+import signal
+import socketserver
+import sys
+from dbinspector.startup import SOCKET, setup
+from dbinspector.exceptions import InputError, FileMissingError, DaemonUnavailableError
+from dbinspector.client import DaemonClient
+import dbinspector.snapshot
+from dbinspector.map import find_entries, EntryLookup
+from dbinspector.compare import compare_entries, compare_entries_dict, compare_entries_batch, get_summary, \
+    render_table
+import logging
+from typing import Any
+
+import json
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def handle_request(request: dict) -> Any:
+    """
+    Answers a single request from the in-memory data of the daemon.
+    :param dict request: {'command': 'compare', 'compare_batch', 'summary' or 'lookup', 'args': {keyword arguments}}
+        With 'render': true in the arguments, compare and summary give the table as rendered by render_table().
+    :return: the json serializable result: the comparison as given by compare_entries_dict(), the summary table in
+        the 'split' orientation of pandas, or [text, tsv] if rendered
+    :raises InputError: if the command is unknown
+    """
+    command, args = request.get('command'), dict(request.get('args', {}))
+    render = args.pop('render', False)
+    if command == 'compare':
+        return render_table(compare_entries(**args)) if render else compare_entries_dict(**args)
+    if command == 'compare_batch':
+        return list(compare_entries_batch(args['queries']))
+    if command == 'summary':
+        return render_table(get_summary()) if render else get_summary().to_dict(orient='split')
+    if command == 'lookup':
+        return find_entries(**args)
+    logger.error(f"Unknown daemon command {command}")
+    raise InputError(f"Unknown command {command}")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Answers the requests of a connection, one json object per line, until the client closes it."""
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                response = {'result': handle_request(json.loads(line))}
+            except Exception as error:
+                logger.warning(f"Request failed: {error!r}")
+                response = {'error': type(error).__name__, 'message': str(error)}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+def make_server(path: str = SOCKET) -> socketserver.ThreadingUnixStreamServer:
+    """
+    Loads the parsed data and binds the daemon to a Unix domain socket, serving each connection in its own thread.
+    :param str path: the filepath of the socket
+    :raises InputError: if another daemon is already listening on the socket
+    """
+    setup()
+    if osp.exists(path):
+        try:
+            DaemonClient(path).close()
+        except DaemonUnavailableError:
+            os.remove(path)  # left behind by a daemon that did not shut down
+        else:
+            logger.error(f"A daemon is already listening on {path}")
+            raise InputError(f"A daemon is already listening on {path}")
+    dbinspector.snapshot.preload()
+    # warm the daemon: pandas is imported once here instead of by the first request rendering a table
+    importlib.import_module('pandas')
+    try:
+        # resolves the sequence files and symbol indexes of the snapshots as well
+        EntryLookup()
+    except (OSError, FileMissingError) as error:
+        logger.warning(f"The parsed data could not be loaded, requests will fail until it is parsed: {error!r}")
+    server = socketserver.ThreadingUnixStreamServer(path, RequestHandler)
+    server.daemon_threads = True
+    os.chmod(path, 0o600)
+    return server
+
+
+def serve(path: str = SOCKET) -> None:
+    """
+    Runs the daemon until it is interrupted or terminated, then removes the socket. The data is held in memory, and
+    reloaded once the parsed files are rewritten (see snapshot.load_snapshot()).
+    :param str path: the filepath of the socket
+    """
+    server = make_server(path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Daemon listening on {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if osp.exists(path):
+            os.remove(path)
+        logger.info(f"Daemon on {path} stopped")
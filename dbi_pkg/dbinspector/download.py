@@ -0,0 +1,337 @@
+import os
+import os.path as osp
+import posixpath
+from dbinspector.startup import MANIFEST
+from dbinspector.exceptions import InputError, DownloadError
+from dbinspector.progress import ProgressCallback, report_task
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from time import time
+from typing import Optional, Callable, Dict, List, NamedTuple, BinaryIO
+from urllib import request
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+
+import hashlib
+import json
+
+import ftputil
+import ftputil.error
+import ftputil.session
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# number of files transferred at the same time, shared by all hosts
+MAX_CONNECTIONS = 4
+CHUNK_SIZE = 1024 * 1024
+
+
+class Transfer(NamedTuple):
+    """
+    A file to be downloaded from an FTP or HTTP(S) URL into a local directory, optionally with the URL of a file
+    listing published md5 checksums (either just the checksum, or lines of '<md5> <filename>').
+    """
+    url: str
+    download_dir: str
+    md5_url: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        return posixpath.basename(urlparse(self.url).path)
+
+    @property
+    def path(self) -> str:
+        return osp.join(self.download_dir, self.filename)
+
+
+class FTPSessions:
+    """Logged-in FTP sessions per host, which are reused for consecutive transfers from the same host."""
+    def __init__(self, user: str = 'anonymous', password: str = 'password'):
+        self.user = user
+        self.password = password
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self, hostname: str, port: int = 21):
+        """Lends an idle session for the host or logs in a new one. A session that failed is not reused."""
+        with self._lock:
+            host = self._idle[(hostname, port)].pop() if self._idle[(hostname, port)] else None
+        if host is None:
+            logger.info(f"Logging in to {hostname}:{port} ...")
+            host = ftputil.FTPHost(hostname, self.user, self.password,
+                                   session_factory=ftputil.session.session_factory(port=port))
+        try:
+            yield host
+        except Exception:
+            host.close()
+            raise
+        with self._lock:
+            self._idle[(hostname, port)].append(host)
+
+    def close(self) -> None:
+        """Logs out of all idle sessions."""
+        with self._lock:
+            for hosts in self._idle.values():
+                for host in hosts:
+                    host.close()
+            self._idle.clear()
+
+
+def download_files(transfers: List[Transfer], max_connections: int = MAX_CONNECTIONS,
+                   sessions: Optional[FTPSessions] = None,
+                   manifest_path: Optional[str] = None,
+                   progress: Optional[ProgressCallback] = None) -> List[Dict[str, object]]:
+    """
+    Downloads several files concurrently with a bounded number of connections. Each file is written to a partial
+    file first, which is resumed if a previous download was interrupted, and renamed once complete.
+    With a manifest, files whose remote size and modification time are unchanged since they were recorded are
+    skipped, and files which are downloaded are verified and recorded in the manifest, see refresh().
+    :param list transfers: the files to be downloaded
+    :param int max_connections: the maximum number of files transferred at the same time
+    :param FTPSessions sessions: FTP sessions to use, new sessions are opened (and closed afterwards) if not given
+    :param str manifest_path: the filepath of the download manifest, None to download all files unconditionally
+    :param progress: callback receiving the bytes downloaded of each file, see progress.ProgressCallback
+    :return: one report per transfer, see fetch()
+    """
+    own_sessions = sessions is None
+    sessions = sessions or FTPSessions()
+    if manifest_path is None:
+        def work(transfer):
+            return fetch(transfer, sessions, progress)
+    else:
+        manifest = Manifest(manifest_path)
+
+        def work(transfer):
+            return refresh(transfer, sessions, manifest, progress)
+    try:
+        with ThreadPoolExecutor(max_workers=max_connections) as executor:
+            return list(executor.map(work, transfers))
+    finally:
+        if own_sessions:
+            sessions.close()
+
+
+class Manifest:
+    """
+    The remote size, modification time and md5 checksum of each downloaded file, saved as json file. Files are
+    recorded by their local filepath, the manifest is saved after every change.
+    """
+    def __init__(self, path: str = MANIFEST):
+        self.path = path
+        self._lock = threading.Lock()
+        self.records = {}
+        if osp.exists(path):
+            with open(path) as filehandle:
+                self.records = json.load(filehandle)
+
+    def get(self, filepath: str) -> Optional[dict]:
+        with self._lock:
+            return self.records.get(filepath)
+
+    def set(self, filepath: str, record: dict) -> None:
+        with self._lock:
+            self.records[filepath] = record
+            self._save()
+
+    def discard(self, filepath: str) -> None:
+        with self._lock:
+            if self.records.pop(filepath, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        with open(self.path + '.tmp', 'w') as filehandle:
+            json.dump(self.records, filehandle, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def refresh(transfer: Transfer, sessions: FTPSessions, manifest: Manifest,
+            progress: Optional[ProgressCallback] = None) -> Dict[str, object]:
+    """
+    Downloads a single file only if it changed upstream: the remote size and modification time are compared with
+    those recorded in the manifest. A downloaded file is verified against its remote size and published md5
+    checksum, if there is one, before it replaces the local file and is recorded; if it does not match, it is
+    discarded, and the previous file and its record are kept.
+    :param Transfer transfer: the file to be downloaded
+    :param FTPSessions sessions: the FTP sessions to use
+    :param Manifest manifest: the download manifest
+    :param progress: callback receiving the bytes downloaded, see progress.ProgressCallback
+    :return: report as given by fetch(), plus whether the file was 'skipped' and its 'md5' checksum
+    :raises DownloadError: if the downloaded file does not match the remote size or published checksum
+    """
+    remote = remote_stat(transfer.url, sessions)
+    record = manifest.get(transfer.path)
+    unchanged = _same_remote(record, remote)
+    if unchanged and record.get('complete') and osp.exists(transfer.path) \
+            and osp.getsize(transfer.path) == remote['size']:
+        logger.info(f'{transfer.filename} is unchanged since {record["mtime"]}, skipping the download.')
+        report_task(progress, transfer.filename, remote['size'], remote['size'])
+        return {'file': transfer.path, 'bytes': 0, 'resumed from': 0, 'seconds': 0., 'MB/s': 0., 'skipped': True,
+                'md5': record.get('md5')}
+    # the partial file is recorded on its own, the record of the file stays that of the last verified download
+    part_path = transfer.path + '.part'
+    if osp.exists(part_path) and not _same_remote(manifest.get(part_path), remote):
+        os.remove(part_path)  # the partial file belongs to another version of the remote file
+    manifest.set(part_path, remote)
+    published = published_md5(transfer, sessions)
+    report = fetch(transfer, sessions, progress, replace=False)
+    size = osp.getsize(part_path)
+    md5 = file_md5(part_path)
+    if size != remote['size'] or (published is not None and md5 != published):
+        os.remove(part_path)
+        manifest.discard(part_path)
+        raise DownloadError(f"The download of {transfer.filename} is corrupted: {size} of {remote['size']} bytes, "
+                            f"md5 {md5} (published: {published}).")
+    os.replace(part_path, transfer.path)
+    manifest.set(transfer.path, {**remote, 'complete': True, 'md5': md5, 'verified': published is not None})
+    manifest.discard(part_path)
+    return {**report, 'skipped': False, 'md5': md5}
+
+
+def _same_remote(record: Optional[dict], remote: Dict[str, object]) -> bool:
+    """Returns whether a manifest record is of the same version of the remote file, see remote_stat()."""
+    return record is not None and all(record.get(key) == remote[key] for key in ('url', 'size', 'mtime'))
+
+
+def remote_stat(url: str, sessions: FTPSessions) -> Dict[str, object]:
+    """
+    Retrieves the size and modification time of a remote file without downloading it.
+    :param str url: the FTP or HTTP(S) URL of the file
+    :param FTPSessions sessions: the FTP sessions to use
+    :return: dictionary with 'url', 'size' in bytes and 'mtime' as POSIX timestamp
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'ftp':
+        with sessions.session(parsed.hostname, parsed.port or 21) as host:
+            stat = host.stat(parsed.path)
+            return {'url': url, 'size': stat.st_size, 'mtime': stat.st_mtime}
+    with request.urlopen(request.Request(url, method='HEAD')) as response:
+        last_modified = response.headers.get('Last-Modified')
+        return {'url': url, 'size': int(response.headers['Content-Length']),
+                'mtime': parsedate_to_datetime(last_modified).timestamp() if last_modified else None}
+
+
+def published_md5(transfer: Transfer, sessions: FTPSessions) -> Optional[str]:
+    """Reads the md5 checksum published for a file, None if there is none or it cannot be read."""
+    if transfer.md5_url is None:
+        return None
+    parsed = urlparse(transfer.md5_url)
+    try:
+        if parsed.scheme == 'ftp':
+            with sessions.session(parsed.hostname, parsed.port or 21) as host:
+                with host.open(parsed.path, 'rb') as remote:
+                    content = remote.read()
+        else:
+            with request.urlopen(transfer.md5_url) as response:
+                content = response.read()
+    except (OSError, URLError, ftputil.error.FTPError) as error:
+        logger.warning(f"No md5 checksum could be read for {transfer.filename} from {transfer.md5_url}: {error}")
+        return None
+    for line in content.decode('ascii', 'replace').splitlines():
+        fields = line.split()
+        if len(fields) == 1 or (len(fields) > 1 and posixpath.basename(fields[-1].lstrip('*')) == transfer.filename):
+            return fields[0].lower()
+    logger.warning(f"{transfer.md5_url} does not list an md5 checksum for {transfer.filename}.")
+    return None
+
+
+def file_md5(path: str) -> str:
+    """Computes the md5 checksum of a local file."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as filehandle:
+        for chunk in iter(lambda: filehandle.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def fetch(transfer: Transfer, sessions: FTPSessions, progress: Optional[ProgressCallback] = None,
+          replace: bool = True) -> Dict[str, object]:
+    """
+    Downloads a single file via FTP or HTTP(S), resuming a partial download if there is one.
+    :param Transfer transfer: the file to be downloaded
+    :param FTPSessions sessions: the FTP sessions to use
+    :param progress: callback receiving the bytes of the file downloaded so far, see progress.ProgressCallback
+    :param bool replace: move the downloaded file in place, otherwise it is left as the .part file to be verified first
+    :return: report with the downloaded 'file', the number of 'bytes' transferred, the offset it was 'resumed from',
+        the transfer time in 'seconds' and the throughput in 'MB/s'
+    :raises InputError: if the URL scheme is not supported
+    """
+    os.makedirs(transfer.download_dir, exist_ok=True)
+    part_path = transfer.path + '.part'
+    offset = osp.getsize(part_path) if osp.exists(part_path) else 0
+    scheme = urlparse(transfer.url).scheme
+    logger.info(f'Beginning download from {transfer.filename}' + (f' at byte {offset}...' if offset else '...'))
+    t0 = time()
+
+    def report(done, total):
+        report_task(progress, transfer.filename, done, total)
+
+    if scheme == 'ftp':
+        received, offset = _fetch_ftp(transfer.url, part_path, offset, sessions, report)
+    elif scheme in ('http', 'https'):
+        received, offset = _fetch_http(transfer.url, part_path, offset, report)
+    else:
+        raise InputError(f"Downloads via {scheme} are not supported: {transfer.url}")
+    if replace:
+        os.replace(part_path, transfer.path)
+    seconds = time() - t0
+    throughput = received / 1e6 / seconds if seconds else 0.
+    logger.info(f'...Finished file download for {transfer.filename}: {received / 1e6:.1f} MB in {seconds:.1f} '
+                f'seconds ({throughput:.2f} MB/s).')
+    return {'file': transfer.path, 'bytes': received, 'resumed from': offset, 'seconds': seconds,
+            'MB/s': throughput}
+
+
+def _copy(source: BinaryIO, part_path: str, offset: int, total: Optional[int],
+          report: Callable[[int, Optional[int]], None]) -> int:
+    """
+    Appends the source to the partial file (or starts it over if offset is 0), returns the bytes copied. The bytes of
+    the file downloaded so far and its total size, if known, are reported after every chunk.
+    """
+    received = 0
+    report(offset, total)
+    with open(part_path, 'ab' if offset else 'wb') as filehandle:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                return received
+            filehandle.write(chunk)
+            received += len(chunk)
+            report(offset + received, total)
+
+
+def _fetch_ftp(url: str, part_path: str, offset: int, sessions: FTPSessions,
+               report: Callable[[int, Optional[int]], None]) -> tuple:
+    """Downloads via FTP with a session of the pool, returns the bytes transferred and the offset used."""
+    parsed = urlparse(url)
+    with sessions.session(parsed.hostname, parsed.port or 21) as host:
+        size = host.path.getsize(parsed.path)
+        if offset > size:  # the partial file does not belong to the current remote file
+            offset = 0
+        if offset == size:
+            report(size, size)
+            return 0, offset
+        with host.open(parsed.path, 'rb', rest=offset or None) as remote:
+            return _copy(remote, part_path, offset, size, report), offset
+
+
+def _fetch_http(url: str, part_path: str, offset: int, report: Callable[[int, Optional[int]], None]) -> tuple:
+    """Downloads via HTTP(S) with a range request for partial files, returns the bytes transferred and offset used."""
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    try:
+        response = request.urlopen(request.Request(url, headers=headers))
+    except HTTPError as error:
+        if error.code == 416 and offset:  # range not satisfiable: the partial file is complete already
+            report(offset, offset)
+            return 0, offset
+        raise
+    with response:
+        if offset and response.status != 206:  # the server ignored the range and sends the whole file
+            offset = 0
+        length = response.headers.get('Content-Length')
+        return _copy(response, part_path, offset, offset + int(length) if length else None, report), offset
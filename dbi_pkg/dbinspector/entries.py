@@ -0,0 +1,117 @@
+import os
+import os.path as osp
+from dbinspector.startup import REFSEQ, UNIPROT
+from dbinspector.snapshot import PARSED_FILES
+import logging
+from array import array
+from typing import Iterator, Tuple
+
+import json
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# decodes the accession ID and the entry of a line separately, without building a json object of the line
+_DECODER = json.JSONDecoder()
+
+# byte offset of each entry in the parsed json file, in the order of the entries
+OFFSET_FILES = {'refseq': osp.join(REFSEQ, 'refseq.offsets'),
+                'uniprot': osp.join(UNIPROT, 'uniprot.offsets')}
+
+
+class EntryWriter:
+    """
+    Writes the parsed json file of a database one entry at a time, so that the entries never have to be held in
+    memory together. The file is a single json object as before, but with one entry per line, and the byte offset of
+    each line is written into an offset file, so that single entries can be read back without loading the file.
+    The files are written next to their targets and moved in place by close(), they are discarded if writing fails
+    within a with block.
+    """
+    def __init__(self, path: str, offset_path: str):
+        self.paths = [path, offset_path]
+        self.offsets = array('q')
+        self.filehandle = open(path + '.tmp', 'w')
+        self.filehandle.write('{\n')
+        self.position = 2
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def add(self, accession: str, entry: dict) -> None:
+        """
+        Appends the next entry.
+        :param str accession: the accession ID of the entry
+        :param dict entry: the entry info, without sequence
+        """
+        line = f'{json.dumps(accession)}: {json.dumps(entry)}'
+        if self.offsets:
+            line = ',\n' + line
+            self.offsets.append(self.position + 2)
+        else:
+            self.offsets.append(self.position)
+        self.filehandle.write(line)
+        # json.dumps escapes all non-ASCII characters, so characters and bytes are the same
+        self.position += len(line)
+
+    def close(self) -> int:
+        """Completes the files and moves them in place, returns the number of entries written."""
+        self.filehandle.write('\n}\n' if self.offsets else '}\n')
+        self.filehandle.close()
+        with open(self.paths[1] + '.tmp', 'wb') as filehandle:
+            self.offsets.tofile(filehandle)
+        for path in self.paths:
+            os.replace(path + '.tmp', path)
+        return len(self.offsets)
+
+    def discard(self) -> None:
+        """Removes the partially written files."""
+        self.filehandle.close()
+        for path in self.paths:
+            if osp.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+
+    def __enter__(self) -> 'EntryWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.discard()
+
+
+def _read_line(line: str) -> Tuple[str, dict]:
+    """Reads a single line of an entry as written by EntryWriter."""
+    accession, end = _DECODER.raw_decode(line)
+    # skip the ': ' between the accession ID and the entry
+    return accession, _DECODER.raw_decode(line, end + 2)[0]
+
+
+def iter_entries(path: str) -> Iterator[Tuple[str, dict]]:
+    """
+    Streams the entries of a parsed json file, one line at a time. Files written in one piece are read as a whole.
+    :param str path: the filepath of the parsed json file
+    :return: iterator of (accession ID, {entry info}) in the order of the file
+    """
+    with open(path) as filehandle:
+        if filehandle.readline() != '{\n':
+            filehandle.seek(0)
+            yield from json.load(filehandle).items()
+            return
+        for line in filehandle:
+            if line != '}\n':
+                yield _read_line(line)
+
+
+def read_entry_at(database: str, row: int) -> Tuple[str, dict]:
+    """
+    Reads a single entry of the parsed json file of a database by its position, using the offset file.
+    :param str database: either 'refseq' or 'uniprot'
+    :param int row: the position of the entry in the parsed data
+    :return: (accession ID, {entry info})
+    """
+    offsets = array('q')
+    with open(OFFSET_FILES[database], 'rb') as filehandle:
+        filehandle.seek(row * offsets.itemsize)
+        offsets.frombytes(filehandle.read(offsets.itemsize))
+    with open(PARSED_FILES[database]) as filehandle:
+        filehandle.seek(offsets[0])
+        return _read_line(filehandle.readline())
@@ -20,3 +20,17 @@ class FileMissingError(Exception):
     def __init__(self, message="This file is not found. Try running parse() once again."):
         self.message = message
         super().__init__(message)
+
+
+class DownloadError(Exception):
+    """Raises an error if a downloaded file is incomplete or does not match its published checksum"""
+    def __init__(self, message="The download is corrupted. Try downloading it once again."):
+        self.message = message
+        super().__init__(message)
+
+
+class DaemonUnavailableError(Exception):
+    """Raises an error if no daemon answers on the socket, in which case requests are run in-process instead"""
+    def __init__(self, message="No daemon is running. Start one with dbi serve."):
+        self.message = message
+        super().__init__(message)
@@ -0,0 +1,74 @@
+import os
+import os.path as osp
+from dbinspector.startup import FINGERPRINTS, setup
+import logging
+import threading
+from typing import Optional, Dict, List
+
+import json
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def fingerprint(path: str) -> Optional[List[int]]:
+    """Returns [size, modification time in ns] of a file, None if it does not exist."""
+    if not osp.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Fingerprints:
+    """
+    The fingerprints of the input and output files of each parse stage, as recorded when the stage last ran, saved as
+    json file. A stage has to run again if any of its inputs changed or any of its outputs changed or is missing.
+    Stages running at the same time may record their fingerprints concurrently.
+    """
+    def __init__(self, path: str = FINGERPRINTS):
+        self.path = path
+        self.stages = {}
+        self._lock = threading.Lock()
+        if osp.exists(path):
+            with open(path) as filehandle:
+                self.stages = json.load(filehandle)
+
+    def changed(self, stage: str, inputs: List[str], outputs: List[str]) -> bool:
+        """
+        Checks whether a stage has to run again.
+        :param str stage: the name of the stage
+        :param list inputs: the filepaths read by the stage
+        :param list outputs: the filepaths written by the stage
+        """
+        record = self.stages.get(stage)
+        return record is None or record != self._fingerprints(inputs, outputs)
+
+    def record(self, stage: str, inputs: List[str], outputs: List[str]) -> None:
+        """Records the fingerprints of the files of a stage after it ran."""
+        fingerprints = self._fingerprints(inputs, outputs)
+        with self._lock:
+            self.stages[stage] = fingerprints
+            self._save()
+
+    def forget(self, stage: str) -> None:
+        """Forgets a stage, so that it runs again, e.g. because the output of another stage replaced its output."""
+        with self._lock:
+            if self.stages.pop(stage, None) is not None:
+                self._save()
+
+    def clear(self) -> None:
+        """Forgets all stages, so that all of them run again."""
+        with self._lock:
+            self.stages = {}
+            self._save()
+
+    @staticmethod
+    def _fingerprints(inputs: List[str], outputs: List[str]) -> Dict[str, dict]:
+        return {'inputs': {path: fingerprint(path) for path in inputs},
+                'outputs': {path: fingerprint(path) for path in outputs}}
+
+    def _save(self) -> None:
+        setup()
+        with open(self.path + '.tmp', 'w') as filehandle:
+            json.dump(self.stages, filehandle, indent=1)
+        os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,111 @@
+import os.path as osp
+from dbinspector.startup import REFSEQ, UNIPROT
+from dbinspector.snapshot import PARSED_FILES, file_signature, load_snapshot
+from dbinspector.records import compact_index
+import logging
+from typing import Optional, Dict, List, Sequence
+
+import json
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# inverted symbol indexes, stored next to the parsed data
+SYMBOL_INDEX_FILES = {'refseq': osp.join(REFSEQ, 'refseq_symbols.json'),
+                      'uniprot': osp.join(UNIPROT, 'uniprot_symbols.json')}
+
+
+def add_symbols(index: Dict[str, List[list]], accession: str, symbols: List[str],
+                symbol_types: Optional[Dict[str, str]] = None) -> None:
+    """
+    Adds the symbols of one entry to an inverted symbol index, so that the index can be built while the entries are
+    parsed, see build_symbol_index().
+    :param dict index: dictionary of upper case symbol: list of [accession ID, symbol, symbol type], extended in place
+    :param str accession: the accession ID of the entry
+    :param list symbols: the symbols of the entry
+    :param dict symbol_types: optional dictionary of symbol: 'primary' or 'synonym', missing symbols are primary
+    """
+    types = symbol_types or {}
+    for symbol in symbols:
+        index.setdefault(symbol.upper(), []).append([accession, symbol, types.get(symbol, 'primary')])
+
+
+def build_symbol_index(data: Dict[str, dict],
+                       symbol_types: Optional[Dict[str, Dict[str, str]]] = None) -> Dict[str, List[list]]:
+    """
+    Builds the inverted index of gene symbol -> entries. Keys are the upper case symbols, so that lookups are
+    case-insensitive, each posting keeps the symbol as listed in the entry and whether it is a primary or synonym name.
+    :param dict data: dictionary of accession ID: {entry info}
+    :param dict symbol_types: optional dictionary of accession ID: {symbol: 'primary' or 'synonym'}, if not given
+        all symbols are treated as primary
+    :return: dictionary of upper case symbol: list of [accession ID, symbol, symbol type] in the order of the data
+    """
+    index = {}
+    for acc, entry in data.items():
+        add_symbols(index, acc, entry['symbol'], symbol_types.get(acc) if symbol_types is not None else None)
+    return index
+
+
+def write_symbol_index(database: str, index: Dict[str, List[list]]) -> None:
+    """
+    Saves the inverted symbol index of a database together with the signature of the parsed data it belongs to.
+    Must be called after the parsed json file has been written.
+    :param str database: either 'refseq' or 'uniprot'
+    :param dict index: the inverted symbol index as built by build_symbol_index()
+    """
+    mtime, size, inode = file_signature(PARSED_FILES[database])
+    with open(SYMBOL_INDEX_FILES[database], 'w') as filehandle:
+        json.dump({'source': [mtime, size], 'symbols': index}, filehandle)
+
+
+def get_symbol_index(database: str) -> Dict[str, List[tuple]]:
+    """
+    Returns the inverted symbol index belonging to the current snapshot of a database. The saved index is used if
+    it was written for the current parsed data, otherwise the index is built from the data. The postings are held as
+    tuples of interned strings, see records.compact_index().
+    :param str database: either 'refseq' or 'uniprot'
+    :return: dictionary of upper case symbol: list of (accession ID, symbol, symbol type)
+    """
+    snapshot = load_snapshot(PARSED_FILES[database])
+    if snapshot.symbol_index is None:
+        index = None
+        path = SYMBOL_INDEX_FILES[database]
+        if osp.exists(path):
+            with open(path) as filehandle:
+                saved = json.load(filehandle)
+            if saved['source'] == list(snapshot.signature[:2]):
+                index = compact_index(saved['symbols'])
+            else:
+                logger.warning(f"The symbol index {path} is outdated and will be rebuilt in memory.")
+        if index is None:
+            index = compact_index(build_symbol_index(snapshot.data))
+        snapshot.symbol_index = index
+    return snapshot.symbol_index
+
+
+def lookup_symbol(database: str, query: str, symbol_types: tuple = ('primary', 'synonym')) -> List[str]:
+    """
+    Finds all entries of a database that list the given gene symbol as given or in upper case.
+    :param str database: either 'refseq' or 'uniprot'
+    :param str query: gene symbol
+    :param tuple symbol_types: the types of symbols to search, primary and/or synonym
+    :return: list of accession IDs in the order of the parsed data
+    """
+    return match_symbol(get_symbol_index(database), query, symbol_types)
+
+
+def match_symbol(index: Dict[str, List[Sequence[str]]], query: str,
+                 symbol_types: tuple = ('primary', 'synonym')) -> List[str]:
+    """
+    Finds all entries in an inverted symbol index that list the given gene symbol as given or in upper case,
+    see lookup_symbol().
+    :param dict index: inverted symbol index, see build_symbol_index()
+    :param str query: gene symbol
+    :param tuple symbol_types: the types of symbols to search, primary and/or synonym
+    :return: list of accession IDs in the order of the parsed data
+    """
+    matches = []
+    for acc, symbol, symbol_type in index.get(query.upper(), []):
+        if symbol in (query, query.upper()) and symbol_type in symbol_types and acc not in matches:
+            matches.append(acc)
+    return matches
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import os.path as osp
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from time import time
+from typing import Optional, Callable, Dict, Iterator, Tuple
+
+import dbinspector.startup
+from dbinspector.progress import Progress
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# number of finished jobs whose status is kept
+MAX_JOBS = 20
+# seconds between two updates of the progress of a running job in the shared state file
+PUBLISH_EVERY = 0.5
+
+try:
+    import fcntl
+except ImportError:  # not on Unix: the jobs are only shared between the threads of this process
+    fcntl = None
+# held while the shared state is read and written, in addition to the file lock where there is one
+_STATE_LOCK = threading.Lock()
+
+
+class ParseJob:
+    """A run of parse_all() in the background, with the progress reported by its stages."""
+    def __init__(self, kwargs: Dict[str, object]):
+        self.id = uuid.uuid4().hex
+        self.kwargs = kwargs
+        self.progress = Progress()
+        self.state = 'queued'
+        self.submitted = time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.future: Optional[Future] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ('queued', 'running')
+
+    def status(self) -> Dict[str, object]:
+        """
+        :return: json serializable dictionary with the 'id', 'state' ('queued', 'running', 'done' or 'failed'), the
+            times the job was 'submitted', 'started' and 'finished', the 'error' message if it failed, and the
+            'stages' and 'tasks' of its progress, see progress.Progress.status()
+        """
+        return {'id': self.id, 'state': self.state, 'submitted': self.submitted, 'started': self.started,
+                'finished': self.finished, 'error': self.error, **self.progress.status()}
+
+    @classmethod
+    def from_status(cls, status: Dict[str, object]) -> 'ParseJob':
+        """Returns the job as reported by status(), e.g. a job run by another process."""
+        job = cls({})
+        for key in ('id', 'state', 'submitted', 'started', 'finished', 'error'):
+            setattr(job, key, status[key])
+        job.progress = Progress.from_status(status)
+        return job
+
+
+class ParseJobs:
+    """
+    Runs parse_all() in a background thread instead of the thread answering a request, one job at a time. A job that
+    is submitted while another one is queued or running is not started; the running job is returned instead, so that
+    concurrent requests attach to the same parse. The state and progress of the jobs are kept in a json file shared by
+    all processes, e.g. the workers of a pre-forking web server, which hold an exclusive lock on it (flock) while they
+    submit a job, so that a job started by any worker is attached to and reported by all of them (on Unix; elsewhere
+    the lock only holds within the process). A job whose process exited before it finished is reported as failed.
+    """
+    def __init__(self, target: Optional[Callable[..., None]] = None, path: Optional[str] = None):
+        """
+        :param target: the function run by the jobs, which is passed a 'progress' callback, parse_all() by default
+        :param str path: the filepath of the shared state of the jobs, startup.JOBS by default
+        """
+        self.target = target
+        self.path = path or dbinspector.startup.JOBS
+        # the jobs run by this process
+        self.jobs: Dict[str, ParseJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='parse-job')
+
+    def submit(self, **kwargs) -> Tuple[ParseJob, bool]:
+        """
+        Starts a parse in the background, unless one is queued or running already in any process.
+        :param kwargs: the arguments passed to parse_all()
+        :return: the job, and whether it was started by this call (False if it was already running)
+        """
+        with self._lock, self._shared() as records:
+            for record in records.values():
+                if record['state'] in ('queued', 'running'):
+                    logger.info(f"The parse job {record['id']} is {record['state']}, attaching to it.")
+                    return self._job(record), False
+            job = ParseJob(kwargs)
+            self.jobs[job.id] = job
+            while len(self.jobs) > MAX_JOBS:
+                self.jobs.popitem(last=False)
+            records[job.id] = self._record(job)
+            job.future = self._executor.submit(self._run, job)
+        logger.info(f"Submitted the parse job {job.id}.")
+        return job, True
+
+    def get(self, job_id: Optional[str] = None) -> Optional[ParseJob]:
+        """
+        :param str job_id: the ID of the job, by default the job submitted last
+        :return: the job, None if there is no such job
+        """
+        with self._lock, self._shared(write=False) as records:
+            if job_id is None:
+                record = next(reversed(records.values()), None)
+            else:
+                record = records.get(job_id)
+            return None if record is None else self._job(record)
+
+    def _job(self, record: Dict[str, object]) -> ParseJob:
+        """Returns the job of a record in the shared state, the job itself if it is run by this process."""
+        return self.jobs.get(record['id']) or ParseJob.from_status(record)
+
+    @staticmethod
+    def _record(job: ParseJob) -> Dict[str, object]:
+        return {**job.status(), 'pid': os.getpid()}
+
+    @contextmanager
+    def _shared(self, write: bool = True) -> Iterator[Dict[str, Dict[str, object]]]:
+        """
+        Holds the lock on the shared state of the jobs and yields the records of the jobs by ID, oldest first, which
+        are written back afterwards.
+        """
+        os.makedirs(osp.dirname(self.path) or '.', exist_ok=True)
+        with _STATE_LOCK, open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            records = {}
+            if osp.exists(self.path):
+                with open(self.path) as filehandle:
+                    records = json.load(filehandle)
+            for record in records.values():
+                if record['state'] in ('queued', 'running') and not _alive(record['pid']):
+                    record.update(state='failed', finished=time(), error='The process running the job exited.')
+            yield records
+            if write:
+                while len(records) > MAX_JOBS:
+                    del records[next(iter(records))]
+                with open(self.path + '.tmp', 'w') as filehandle:
+                    json.dump(records, filehandle)
+                os.replace(self.path + '.tmp', self.path)
+
+    def _publish(self, job: ParseJob) -> None:
+        """Writes the state and progress of a job run by this process into the shared state."""
+        with self._shared() as records:
+            records[job.id] = self._record(job)
+
+    def _run(self, job: ParseJob) -> None:
+        if self.target is None:
+            from dbinspector.parse import parse_all
+            self.target = parse_all
+        published = time()
+
+        def progress(event: Dict[str, object]) -> None:
+            nonlocal published
+            job.progress(event)
+            if 'stage' in event or time() - published >= PUBLISH_EVERY:
+                published = time()
+                self._publish(job)
+
+        job.state, job.started = 'running', time()
+        self._publish(job)
+        state = 'failed'
+        try:
+            self.target(progress=progress, **job.kwargs)
+            state = 'done'
+        except Exception as error:
+            logger.exception(f"The parse job {job.id} failed.")
+            job.error = str(error) or repr(error)
+        finally:
+            # the job is only reported as finished once its finishing time is set
+            job.finished = time()
+            job.state = state
+            self._publish(job)
+            logger.info(f"The parse job {job.id} is {state} after {job.finished - job.started:.2f} seconds.")
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops the background thread once the running job finished."""
+        self._executor.shutdown(wait=wait)
+
+
+def _alive(pid: int) -> bool:
+    """Returns whether a process is running."""
+    if fcntl is None:  # the jobs are not shared between processes, and os.kill() would terminate the process
+        return pid == os.getpid()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # running, but owned by another user
+        pass
+    return True
@@ -1,9 +1,10 @@
-import os.path as osp
-from dbinspector.startup import REFSEQ, UNIPROT
+from dbinspector.snapshot import get_data, load_snapshot, PARSED_FILES
+from dbinspector.index import lookup_symbol, match_symbol, get_symbol_index
+from dbinspector.sequences import get_sequence, get_sequence_hash, get_sequence_file, hash_sequence
+import dbinspector.startup
+import dbinspector.store
 import logging
-from typing import Optional, Dict, List
-
-import json
+from typing import Optional, Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -47,24 +48,26 @@ def retrieve_by_refseq_id(query: str) -> Dict[str, List[Optional[dict]]]:
 
 def get_refseq_entry(query: str) -> Optional[dict]:
     """Retrieves a single RefSeq entry by accession ID."""
-    data = read_refseq_data()
-    try:
-        refseq_entry = data[query]
+    refseq_entry = get_entry('refseq', query)
+    if refseq_entry is not None:
         # give back the key as well
         refseq_entry['RefSeq ID'] = [query]
-    except KeyError:
-        refseq_entry = None
     return refseq_entry
 
 
 def read_refseq_data() -> Dict[str, dict]:
     """
     Reads parsed RefSeq data from cache. Data is stored as a json file
-     and read/returned as a dictionary.
+     and read/returned as a dictionary. The file is only loaded once per
+     process and shared by all lookups, so the dictionary must not be modified.
+     Its entries are records which read like dictionaries, see
+     dbinspector.records.Entry, .copy() converts them into dictionaries.
+     Entries parsed with a sequence file do not hold their 'sequence', use
+     complete_entry() or dbinspector.sequences.get_sequence() to read it.
     """
-    with open(osp.join(REFSEQ, 'refseq.json')) as filehandle:
-        data = json.load(filehandle)
-    return data
+    if use_sqlite():
+        return dbinspector.store.read_data('refseq')
+    return get_data('refseq')
 
 
 def retrieve_by_uniprot_id(query: str) -> Dict[str, List[Optional[dict]]]:
@@ -87,21 +90,21 @@ def retrieve_by_uniprot_id(query: str) -> Dict[str, List[Optional[dict]]]:
 
 def get_uniprot_entry(query: str) -> Optional[dict]:
     """Retrieves a single UniProt entry by UniProt accession ID."""
-    data = read_uniprot_data()
-    try:
-        uniprot_entry = data[query]
+    uniprot_entry = get_entry('uniprot', query)
+    if uniprot_entry is not None:
         # give back the key as well
         uniprot_entry['UniProt ID'] = query
-    except KeyError:
-        uniprot_entry = None
     return uniprot_entry
 
 
 def read_uniprot_data() -> Dict[str, dict]:
-    """Reads parsed UniProt data from cached json file."""
-    with open(osp.join(UNIPROT, 'uniprot.json')) as filehandle:
-        data = json.load(filehandle)
-    return data
+    """
+    Reads parsed UniProt data from cached json file (shared in-process snapshot, not to be modified). Its entries are
+    records which read like dictionaries, see dbinspector.records.Entry.
+    """
+    if use_sqlite():
+        return dbinspector.store.read_data('uniprot')
+    return get_data('uniprot')
 
 
 def retrieve_by_symbol(query: str) -> Dict[str, List[Dict[str, dict]]]:
@@ -116,24 +119,173 @@ def retrieve_by_symbol(query: str) -> Dict[str, List[Dict[str, dict]]]:
                                                'sequence': (str)}}] }
     """
     # UniProt
-    uniprot_data, uniprot_matches = read_uniprot_data(), []
-    for acc_id, entry in uniprot_data.items():
-        if (query in entry['symbol']) or (query.upper() in entry['symbol']):
-            match = entry.copy()
-            # give back the key as well
-            match['UniProt ID'] = acc_id
-            uniprot_matches.append(match)
+    uniprot_matches = []
+    for acc_id, entry in find_by_symbol('uniprot', query):
+        match = entry.copy()
+        # give back the key as well
+        match['UniProt ID'] = acc_id
+        uniprot_matches.append(match)
     # RefSeq
-    refseq_data, refseq_matches = read_refseq_data(), []
-    for acc_id, entry in refseq_data.items():
-        if (query in entry['symbol']) or (query.upper() in entry['symbol']):
-            match = entry.copy()
-            # give back the key as well
-            match['RefSeq ID'] = acc_id
-            refseq_matches.append(match)
+    refseq_matches = []
+    for acc_id, entry in find_by_symbol('refseq', query):
+        match = entry.copy()
+        # give back the key as well
+        match['RefSeq ID'] = acc_id
+        refseq_matches.append(match)
     return {'UniProt': uniprot_matches, 'RefSeq': refseq_matches}
 
 
+# =======================================
+#   storage backends
+# =======================================
+
+
+def use_sqlite() -> bool:
+    """Whether lookups are answered from the SQLite store instead of the parsed json files."""
+    return dbinspector.startup.BACKEND == 'sqlite'
+
+
+def get_entry(database: str, accession: str) -> Optional[dict]:
+    """
+    Retrieves a copy of a single entry from the configured storage backend.
+    :param str database: either 'refseq' or 'uniprot'
+    :param str accession: the accession ID of the entry
+    :return: the entry without its own accession ID, None if not found
+    """
+    if use_sqlite():
+        return dbinspector.store.get_entry(database, accession)
+    entry = get_data(database).get(accession)
+    return complete_entry(database, accession, entry) if entry is not None else None
+
+
+def find_by_symbol(database: str, query: str) -> List[Tuple[str, dict]]:
+    """
+    Retrieves all entries of a database which list the given gene symbol (as given or in upper case).
+    :param str database: either 'refseq' or 'uniprot'
+    :param str query: gene symbol
+    :return: list of (accession ID, entry) in the order of the parsed data
+    """
+    if use_sqlite():
+        return dbinspector.store.find_by_symbol(database, [query, query.upper()])
+    data = get_data(database)
+    return [(acc_id, complete_entry(database, acc_id, data[acc_id])) for acc_id in lookup_symbol(database, query)]
+
+
+def complete_entry(database: str, accession: str, entry: dict) -> dict:
+    """
+    Returns a copy of a parsed entry which includes its sequence. Sequences are only read from the sequence file
+    when an entry is handed out, the parsed json data itself does not hold them.
+    :param str database: either 'refseq' or 'uniprot'
+    :param str accession: the accession ID of the entry
+    :param dict entry: the entry as stored in the parsed json data
+    """
+    entry = entry.copy()
+    if 'sequence' not in entry:
+        entry['sequence'] = get_sequence(database, accession)
+    return entry
+
+
+def hashed_entry(database: str, accession: str, entry: dict) -> dict:
+    """
+    Returns a copy of a parsed entry whose 'sequence' is the SequenceHash of its sequence, which is enough to compare
+    sequences and their lengths without reading the sequence text.
+    :param str database: either 'refseq' or 'uniprot'
+    :param str accession: the accession ID of the entry
+    :param dict entry: the entry as stored in the parsed json data
+    """
+    entry = entry.copy()
+    entry['sequence'] = get_sequence_hash(database, accession)
+    return entry
+
+
+# =======================================
+#   batch lookups
+# =======================================
+
+
+class EntryLookup:
+    """
+    Answers many lookups from a single pinned snapshot of the parsed data, e.g. for compare_entries_batch(). The
+    snapshots, sequence files and symbol indexes are resolved once, instead of checking the parsed files again at
+    every lookup like find_entries() does. With the SQLite backend, all lookups share one connection to the store.
+    Entries hold the SequenceHash of their sequence instead of the sequence, see hashed_entry().
+    """
+    def __init__(self):
+        self.sqlite = use_sqlite()
+        self.data, self.sequences, self.rows, self.symbol_index = {}, {}, {}, {}
+        if self.sqlite:
+            dbinspector.store.connect()
+            return
+        for database in ['refseq', 'uniprot']:
+            data = get_data(database)
+            self.data[database] = data
+            if data and 'sequence' not in next(iter(data.values())):
+                self.sequences[database] = get_sequence_file(database)
+                self.rows[database] = load_snapshot(PARSED_FILES[database]).rows
+            self.symbol_index[database] = get_symbol_index(database)
+
+    def get(self, database: str, accession: str) -> Optional[dict]:
+        """
+        Retrieves a copy of a single entry with the hash of its sequence.
+        :param str database: either 'refseq' or 'uniprot'
+        :param str accession: the accession ID of the entry
+        :return: the entry without its own accession ID, None if not found
+        """
+        if self.sqlite:
+            return dbinspector.store.get_entry(database, accession, hashed=True)
+        entry = self.data[database].get(accession)
+        if entry is None:
+            return None
+        entry = entry.copy()
+        if database in self.sequences:
+            entry['sequence'] = self.sequences[database].hash(self.rows[database][accession])
+        else:
+            entry['sequence'] = hash_sequence(entry['sequence'])
+        return entry
+
+    def find_by_symbol(self, database: str, query: str) -> List[Tuple[str, dict]]:
+        """
+        Retrieves all entries of a database which list the given gene symbol (as given or in upper case).
+        :param str database: either 'refseq' or 'uniprot'
+        :param str query: gene symbol
+        :return: list of (accession ID, entry) in the order of the parsed data
+        """
+        if self.sqlite:
+            return dbinspector.store.find_by_symbol(database, [query, query.upper()], hashed=True)
+        return [(acc, self.get(database, acc)) for acc in match_symbol(self.symbol_index[database], query)]
+
+    def find(self, refseq_id: str = None, uniprot_id: str = None, symbol: str = None) -> Dict[str, List[dict]]:
+        """
+        Retrieves all available data for a given RefSeq ID, UniProt ID, or symbol, like find_entries().
+        :return: {'RefSeq': list(dict), 'UniProt': list(dict)}, each entry with its own accession ID
+        """
+        uniprot, refseq = [], []
+        if refseq_id:
+            refseq = self._with_id('refseq', [refseq_id])
+            uniprot = self._with_id('uniprot', [entry['UniProt ID'] for entry in refseq if entry['UniProt ID']])
+        elif uniprot_id:
+            uniprot = self._with_id('uniprot', [uniprot_id])
+            refseq = self._with_id('refseq', [acc for entry in uniprot for acc in entry['RefSeq ID']])
+        elif symbol:
+            uniprot = [_keyed('uniprot', acc, entry) for acc, entry in self.find_by_symbol('uniprot', symbol)]
+            refseq = [_keyed('refseq', acc, entry) for acc, entry in self.find_by_symbol('refseq', symbol)]
+        return {'RefSeq': refseq, 'UniProt': uniprot}
+
+    def _with_id(self, database: str, accessions: List[str]) -> List[dict]:
+        """Retrieves the entries with the given accession IDs that exist."""
+        entries = [(acc, self.get(database, acc)) for acc in accessions]
+        return [_keyed(database, acc, entry) for acc, entry in entries if entry is not None]
+
+
+def _keyed(database: str, accession: str, entry: dict) -> dict:
+    """Gives back the key of an entry as well, as a list for RefSeq entries like get_refseq_entry() does."""
+    if database == 'uniprot':
+        entry['UniProt ID'] = accession
+    else:
+        entry['RefSeq ID'] = [accession]
+    return entry
+
+
 if __name__ == '__main__':
 
     print("search by uniprot id:")
@@ -0,0 +1,136 @@
+import logging
+from typing import Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# one-letter codes of the IUPAC amino acids, including B, Z, J and X for ambiguous residues, U (selenocysteine) and
+# O (pyrrolysine), plus the translation stop (*) and the gap (-), as in NCBI's extended protein alphabet (ncbieaa)
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ*-'
+# bits per residue, 8 residues are packed into 5 bytes
+BITS = 5
+
+# byte translation tables between the ASCII codes and the 5 bit codes of the residues, invalid codes are 0xFF
+_ENCODE = bytearray(b'\xff' * 256)
+for _code, _residue in enumerate(ALPHABET.encode('ascii')):
+    _ENCODE[_residue] = _code
+_ENCODE = bytes(_ENCODE)
+_INVALID = b'\xff'
+_DECODE = ALPHABET.encode('ascii') + bytes(256 - len(ALPHABET))
+
+# bit masks selecting every other field of 8, 16 and 32 bits (pack) or the packed fields of 20, 10 and 5 bits (unpack),
+# repeated for a number of 8 byte groups and only grown when a longer sequence comes along
+_PATTERNS = (b'\xff\x00' * 4, b'\xff\xff\x00\x00' * 2, b'\xff\xff\xff\xff\x00\x00\x00\x00',
+             b'\xff\xff\x0f\x00\x00\x00\x00\x00', b'\xff\x03\x00\x00' * 2, b'\x1f\x00' * 4)
+_masks: Tuple[int, Tuple[int, ...]] = (0, ())
+
+
+def _get_masks(groups: int) -> Tuple[int, ...]:
+    """Returns the bit masks for at least the given number of 8 byte groups."""
+    global _masks
+    size, masks = _masks
+    if groups > size:
+        size = max(groups, 2 * size, 1024)
+        masks = tuple(int.from_bytes(pattern * size, 'little') for pattern in _PATTERNS)
+        _masks = size, masks
+    return masks
+
+
+class PackedSequence:
+    """
+    An amino acid sequence packed into 5 bits per residue. Equality, hashing and len() work on the packed form
+    without unpacking it, str() unpacks the sequence.
+    """
+    __slots__ = ('length', 'data')
+
+    def __init__(self, length: int, data: bytes):
+        self.length = length
+        self.data = data
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PackedSequence):
+            return NotImplemented
+        # the unused bits of the last byte are always zero, so equal sequences are packed into equal bytes
+        return self.length == other.length and self.data == other.data
+
+    def __hash__(self) -> int:
+        return hash((self.length, self.data))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __str__(self) -> str:
+        return unpack_sequence(self.data, self.length)
+
+    def __repr__(self) -> str:
+        return f'PackedSequence(length={self.length})'
+
+
+def packed_size(length: int) -> int:
+    """Returns the number of bytes of a packed sequence with the given number of residues."""
+    return -(-length // 8) * BITS
+
+
+def pack_sequence(sequence: str) -> PackedSequence:
+    """
+    Packs an amino acid sequence into 5 bits per residue.
+    :param str sequence: amino acid sequence in upper case one-letter codes, see ALPHABET
+    :return: the packed sequence
+    :raises ValueError: if the sequence contains a character which is not in ALPHABET
+    """
+    codes = sequence.encode('ascii', errors='replace').translate(_ENCODE)
+    if _INVALID in codes:
+        residue = next(residue for residue in sequence if residue not in ALPHABET)
+        raise ValueError(f"{residue!r} is not a one-letter amino acid code.")
+    groups = -(-len(codes) // 8)
+    if not groups:
+        return PackedSequence(0, b'')
+    pairs, quads, octets = _get_masks(groups)[:3]
+    # every residue in a byte of its own, then merge neighbouring fields: 8 -> 16 -> 32 -> 64 bit words of 40 bits
+    words = int.from_bytes(codes, 'little')
+    words = (words & pairs) | ((words >> 8) & pairs) << 5
+    words = (words & quads) | ((words >> 16) & quads) << 10
+    words = (words & octets) | ((words >> 32) & octets) << 20
+    words = words.to_bytes(groups * 8, 'little')
+    # drop the 3 unused bytes of each word
+    data = bytearray(groups * BITS)
+    for byte in range(BITS):
+        data[byte::BITS] = words[byte::8]
+    return PackedSequence(len(codes), bytes(data))
+
+
+def pack_or_keep(sequence: str, accession: Optional[str] = None) -> Union[PackedSequence, str]:
+    """
+    Packs an amino acid sequence, see pack_sequence(). A sequence with a character which is not in ALPHABET is logged
+    and kept as it is, so that its entry is still parsed and loaded.
+    :param str sequence: amino acid sequence
+    :param str accession: the accession ID of the entry of the sequence, for the log
+    :return: the packed sequence, or the sequence itself if it cannot be packed
+    """
+    try:
+        return pack_sequence(sequence)
+    except ValueError as error:
+        logger.warning(f"The sequence of {accession or 'an entry'} is kept unpacked: {error}")
+        return sequence
+
+
+def unpack_sequence(data: bytes, length: int) -> str:
+    """
+    Unpacks an amino acid sequence, see pack_sequence().
+    :param bytes data: the packed sequence
+    :param int length: the number of residues
+    :return: the amino acid sequence
+    """
+    groups = len(data) // BITS
+    if not groups:
+        return ''
+    octets, quads, pairs = _get_masks(groups)[3:]
+    words = bytearray(groups * 8)
+    for byte in range(BITS):
+        words[byte::8] = data[byte::BITS]
+    # split the 40 bits of each word: 64 -> 32 -> 16 -> 8 bit fields, one residue per byte
+    codes = int.from_bytes(words, 'little')
+    codes = (codes & octets) | ((codes >> 20) & octets) << 32
+    codes = (codes & quads) | ((codes >> 10) & quads) << 16
+    codes = (codes & pairs) | ((codes >> 5) & pairs) << 8
+    return codes.to_bytes(groups * 8, 'little')[:length].translate(_DECODE).decode('ascii')
@@ -1,81 +1,291 @@
 import os
 import os.path as osp
-from dbinspector.startup import DATA, REFSEQ, REFSEQ_FASTA, UNIPROT
-from dbinspector.utils import read_fasta, get_ncbi, get_uniprot
+import dbinspector.startup
+from dbinspector.startup import DATA, REFSEQ_FASTA, REFSEQ_SHARDS, BACKEND, MANIFEST, MEMORY_LIMIT, setup
+from dbinspector.exceptions import InputError
+from dbinspector.utils import iter_fasta, worker_context
+from dbinspector.download import Transfer, download_files, MAX_CONNECTIONS
+from dbinspector.store import write_store, update_store, spill_records
+from dbinspector.index import add_symbols, write_symbol_index, SYMBOL_INDEX_FILES
+from dbinspector.sequences import SequenceWriter, write_sequence_file, SequenceFile, SEQUENCE_FILES, CHECKSUM_FILES
+from dbinspector.entries import EntryWriter, iter_entries, OFFSET_FILES
+from dbinspector.snapshot import PARSED_FILES
+from dbinspector.fingerprints import Fingerprints
+from dbinspector.stages import Stage, run_stages
+from dbinspector.compare import read_summary, write_summary
+from dbinspector.uniprot import UniProtRecord, iter_uniprot, iter_uniprot_parallel, UNIPROT_XML, TREMBL_XML
+from dbinspector.progress import ProgressCallback, ProgressReader, report_stage, track
 from time import time
-from tqdm import tqdm
 import logging
-from typing import Dict
+import sys
+import threading
+from typing import Optional, Dict, List, Tuple, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 import gzip
 import json
-from collections import defaultdict
-from lxml import etree
 import pandas as pd
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+NCBI_FTP = 'ftp://ftp.ncbi.nlm.nih.gov/'
 
-def parse_all() -> None:
+
+def parse_all(backend: str = BACKEND, jobs: int = 1, force: bool = False, trembl: bool = False,
+              memory_limit: int = MEMORY_LIMIT, progress: Optional[ProgressCallback] = None) -> None:
     """
     Wrapper function for parsing downloaded RefSeq and UniProt data that calls downstream functions, logs, tracks time.
-    Results stored as json files in respective cache folders.
+    Results stored as json files in respective cache folders, the sequences in a separate sequence file each.
+    Only the stages whose inputs changed since the last run are run again, see parse_stages().
+    :param str backend: 'json', or 'sqlite' to additionally write the results into the indexed SQLite store
+    :param int jobs: the number of worker processes used to parse the UniProt XML and the RefSeq FASTA files
+    :param bool force: run all stages again, even if their inputs did not change
+    :param bool trembl: also parse the unreviewed UniProt entries (TrEMBL) into the store, needs the sqlite backend
+    :param int memory_limit: approximate memory in MB for the batches of TrEMBL entries written to the store
+    :param progress: callback receiving the state of each stage and the progress of the downloads and parsers, see
+        progress.ProgressCallback; e.g. a progress.Progress polled by the web app
+    :raises InputError: if TrEMBL is to be parsed without the sqlite backend
     """
+    if trembl and backend != 'sqlite':
+        raise InputError("TrEMBL entries are only kept in the SQLite store. Parse with the sqlite backend.")
+    setup()
     # ensure downloads are available
-    download_data()
-    # UniProt:
-    parse_uniprot()
-    # RefSeq in 3 steps:
+    download_data(trembl=trembl, progress=progress)
+    fingerprints = Fingerprints()
+    if force:
+        fingerprints.clear()
+    parse_stages(fingerprints, backend, jobs, trembl, memory_limit, progress)
+    logger.info("Parsing complete.")
+
+
+def parse_stages(fingerprints: Fingerprints, backend: str = BACKEND, jobs: int = 1, trembl: bool = False,
+                 memory_limit: int = MEMORY_LIMIT, progress: Optional[ProgressCallback] = None) -> Dict[str, bool]:
+    """
+    Runs the graph of parse stages, see parse_graph(). Independent stages, e.g. UniProt and RefSeq, run at the same
+    time; a stage only runs if its input or output files changed since it last ran, so a re-run after a failure
+    resumes after the last completed stage. The wall time of each stage and the peak memory of the stages are
+    logged.
+    :param Fingerprints fingerprints: the fingerprints recorded when the stages last ran
+    :param str backend: 'json', or 'sqlite' to additionally write the results into the indexed SQLite store
+    :param int jobs: the number of worker processes used by each stage to parse the UniProt XML and the RefSeq FASTA
+        files
+    :param bool trembl: also parse the unreviewed UniProt entries (TrEMBL) into the store
+    :param int memory_limit: approximate memory in MB for the batches of TrEMBL entries written to the store
+    :param progress: callback receiving the state of each stage and the progress of the parsers
+    :return: dictionary of stage: whether it ran
+    """
+    setup()
     t0 = time()
-    # (1) map RefSeq ID -> UniProt ID
-    refseq_to_uniprot = map_refseq_to_uniprot()
-    # (2) map RefSeq ID -> gene symbol
-    refseq_to_symbol = map_refseq_to_symbol()
-    # (3) assemble with sequences
-    parse_refseq(refseq_to_uniprot, refseq_to_symbol)
+    ran = run_stages(parse_graph(fingerprints, backend, jobs, trembl, memory_limit, progress), fingerprints,
+                     progress=progress)
     totaltime = (time() - t0)
-    logger.info(f'...Finished parsing the RefSeq DB for human proteins in {totaltime:.2f} seconds.')
-    logger.info("Parsing complete.")
+    logger.info(f'...Finished {sum(ran.values())} of {len(ran)} parse stages in {totaltime:.2f} seconds.')
+    return ran
+
+
+def parse_graph(fingerprints: Fingerprints, backend: str = BACKEND, jobs: int = 1, trembl: bool = False,
+                memory_limit: int = MEMORY_LIMIT, progress: Optional[ProgressCallback] = None) -> List[Stage]:
+    """
+    Lists the parse stages and the stages each of them requires:
+    uniprot (XML -> json, sequences, symbol index), refseq shards (each changed FASTA file -> cached records),
+    refseq sequences (cached records -> sequence file), refseq join (mapping files + cached records -> json, symbol
+    index), which share the index of the cached records built by whichever of them runs first, and, with the sqlite
+    backend, store (only the entries of the changed databases are replaced) and optionally trembl (XML -> store), and
+    finally summary (all parsed data -> stored summary statistics).
+    See parse_stages() for the parameters.
+    :return: list of Stage
+    """
+    paths = refseq_fasta_paths()
+    shard_files = [filepath for path in paths for filepath in refseq_shard_files(path)]
+
+    def refseq_shards():
+        # (1) read the FASTA files that changed
+        changed = [path for path in paths if fingerprints.changed(f'refseq shard {osp.basename(path)}', [path],
+                                                                  refseq_shard_files(path))]
+        cache_refseq_shards(changed, jobs, progress=progress)
+        for path in changed:
+            fingerprints.record(f'refseq shard {osp.basename(path)}', [path], refseq_shard_files(path))
+        logger.info(f"{len(changed)} of {len(paths)} RefSeq FASTA files changed and were read.")
+
+    refseq_rows, rows_lock = [], threading.Lock()
+
+    def refseq_index():
+        # shared by the RefSeq sequences and join stages, which run at the same time
+        with rows_lock:
+            if not refseq_rows:
+                refseq_rows.append(index_refseq_shards(paths))
+            return refseq_rows[0]
+
+    def store():
+        databases = [database for database in ['uniprot', 'refseq']
+                     if fingerprints.changed(f'store {database}', parsed_files(database), [])]
+        if not osp.exists(dbinspector.startup.SQLITE):
+            write_store(iter_parsed('uniprot'), iter_parsed('refseq'))
+            databases = ['uniprot', 'refseq']
+            # a rewritten store does not hold the TrEMBL entries anymore
+            fingerprints.forget('trembl')
+        else:
+            for database in databases:
+                update_store(database, iter_parsed(database))
+        for database in databases:
+            fingerprints.record(f'store {database}', parsed_files(database), [])
+        return bool(databases)
+
+    def summary():
+        # the stored summary holds the fingerprints of the parsed data it was computed from
+        if read_summary(backend) is not None:
+            logger.info("The parsed data is unchanged, keeping the stored summary statistics.")
+            return False
+        write_summary(backend)
+        return True
+
+    stages = [Stage('uniprot', partial(parse_uniprot, jobs, progress), inputs=[UNIPROT_XML],
+                    outputs=parsed_files('uniprot')),
+              # RefSeq in 3 steps:
+              Stage('refseq shards', refseq_shards, inputs=paths, outputs=shard_files),
+              # (2) assemble the sequences of all FASTA files
+              Stage('refseq sequences', lambda: write_refseq_sequences(refseq_index()),
+                    requires=('refseq shards',), inputs=shard_files,
+                    outputs=[*SEQUENCE_FILES['refseq'], CHECKSUM_FILES['refseq']]),
+              # (3) map RefSeq ID -> UniProt ID, gene symbol
+              Stage('refseq join', lambda: join_refseq(refseq_index(), map_refseq_to_uniprot(progress),
+                                                       map_refseq_to_symbol()),
+                    requires=('refseq shards',),
+                    inputs=[osp.join(DATA, 'gene_refseq_uniprotkb_collab.gz'), osp.join(DATA, 'LRG_RefSeqGene'),
+                            *shard_files],
+                    outputs=[PARSED_FILES['refseq'], OFFSET_FILES['refseq'], SYMBOL_INDEX_FILES['refseq']])]
+    if backend == 'sqlite':
+        stages.append(Stage('store', store, requires=('uniprot', 'refseq sequences', 'refseq join')))
+        if trembl:
+            stages.append(Stage('trembl', partial(parse_trembl, jobs, memory_limit, progress), requires=('store',),
+                                inputs=[TREMBL_XML], outputs=[]))
+    stages.append(Stage('summary', summary, requires=tuple(stage.name for stage in stages)))
+    return stages
+
+
+def parsed_files(database: str) -> List[str]:
+    """Returns the filepaths of the parsed data of a database: json, offset, sequence, checksum and symbol index
+    files."""
+    return [PARSED_FILES[database], OFFSET_FILES[database], *SEQUENCE_FILES[database], CHECKSUM_FILES[database],
+            SYMBOL_INDEX_FILES[database]]
 
 
-def download_data():
+def iter_parsed(database: str) -> Iterator[Tuple[str, dict]]:
     """
-    Downloads database data if not already there.
+    Streams the parsed data of a database back, with the sequences, e.g. to write it into the SQLite store.
+    Only one entry is held in memory at a time.
+    :param str database: either 'refseq' or 'uniprot'
+    :return: iterator of (accession ID, {entry info}) in the order of the parsed data
     """
+    sequences = SequenceFile(*SEQUENCE_FILES[database], CHECKSUM_FILES[database])
+    for row, (acc, entry) in enumerate(iter_entries(PARSED_FILES[database])):
+        entry['sequence'] = sequences.get(row)
+        yield acc, entry
+
+
+def download_data(max_connections: int = MAX_CONNECTIONS, trembl: bool = False,
+                  progress: Optional[ProgressCallback] = None) -> None:
+    """
+    Downloads database data if not already there. The files are transferred concurrently, partial files of an
+    interrupted download are resumed.
+    :param int max_connections: the maximum number of files transferred at the same time
+    :param bool trembl: also download the unreviewed UniProt entries (TrEMBL)
+    :param progress: callback receiving the state of the 'download' stage and the bytes downloaded of each file
+    """
+    setup()
+    refseq_transfers, uniprot_transfers = data_transfers()
+    transfers = []
     # download necessary data via FTP
     if not (osp.exists(osp.join(DATA, "LRG_RefSeqGene"))
             and osp.exists(osp.join(DATA, "gene_refseq_uniprotkb_collab.gz"))):
         message = "Downloading the RefSeq data... this may take a few minutes."
         logger.info(message)
         print(message)
-        get_ncbi('https://ftp.ncbi.nlm.nih.gov/gene/DATA/gene_refseq_uniprotkb_collab.gz', DATA)
-        get_ncbi('https://ftp.ncbi.nlm.nih.gov/refseq/H_sapiens/RefSeqGene/LRG_RefSeqGene', DATA)
-        for i in range(1, 9):
-            get_ncbi(f'https://ftp.ncbi.nlm.nih.gov/refseq/H_sapiens/mRNA_Prot/human.{i}.protein.faa.gz', REFSEQ_FASTA)
+        transfers.extend(refseq_transfers)
     if not osp.exists(osp.join(DATA, "uniprot_sprot_human.xml.gz")):
         message = "Downloading the UniProt data... this may take a few minutes."
         logger.info(message)
         print(message)
-        filename = 'uniprot_sprot_human.xml.gz'
-        get_uniprot('ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/taxonomic_divisions/'
-                    + filename, DATA)
+        transfers.extend(uniprot_transfers)
+    if trembl and not osp.exists(TREMBL_XML):
+        message = "Downloading the TrEMBL data... this may take a while."
+        logger.info(message)
+        print(message)
+        transfers.append(trembl_transfer())
+    if not transfers:
+        report_stage(progress, 'download', 'skipped')
+        return
+    report_stage(progress, 'download', 'running')
+    try:
+        reports = download_files(transfers, max_connections, manifest_path=MANIFEST, progress=progress)
+    except Exception:
+        report_stage(progress, 'download', 'failed')
+        raise
+    total_bytes = sum(report['bytes'] for report in reports)
+    logger.info(f"Downloaded {len(reports)} files ({total_bytes / 1e6:.1f} MB).")
+    report_stage(progress, 'download', 'done')
+
+
+def refresh_data(max_connections: int = MAX_CONNECTIONS, trembl: bool = False,
+                 progress: Optional[ProgressCallback] = None) -> List[Dict[str, object]]:
+    """
+    Downloads only those database files which changed upstream since they were last downloaded, according to the
+    remote size and modification time recorded in the download manifest, and verifies them.
+    :param int max_connections: the maximum number of files transferred at the same time
+    :param bool trembl: also refresh the unreviewed UniProt entries (TrEMBL)
+    :param progress: callback receiving the bytes downloaded of each file
+    :return: one report per file, see download.refresh()
+    """
+    setup()
+    refseq_transfers, uniprot_transfers = data_transfers()
+    transfers = refseq_transfers + uniprot_transfers + ([trembl_transfer()] if trembl else [])
+    reports = download_files(transfers, max_connections, manifest_path=MANIFEST, progress=progress)
+    downloaded = [report for report in reports if not report['skipped']]
+    logger.info(f"Refreshed the downloaded data: {len(downloaded)} of {len(reports)} files changed upstream "
+                f"({sum(report['bytes'] for report in downloaded) / 1e6:.1f} MB downloaded).")
+    return reports
 
 
-def map_refseq_to_uniprot() -> Dict[str, str]:
+def data_transfers() -> Tuple[List[Transfer], List[Transfer]]:
+    """
+    Lists the files to be downloaded from RefSeq and UniProt.
+    :return: the RefSeq transfers, the UniProt transfers
+    """
+    refseq_transfers = [Transfer(NCBI_FTP + 'gene/DATA/gene_refseq_uniprotkb_collab.gz', DATA),
+                        Transfer(NCBI_FTP + 'refseq/H_sapiens/RefSeqGene/LRG_RefSeqGene', DATA)]
+    for i in range(1, 9):
+        refseq_transfers.append(Transfer(NCBI_FTP + f'refseq/H_sapiens/mRNA_Prot/human.{i}.protein.faa.gz',
+                                         REFSEQ_FASTA, NCBI_FTP + 'refseq/H_sapiens/mRNA_Prot/md5checksums.txt'))
+    filename = 'uniprot_sprot_human.xml.gz'
+    uniprot_transfers = [Transfer('ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/'
+                                  'taxonomic_divisions/' + filename, DATA)]
+    return refseq_transfers, uniprot_transfers
+
+
+def trembl_transfer() -> Transfer:
+    """Returns the transfer of the unreviewed UniProt entries (TrEMBL), which are only downloaded on request."""
+    return Transfer('ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/taxonomic_divisions/'
+                    + osp.basename(TREMBL_XML), DATA)
+
+
+def map_refseq_to_uniprot(progress: Optional[ProgressCallback] = None) -> Dict[str, str]:
     """
     Reads the RefSeq_UniProt_collab file and maps RefSeq IDs to UniProt IDs.
+    :param progress: callback receiving the number of lines read
     :return: dictionary of refseq: uniprot
     """
     ref_up_mapping = {}
     with gzip.open(osp.join(DATA, 'gene_refseq_uniprotkb_collab.gz'), 'rt') as filehandle:
         next(filehandle)  # skip header
-        for line in tqdm(filehandle, desc='map RefSeq -> UniProt', leave=False):
+        for line in track(filehandle, 'map RefSeq -> UniProt', progress, unit='lines', every=100000):
             ref, up = line.split()
             # read in only relevant identifiers (approved proteins)
             if "NP_" in ref:
-                ref_up_mapping[ref] = up
+                # UniProt IDs are listed for several RefSeq IDs and held once
+                ref_up_mapping[ref] = sys.intern(up)
     return ref_up_mapping
 
 
@@ -89,72 +299,210 @@ def map_refseq_to_symbol() -> Dict[str, str]:
     return prot2symbol
 
 
-def parse_uniprot() -> dict:
+def parse_uniprot(jobs: int = 1, progress: Optional[ProgressCallback] = None) -> int:
     """
-    Process UniProt download into one dictionary as a return and to be saved as json.
-    :return: dictionary of uniprot_id: {entry info}
+    Process UniProt download into the parsed json file, the sequence file and the symbol index. Each entry is written
+    as soon as it is parsed, so that memory use does not grow with the number of entries, apart from the symbol index.
+    Written entries are final, so of an accession ID listed more than once, the first entry is kept.
+    :param int jobs: the number of worker processes parsing the XML, the result is the same for any number
+    :param progress: callback receiving the bytes of the XML file read and the number of entries parsed
+    :return: the number of entries parsed
     """
-    t0, count = time(), 0
-    namespace = '{http://uniprot.org/uniprot}'
-    data = defaultdict(lambda: {'symbol': [],
-                                'RefSeq ID': [],
-                                'sequence': None})
+    t0 = time()
+    # inverted symbol index, with primary or synonym symbol type
+    index, seen = {}, set()
     logger.info("Begin processing the human UniProt data ...")
 
-    with gzip.open(osp.join(DATA, 'uniprot_sprot_human.xml.gz'), 'rb') as f:
-        for event, elem in tqdm(etree.iterparse(f, events=("start", "end")), desc='parsing UniProt', leave=False):
-            if elem.tag == namespace + 'accession':
-                acc = elem.text
-            if elem.tag == namespace + 'gene':
-                for record in elem.findall(namespace + 'name'):
-                    if record.get('type') == 'primary' or record.get('type') == 'synonym':
-                        if record.text not in data[acc]['symbol']:
-                            data[acc]['symbol'].append(record.text)
-            if elem.tag == namespace + 'dbReference':
-                if elem.attrib['type'] == 'RefSeq' and elem.attrib['id'] not in data[acc]['RefSeq ID']:
-                    data[acc]['RefSeq ID'].append(elem.attrib['id'])
-            if elem.tag == namespace + 'sequence':
-                data[acc]['sequence'] = elem.text
-            # delete parts of the tree to save memory
-            while elem.getprevious() is not None:
-                del elem.getparent()[0]  # clean up preceding siblings
-
-    with open(osp.join(UNIPROT, f'uniprot.json'), 'w') as filehandle:
-        json.dump(data, filehandle)
+    records = read_uniprot_xml(UNIPROT_XML, jobs, progress)
+    blob_path, index_path = SEQUENCE_FILES['uniprot']
+    with EntryWriter(PARSED_FILES['uniprot'], OFFSET_FILES['uniprot']) as entries, \
+            SequenceWriter(blob_path, index_path, CHECKSUM_FILES['uniprot']) as sequences:
+        for record in track(records, 'parsing UniProt', progress):
+            if record.accession in seen:
+                logger.warning(f"The UniProt entry {record.accession} is listed twice, keeping the first one.")
+                continue
+            seen.add(record.accession)
+            entries.add(record.accession, {'symbol': record.symbols, 'RefSeq ID': record.refseq_ids})
+            # CRC64 checksums of the sequences as given by UniProt
+            sequences.add(record.sequence, record.checksum, record.accession)
+            add_symbols(index, record.accession, record.symbols, record.symbol_types)
+        # the sequence file is moved in place before the json file it belongs to
+        residues = sequences.close()
+        count = entries.close()
+    logger.info(f"Wrote {count} uniprot sequences ({residues} residues) to {blob_path}.")
+    write_symbol_index('uniprot', index)
     totaltime = (time() - t0)
-    logger.info(f'...Finished parsing the UniProt DB for human proteins in {totaltime:.2f} seconds.')
-    return data
+    logger.info(f'...Finished parsing {count} entries of the UniProt DB for human proteins in {totaltime:.2f} seconds.')
+    return count
+
+
+def parse_trembl(jobs: int = 1, memory_limit: int = MEMORY_LIMIT, progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Parses the unreviewed UniProt entries (TrEMBL) into the SQLite store. TrEMBL is too large to be held in memory, so
+    the entries are written to the store in batches as they are parsed. They are looked up together with the reviewed
+    entries by the sqlite backend.
+    :param int jobs: the number of worker processes parsing the XML
+    :param int memory_limit: approximate memory in MB for a batch of entries
+    :param progress: callback receiving the bytes of the XML file read and the number of entries parsed
+    :return: the number of entries parsed
+    """
+    t0 = time()
+    logger.info("Begin processing the human TrEMBL data ...")
+    records = read_uniprot_xml(TREMBL_XML, jobs, progress)
+    count = spill_records('trembl', track(records, 'parsing TrEMBL', progress), memory_limit)
+    logger.info(f'...Finished parsing {count} TrEMBL entries for human proteins in {time() - t0:.2f} seconds.')
+    return count
+
+
+def read_uniprot_xml(path: str, jobs: int = 1, progress: Optional[ProgressCallback] = None) -> Iterator[UniProtRecord]:
+    """
+    Streams the entries of a gzipped UniProt XML file, see iter_uniprot() and iter_uniprot_parallel(), and reports the
+    bytes of the file read so far.
+    :param str path: the filepath of the gzipped XML file
+    :param int jobs: the number of worker processes parsing the XML
+    :param progress: callback receiving the bytes of the file read
+    :return: iterator of UniProtRecord, one per entry, in the order of the file
+    """
+    with open(path, 'rb') as filehandle:
+        compressed = ProgressReader(filehandle, f'reading {osp.basename(path)}', osp.getsize(path), progress)
+        if jobs > 1:
+            yield from iter_uniprot_parallel(compressed, jobs)
+        else:
+            with gzip.open(compressed, 'rb') as xml:
+                yield from iter_uniprot(xml)
+
+
+def refseq_fasta_paths() -> List[str]:
+    """Returns the filepaths of the downloaded RefSeq FASTA files, in a fixed order."""
+    return [osp.join(REFSEQ_FASTA, filename) for filename in sorted(os.listdir(REFSEQ_FASTA))
+            if filename.endswith('.gz')]
+
+
+def refseq_shard_files(path: str, cache_dir: str = REFSEQ_SHARDS) -> Tuple[str, str, str, str]:
+    """
+    Returns the filepaths of the cached records of a RefSeq FASTA file.
+    :param str path: the filepath of the gzipped FASTA file
+    :param str cache_dir: the directory of the cached records
+    :return: (RefSeq IDs json, sequence file, sequence index file, checksum file)
+    """
+    name = osp.join(cache_dir, osp.basename(path))
+    return name + '.json', name + '.seq', name + '.seqidx', name + '.seqsum'
+
+
+def cache_refseq_shard(path: str, cache_dir: str = REFSEQ_SHARDS) -> str:
+    """
+    Reads one RefSeq FASTA file and caches its records: the RefSeq IDs as json, the sequences and their checksums in a
+    sequence file. Run by the worker processes of cache_refseq_shards().
+    :param str path: the filepath of the gzipped FASTA file
+    :param str cache_dir: the directory of the cached records
+    :return: the filepath of the FASTA file
+    """
+    ids_path, blob_path, index_path, checksum_path = refseq_shard_files(path, cache_dir)
+    ids = []
+
+    def sequences():
+        for rsid, seq in iter_fasta(path):
+            ids.append(rsid)
+            yield seq, None, rsid
+
+    write_sequence_file(sequences(), blob_path, index_path, checksum_path)
+    with open(ids_path + '.tmp', 'w') as filehandle:
+        json.dump(ids, filehandle)
+    os.replace(ids_path + '.tmp', ids_path)
+    return path
+
+
+def cache_refseq_shards(paths: List[str], jobs: int = 1, cache_dir: str = REFSEQ_SHARDS,
+                        progress: Optional[ProgressCallback] = None) -> None:
+    """
+    Reads several RefSeq FASTA files and caches their records, see cache_refseq_shard(). With more than one job, the
+    files are read in parallel by worker processes, which also compute the checksums of the sequences.
+    :param list paths: the filepaths of the gzipped FASTA files
+    :param int jobs: the number of worker processes
+    :param str cache_dir: the directory of the cached records
+    :param progress: callback receiving the number of files read
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        for path in track(paths, 'parsing RefSeq', progress, len(paths), unit='files', every=1):
+            cache_refseq_shard(path, cache_dir)
+        return
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths)), mp_context=worker_context()) as executor:
+        for _ in track(executor.map(cache_refseq_shard, paths, [cache_dir] * len(paths)), 'parsing RefSeq', progress,
+                       len(paths), unit='files', every=1):
+            pass
+
+
+def index_refseq_shards(paths: List[str], cache_dir: str = REFSEQ_SHARDS) -> Dict[str, Tuple[SequenceFile, int]]:
+    """
+    Indexes the cached records of several RefSeq FASTA files in the order of the given paths. If a RefSeq ID occurs
+    more than once, it keeps the position of its first and the sequence of its last occurrence.
+    :param list paths: the filepaths of the gzipped FASTA files
+    :param str cache_dir: the directory of the cached records
+    :return: dictionary of RefSeq ID: (sequence file of the FASTA file, row in the sequence file)
+    """
+    rows = {}
+    for path in paths:
+        ids_path, blob_path, index_path, checksum_path = refseq_shard_files(path, cache_dir)
+        with open(ids_path) as filehandle:
+            ids = json.load(filehandle)
+        sequences = SequenceFile(blob_path, index_path, checksum_path)
+        for row, rsid in enumerate(ids):
+            rows[rsid] = (sequences, row)
+    return rows
+
+
+def write_refseq_sequences(rows: Dict[str, Tuple[SequenceFile, int]]) -> None:
+    """
+    Writes the sequence file of RefSeq from the cached records, in the order of the parsed json file.
+    The packed sequences and the checksums computed when the FASTA files were read are copied as they are.
+    :param dict rows: dictionary of RefSeq ID: (sequence file, row), see index_refseq_shards()
+    """
+    blob_path, index_path = SEQUENCE_FILES['refseq']
+    with SequenceWriter(blob_path, index_path, CHECKSUM_FILES['refseq']) as writer:
+        for sequences, row in rows.values():
+            writer.add_packed(sequences.packed_sequence(row), sequences.hash(row))
+        residues = writer.close()
+    logger.info(f"Wrote {len(rows)} refseq sequences ({residues} residues) to {blob_path}.")
+
+
+def join_refseq(rows: Dict[str, Tuple[SequenceFile, int]], refseq_to_uniprot: Dict[str, str],
+                refseq_to_symbol: Dict[str, str]) -> int:
+    """
+    Assigns the UniProt ID and gene symbol to each RefSeq entry and writes the entries to the json file, without
+    sequences, as they are joined, followed by the symbol index.
+    :param dict rows: dictionary of RefSeq ID: (sequence file, row), see index_refseq_shards()
+    :param dict refseq_to_uniprot: dictionary of refseq: uniprot
+    :param dict refseq_to_symbol: a dictionary of protein accessions.version : gene symbol
+    :return: the number of entries written
+    """
+    index = {}
+    with EntryWriter(PARSED_FILES['refseq'], OFFSET_FILES['refseq']) as entries:
+        for rsid in rows:
+            # RefSeq ID -> corresp. UniProt ID (1), symbol (2)
+            symbols = refseq_to_symbol.get(rsid, [])
+            entries.add(rsid, {'symbol': symbols, 'UniProt ID': refseq_to_uniprot.get(rsid.split('.')[0])})
+            add_symbols(index, rsid, symbols)
+        count = entries.close()
+    write_symbol_index('refseq', index)
+    return count
 
 
-def parse_refseq(refseq_to_uniprot: Dict[str, str], refseq_to_symbol: Dict[str, str]) -> dict:
+def parse_refseq(refseq_to_uniprot: Dict[str, str], refseq_to_symbol: Dict[str, str], jobs: int = 1) -> int:
     """
-    Final step in processing  RefSeq download into one dictionary as a return and to be saved as json
+    Final step in processing  RefSeq download into the parsed json file, the sequence file and the symbol index.
+    Reads all FASTA files, regardless of whether they changed.
     :param dict refseq_to_uniprot: dictionary of refseq: uniprot
     :param dict refseq_to_symbol: a dictionary of protein accessions.version : gene symbol
-    :return: dictionary of uniprot_id: {entry info}
+    :param int jobs: the number of worker processes reading the FASTA files, the result is the same for any number
+    :return: the number of entries parsed
     """
     logger.info("Attempting to begin processing the human RefSeq data...")
-    data = defaultdict(lambda: {'symbol': [],
-                                'UniProt ID': None,
-                                'sequence': None})
-    # process RefSeq sequences fasta file by fasta file
-    for count, filename in enumerate(tqdm(os.listdir(REFSEQ_FASTA), desc='parsing RefSeq', leave=False)):
-        if '.gz' not in filename:
-            continue
-        refseq_to_seq = read_fasta(osp.join(REFSEQ_FASTA, filename))  # (3) map RefSeq ID -> sequence
-
-        # process the entries one by one
-        for rsid, seq in refseq_to_seq.items():
-            # RefSeq ID -> corresp. UniProt ID (1), symbol (2), sequence (3)
-            data[rsid]['sequence'] = seq
-            if rsid in refseq_to_symbol:
-                data[rsid]['symbol'] = refseq_to_symbol[rsid]
-            if rsid.split('.')[0] in refseq_to_uniprot:
-                data[rsid]['UniProt ID'] = refseq_to_uniprot[rsid.split('.')[0]]
-
-    with open(os.path.join(REFSEQ, f'refseq.json'), 'w') as filehandle:
-        json.dump(data, filehandle)
-    return data
+    paths = refseq_fasta_paths()
+    # (3) map RefSeq ID -> sequence
+    cache_refseq_shards(paths, jobs)
+    rows = index_refseq_shards(paths)
+    write_refseq_sequences(rows)
+    return join_refseq(rows, refseq_to_uniprot, refseq_to_symbol)
 
 
 if __name__ == '__main__':
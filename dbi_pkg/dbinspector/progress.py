@@ -0,0 +1,117 @@
+import logging
+import threading
+from time import time
+from typing import Optional, Callable, Dict, Iterable, Iterator, BinaryIO
+
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# a progress callback receives events of two kinds:
+# stages: {'stage': name, 'state': 'running' | 'done' | 'skipped' | 'failed' | 'not run'}
+# tasks: {'task': name, 'done': amount, 'total': amount or None, 'unit': 'bytes' | 'entries' | 'files'}
+ProgressCallback = Callable[[Dict[str, object]], None]
+
+# entries between two reports of track()
+REPORT_EVERY = 1000
+# bytes between two reports of ProgressReader
+REPORT_BYTES = 1024 * 1024
+
+
+def report_stage(progress: Optional[ProgressCallback], stage: str, state: str) -> None:
+    """Reports the state of a stage to the progress callback, if there is one."""
+    if progress is not None:
+        progress({'stage': stage, 'state': state})
+
+
+def report_task(progress: Optional[ProgressCallback], task: str, done: int, total: Optional[int] = None,
+                unit: str = 'bytes') -> None:
+    """Reports how much of a task is done to the progress callback, if there is one."""
+    if progress is not None:
+        progress({'task': task, 'done': done, 'total': total, 'unit': unit})
+
+
+def track(iterable: Iterable, task: str, progress: Optional[ProgressCallback] = None, total: Optional[int] = None,
+          unit: str = 'entries', every: int = REPORT_EVERY) -> Iterator:
+    """
+    Iterates with a progress bar in the terminal and reports the number of items done to the progress callback every
+    so many items, and once the iterable is exhausted.
+    :param iterable: the items
+    :param str task: the name of the task, also shown as description of the progress bar
+    :param progress: the progress callback, see ProgressCallback
+    :param int total: the number of items, if known
+    :param str unit: the unit of the items
+    :param int every: the number of items between two reports
+    :return: iterator of the items
+    """
+    done = 0
+    for done, item in enumerate(tqdm(iterable, desc=task, total=total, leave=False), 1):
+        yield item
+        if done % every == 0:
+            report_task(progress, task, done, total, unit)
+    report_task(progress, task, done, total, unit)
+
+
+class ProgressReader:
+    """
+    A binary file which reports the number of bytes read from it to the progress callback, e.g. of a compressed
+    database file that is decompressed and parsed as it is read.
+    """
+    def __init__(self, filehandle: BinaryIO, task: str, total: Optional[int] = None,
+                 progress: Optional[ProgressCallback] = None):
+        self.filehandle = filehandle
+        self.task = task
+        self.total = total
+        self.progress = progress
+        self.done = 0
+        self._reported = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.filehandle.read(size)
+        self.done += len(chunk)
+        if not chunk or self.done - self._reported >= REPORT_BYTES:
+            self._reported = self.done
+            report_task(self.progress, self.task, self.done, self.total)
+        return chunk
+
+    def __getattr__(self, name):
+        return getattr(self.filehandle, name)
+
+
+class Progress:
+    """
+    A progress callback which keeps the latest state of each stage and task, to be polled from another thread, e.g.
+    by the status route of the web app while the databases are parsed in the background.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.tasks = {}
+        self.updated = time()
+
+    def __call__(self, event: Dict[str, object]) -> None:
+        with self._lock:
+            if 'stage' in event:
+                self.stages[event['stage']] = event['state']
+            else:
+                self.tasks[event['task']] = {key: event[key] for key in ('done', 'total', 'unit')}
+            self.updated = time()
+
+    def status(self) -> Dict[str, object]:
+        """
+        :return: json serializable dictionary with the 'stages' (name: state), the 'tasks' (name: {'done', 'total',
+            'unit'}) and the time of the last event ('updated')
+        """
+        with self._lock:
+            return {'stages': dict(self.stages), 'tasks': {task: dict(info) for task, info in self.tasks.items()},
+                    'updated': self.updated}
+
+    @classmethod
+    def from_status(cls, status: Dict[str, object]) -> 'Progress':
+        """Returns the progress as reported by status()."""
+        progress = cls()
+        progress.stages = dict(status['stages'])
+        progress.tasks = {task: dict(info) for task, info in status['tasks'].items()}
+        progress.updated = status['updated']
+        return progress
@@ -0,0 +1,109 @@
+import sys
+import logging
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Union
+
+from dbinspector.packed import PackedSequence, pack_or_keep
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# value of the slots of the keys an entry does not have, e.g. the 'sequence' of entries parsed with a sequence file
+_MISSING = object()
+
+
+class Entry(Mapping):
+    """
+    A parsed entry as held in memory by the snapshots: slots instead of a dictionary per entry, tuples instead of
+    lists, interned accession IDs and symbols, which are shared by all entries listing them, and sequences packed
+    into 5 bits per residue, see packed.PackedSequence. It reads like the dictionary of the entry, lists and
+    sequences are returned as new lists and strings, and copy() converts it into that dictionary, which is what the
+    lookups hand out.
+    """
+    __slots__ = ()
+    # key in the dictionary of the entry: slot
+    FIELDS: Dict[str, str] = {}
+
+    def __init__(self, entry: Dict[str, object], accession: Optional[str] = None):
+        for key, slot in self.FIELDS.items():
+            value = entry.get(key, _MISSING)
+            if type(value) is list:
+                value = tuple(map(sys.intern, value))
+            elif type(value) is str:
+                # sequences with other characters than amino acid codes are kept as they are
+                value = pack_or_keep(value, accession) if key == 'sequence' else sys.intern(value)
+            setattr(self, slot, value)
+
+    def __getitem__(self, key: str) -> Union[str, List[str], None]:
+        slot = self.FIELDS.get(key)
+        value = _MISSING if slot is None else getattr(self, slot)
+        if value is _MISSING:
+            raise KeyError(key)
+        return _unpack(value)
+
+    def __contains__(self, key: object) -> bool:
+        slot = self.FIELDS.get(key)
+        return slot is not None and getattr(self, slot) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key, slot in self.FIELDS.items() if getattr(self, slot) is not _MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def copy(self) -> Dict[str, object]:
+        """Returns the dictionary of the entry."""
+        entry = {}
+        for key, slot in self.FIELDS.items():
+            value = getattr(self, slot)
+            if value is not _MISSING:
+                entry[key] = _unpack(value)
+        return entry
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.copy()!r})'
+
+
+def _unpack(value: object) -> object:
+    """Returns the value of a slot as the value in the dictionary of the entry."""
+    if type(value) is tuple:
+        return list(value)
+    if type(value) is PackedSequence:
+        return str(value)
+    return value
+
+
+class UniProtEntry(Entry):
+    """{'symbol': list, 'RefSeq ID': list, 'sequence': str (only without a sequence file)}"""
+    __slots__ = ('symbols', 'refseq_ids', 'sequence')
+    FIELDS = {'symbol': 'symbols', 'RefSeq ID': 'refseq_ids', 'sequence': 'sequence'}
+
+
+class RefSeqEntry(Entry):
+    """{'symbol': list, 'UniProt ID': str or None, 'sequence': str (only without a sequence file)}"""
+    __slots__ = ('symbols', 'uniprot_id', 'sequence')
+    FIELDS = {'symbol': 'symbols', 'UniProt ID': 'uniprot_id', 'sequence': 'sequence'}
+
+
+def compact_entry(entry: Dict[str, object], accession: Optional[str] = None) -> Union[Entry, Dict[str, object]]:
+    """
+    Converts the dictionary of a parsed entry into its record, see Entry.
+    :param dict entry: the entry info
+    :param str accession: the accession ID of the entry, for the log of sequences which cannot be packed
+    :return: UniProtEntry or RefSeqEntry, the dictionary itself if it is neither
+    """
+    record_type = UniProtEntry if 'RefSeq ID' in entry else RefSeqEntry if 'UniProt ID' in entry else None
+    if record_type is None or not entry.keys() <= record_type.FIELDS.keys():
+        return entry
+    return record_type(entry, accession)
+
+
+def compact_index(index: Dict[str, List[list]]) -> Dict[str, List[tuple]]:
+    """
+    Converts the postings of an inverted symbol index, [accession ID, symbol, symbol type], into tuples of interned
+    strings, see index.build_symbol_index().
+    :param dict index: dictionary of upper case symbol: list of postings
+    :return: dictionary of upper case symbol: list of posting tuples
+    """
+    return {sys.intern(symbol): [tuple(map(sys.intern, posting)) for posting in postings]
+            for symbol, postings in index.items()}
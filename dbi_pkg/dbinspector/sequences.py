@@ -0,0 +1,326 @@
+import os
+import os.path as osp
+from dbinspector.startup import REFSEQ, UNIPROT
+from dbinspector.snapshot import PARSED_FILES, MappedEntries, load_snapshot
+from dbinspector.packed import PackedSequence, pack_or_keep, unpack_sequence, packed_size
+import logging
+from array import array
+from typing import Optional, Dict, Iterable, Tuple, Union
+
+import hashlib
+import mmap
+import struct
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# amino acid sequences of all entries in one contiguous file + (offset, length) of each entry
+SEQUENCE_FILES = {'refseq': (osp.join(REFSEQ, 'refseq.seq'), osp.join(REFSEQ, 'refseq.seqidx')),
+                  'uniprot': (osp.join(UNIPROT, 'uniprot.seq'), osp.join(UNIPROT, 'uniprot.seqidx'))}
+# CRC64 and digest of each sequence, in the same order
+CHECKSUM_FILES = {'refseq': osp.join(REFSEQ, 'refseq.seqsum'),
+                  'uniprot': osp.join(UNIPROT, 'uniprot.seqsum')}
+CHECKSUM_RECORD = struct.Struct('>Q16s')
+# start of sequence files whose sequences are packed into 5 bits per residue, see packed.pack_sequence(), files
+# without it hold the sequences as ASCII text
+PACKED_HEADER = b'DBISEQ5\n'
+
+
+def _crc64_table() -> list:
+    """Lookup table of the CRC-64 (ISO 3309 polynomial) that UniProt uses as sequence checksum."""
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xD800000000000000 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC64_TABLE = _crc64_table()
+
+
+def crc64(sequence: str) -> str:
+    """
+    Computes the CRC64 checksum of a sequence in the same way as UniProt does for the checksum attribute of its
+    sequence elements.
+    :param str sequence: amino acid sequence
+    :return: checksum as 16 hexadecimal digits
+    """
+    crc, table = 0, CRC64_TABLE
+    for byte in sequence.encode('ascii'):
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return f'{crc:016X}'
+
+
+def sequence_digest(sequence: str) -> bytes:
+    """Computes a 128 bit BLAKE2 digest of a sequence, which rules out CRC64 collisions."""
+    return hashlib.blake2b(sequence.encode('ascii'), digest_size=16).digest()
+
+
+class SequenceHash:
+    """
+    Stands in for a sequence in comparisons without holding the sequence text: two sequences are equal if their
+    lengths, CRC64 checksums and digests are equal. len() and truth value behave like those of the sequence.
+    """
+    __slots__ = ('length', 'crc64', 'digest')
+
+    def __init__(self, length: int, crc64: str, digest: bytes):
+        self.length = length
+        self.crc64 = crc64
+        self.digest = digest
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SequenceHash):
+            return NotImplemented
+        return (self.length, self.crc64, self.digest) == (other.length, other.crc64, other.digest)
+
+    def __hash__(self) -> int:
+        return hash((self.length, self.crc64, self.digest))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return f'SequenceHash(length={self.length}, crc64={self.crc64})'
+
+
+def hash_sequence(sequence: Optional[str], checksum: Optional[str] = None) -> Optional[SequenceHash]:
+    """
+    Computes the hash of a sequence.
+    :param str sequence: amino acid sequence, or None
+    :param str checksum: the CRC64 checksum, if already known (e.g. from UniProt)
+    :return: the hash of the sequence, None if there is no sequence
+    """
+    if sequence is None:
+        return None
+    return SequenceHash(len(sequence), checksum or crc64(sequence), sequence_digest(sequence))
+
+
+class SequenceFile:
+    """
+    Read-only, memory-mapped view of the sequence file of a database. The index holds the offset of each sequence in
+    the file and its number of residues (-1 for entries without sequence). A sequence which cannot be packed is
+    stored as ASCII text, which is marked by the bitwise complement of its offset (~offset, which is negative).
+    """
+    def __init__(self, blob_path: str, index_path: str, checksum_path: Optional[str] = None):
+        self.index = array('q')
+        with open(index_path, 'rb') as filehandle:
+            self.index.frombytes(filehandle.read())
+        with open(blob_path, 'rb') as filehandle:
+            if osp.getsize(blob_path):
+                self.blob = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.blob = b''  # an empty file cannot be mapped
+        self.packed = self.blob[:len(PACKED_HEADER)] == PACKED_HEADER
+        self.checksums = None
+        if checksum_path and osp.exists(checksum_path):
+            with open(checksum_path, 'rb') as filehandle:
+                self.checksums = filehandle.read()
+
+    def __len__(self) -> int:
+        return len(self.index) // 2
+
+    def length(self, row: int) -> Optional[int]:
+        """Returns the length of the sequence of the entry in the given row, None if the entry has no sequence."""
+        length = self.index[2 * row + 1]
+        return None if length < 0 else length
+
+    def packed_sequence(self, row: int) -> Union[PackedSequence, str, None]:
+        """
+        Returns the sequence of the entry in the given row in its packed form, which is copied out of the mapped
+        file without unpacking it. A sequence which cannot be packed is returned as a string, see packed.pack_or_keep().
+        """
+        offset, length = self.index[2 * row], self.index[2 * row + 1]
+        if length < 0:
+            return None
+        if offset < 0:
+            return str(self.blob[~offset:~offset + length], 'ascii')
+        if not self.packed:
+            return pack_or_keep(str(self.blob[offset:offset + length], 'ascii'))
+        return PackedSequence(length, self.blob[offset:offset + packed_size(length)])
+
+    def get(self, row: int) -> Optional[str]:
+        """Returns the sequence of the entry in the given row as a string."""
+        offset, length = self.index[2 * row], self.index[2 * row + 1]
+        if length < 0:
+            return None
+        if offset < 0:
+            return str(self.blob[~offset:~offset + length], 'ascii')
+        if not self.packed:
+            return str(self.blob[offset:offset + length], 'ascii')
+        return unpack_sequence(self.blob[offset:offset + packed_size(length)], length)
+
+    def hash(self, row: int) -> Optional[SequenceHash]:
+        """Returns the hash of the sequence of the entry in the given row, read from the checksum file if available."""
+        length = self.length(row)
+        if length is None:
+            return None
+        if self.checksums is None:
+            return hash_sequence(self.get(row))
+        crc, digest = CHECKSUM_RECORD.unpack_from(self.checksums, row * CHECKSUM_RECORD.size)
+        return SequenceHash(length, f'{crc:016X}', digest)
+
+
+def write_sequences(database: str, data: Dict[str, dict], checksums: Optional[Dict[str, str]] = None) -> None:
+    """
+    Writes the sequences of all entries into the sequence file of a database, in the order of the entries, together
+    with their checksums. Must be called before the parsed json file (without sequences) is written.
+    :param str database: either 'refseq' or 'uniprot'
+    :param dict data: dictionary of accession ID: {entry info}
+    :param dict checksums: optional dictionary of accession ID: CRC64 checksum, computed for entries not listed
+    """
+    checksums = checksums or {}
+    blob_path, index_path = SEQUENCE_FILES[database]
+    residues = write_sequence_file(((entry['sequence'], checksums.get(acc), acc) for acc, entry in data.items()),
+                                   blob_path, index_path, CHECKSUM_FILES[database])
+    logger.info(f"Wrote {len(data)} {database} sequences ({residues} residues) to {blob_path}.")
+
+
+class SequenceWriter:
+    """
+    Writes sequences one at a time into a sequence file, packed into 5 bits per residue, with their (offset, length)
+    and their CRC64 and digest in the index and checksum files. Sequences which cannot be packed are written as they
+    are, see SequenceFile. The files are written next to their targets and moved in place by close(), they are
+    discarded if writing fails within a with block.
+    """
+    def __init__(self, blob_path: str, index_path: str, checksum_path: str):
+        self.paths = [blob_path, index_path, checksum_path]
+        self.index, self.offset, self.residues = array('q'), len(PACKED_HEADER), 0
+        self.blob = open(blob_path + '.tmp', 'wb')
+        self.blob.write(PACKED_HEADER)
+        self.checksums = open(checksum_path + '.tmp', 'wb')
+
+    def add(self, sequence: Optional[str], checksum: Optional[str] = None, accession: Optional[str] = None) -> None:
+        """
+        Appends the sequence of the next entry. A sequence with a character which is not an amino acid code (see
+        packed.ALPHABET) is logged and written unpacked.
+        :param str sequence: amino acid sequence, None for entries without sequence
+        :param str checksum: the CRC64 checksum, None if it is not known yet
+        :param str accession: the accession ID of the entry, for the log
+        """
+        self.add_packed(pack_or_keep(sequence, accession) if sequence is not None else None,
+                        hash_sequence(sequence, checksum))
+
+    def add_packed(self, packed: Union[PackedSequence, str, None], sequence_hash: Optional[SequenceHash]) -> None:
+        """
+        Appends the packed sequence of the next entry together with its hash, e.g. copied from another sequence file
+        without unpacking it.
+        :param packed: the packed sequence, the sequence as string if it cannot be packed, None for entries without
+            sequence
+        :param SequenceHash sequence_hash: the hash of the sequence, None for entries without sequence
+        """
+        if packed is None:
+            self.index.extend((self.offset, -1))
+            self.checksums.write(bytes(CHECKSUM_RECORD.size))
+            return
+        self.checksums.write(CHECKSUM_RECORD.pack(int(sequence_hash.crc64, 16), sequence_hash.digest))
+        if type(packed) is str:
+            data = packed.encode('ascii')
+            self.index.extend((~self.offset, len(packed)))
+        else:
+            data = packed.data
+            self.index.extend((self.offset, packed.length))
+        self.blob.write(data)
+        self.offset += len(data)
+        self.residues += len(packed)
+
+    def close(self) -> int:
+        """Completes the files and moves them in place, returns the number of residues written."""
+        self.blob.close()
+        self.checksums.close()
+        with open(self.paths[1] + '.tmp', 'wb') as filehandle:
+            self.index.tofile(filehandle)
+        for path in self.paths:
+            os.replace(path + '.tmp', path)
+        return self.residues
+
+    def discard(self) -> None:
+        """Removes the partially written files."""
+        self.blob.close()
+        self.checksums.close()
+        for path in self.paths:
+            if osp.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+
+    def __enter__(self) -> 'SequenceWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.discard()
+
+
+def write_sequence_file(sequences: Iterable[Tuple[Optional[str], ...]],
+                        blob_path: str, index_path: str, checksum_path: str) -> int:
+    """
+    Writes sequences into one contiguous file, their (offset, length) into an index file and their CRC64 and digest
+    into a checksum file. All files are moved in place once complete.
+    :param sequences: (sequence, CRC64 checksum) in the order of the entries, None for entries without sequence or
+        if the checksum is not known yet, optionally followed by the accession ID of the entry for the log
+    :param str blob_path: the filepath of the sequence file
+    :param str index_path: the filepath of the index file
+    :param str checksum_path: the filepath of the checksum file
+    :return: number of residues written
+    """
+    with SequenceWriter(blob_path, index_path, checksum_path) as writer:
+        for sequence in sequences:
+            writer.add(*sequence)
+        return writer.close()
+
+
+def strip_sequences(data: Dict[str, dict]) -> Dict[str, dict]:
+    """Returns the entries without their sequences, as they are saved in the parsed json file."""
+    return {acc: {key: value for key, value in entry.items() if key != 'sequence'} for acc, entry in data.items()}
+
+
+def get_sequence_file(database: str) -> SequenceFile:
+    """
+    Returns the memory-mapped sequence file belonging to the current snapshot of a database.
+    :param str database: either 'refseq' or 'uniprot'
+    """
+    snapshot = load_snapshot(PARSED_FILES[database])
+    if snapshot.sequences is None:
+        sequences = SequenceFile(*SEQUENCE_FILES[database], CHECKSUM_FILES[database])
+        if len(sequences) != len(snapshot.data):
+            logger.warning(f"The {database} sequence file does not belong to the parsed data.")
+        # the mapped entries know the row of each entry
+        snapshot.rows = snapshot.data.rows if isinstance(snapshot.data, MappedEntries) else \
+            {acc: row for row, acc in enumerate(snapshot.data)}
+        snapshot.sequences = sequences
+    return snapshot.sequences
+
+
+def get_sequence(database: str, accession: str) -> Optional[str]:
+    """
+    Returns the sequence of an entry, either from the parsed json file or sliced out of the sequence file.
+    :param str database: either 'refseq' or 'uniprot'
+    :param str accession: the accession ID of the entry
+    :raises KeyError: if there is no entry with this accession ID
+    """
+    snapshot = load_snapshot(PARSED_FILES[database])
+    entry = snapshot.data[accession]
+    if 'sequence' in entry:
+        return entry['sequence']
+    sequences = get_sequence_file(database)
+    return sequences.get(snapshot.rows[accession])
+
+
+def get_sequence_length(database: str, accession: str) -> Optional[int]:
+    """Returns the length of the sequence of an entry without reading the sequence, None if it has none."""
+    snapshot = load_snapshot(PARSED_FILES[database])
+    entry = snapshot.data[accession]
+    if 'sequence' in entry:
+        return None if entry['sequence'] is None else len(entry['sequence'])
+    sequences = get_sequence_file(database)
+    return sequences.length(snapshot.rows[accession])
+
+
+def get_sequence_hash(database: str, accession: str) -> Optional[SequenceHash]:
+    """Returns the hash of the sequence of an entry without reading the sequence, None if it has none."""
+    snapshot = load_snapshot(PARSED_FILES[database])
+    entry = snapshot.data[accession]
+    if 'sequence' in entry:
+        return hash_sequence(entry['sequence'])
+    sequences = get_sequence_file(database)
+    return sequences.hash(snapshot.rows[accession])
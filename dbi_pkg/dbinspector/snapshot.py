@@ -0,0 +1,256 @@
+import os
+import os.path as osp
+import dbinspector.startup
+from dbinspector.startup import REFSEQ, UNIPROT
+import gc
+import logging
+import mmap
+import re
+import sys
+import threading
+import zlib
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+from dbinspector.records import Entry, compact_entry
+
+import json
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# parsed database files which are held in memory once loaded
+PARSED_FILES = {'refseq': osp.join(REFSEQ, 'refseq.json'),
+                'uniprot': osp.join(UNIPROT, 'uniprot.json')}
+
+_snapshots: Dict[str, 'Snapshot'] = {}
+_lock = threading.Lock()
+
+
+# the json encoded accession ID at the start of each line of a parsed json file
+_KEY = re.compile(rb'"(?:[^"\\]|\\.)*"')
+# decodes single values of a line, without the checks of json.loads()
+_DECODER = json.JSONDecoder()
+
+
+class MappedEntries(Mapping):
+    """
+    Read-only dictionary of accession ID: {entry info} over a memory-mapped parsed json file with one entry per line
+    and its offset file, see entries.EntryWriter. An entry is only decoded when it is looked up, a new dictionary each
+    time. The accession IDs are found with a hash table of rows in a single array, so apart from the pages of the
+    files, which are shared by all processes reading them, the mapping consists of a few objects: forked worker
+    processes share it without copying it page by page as they touch it.
+    """
+    def __init__(self, path: str, offset_path: str):
+        with open(path, 'rb') as filehandle:
+            self._mm = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(offset_path, 'rb') as filehandle:
+            self._offsets_mm = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = memoryview(self._offsets_mm).cast('q')
+        self._check(path)
+        # open addressing with linear probing, at most half of the slots are used
+        size = 1 << max(len(self._offsets) * 2 - 1, 1).bit_length()
+        self._mask = size - 1
+        self._table = array('i', [-1]) * size
+        for row in range(len(self._offsets)):
+            slot = zlib.crc32(self._key(row)) & self._mask
+            while self._table[slot] != -1:
+                slot = (slot + 1) & self._mask
+            self._table[slot] = row
+        self.rows = _Rows(self)
+
+    def _check(self, path: str) -> None:
+        """Verifies that the offset file belongs to the parsed json file."""
+        # the first entry starts after '{\n', the last one ends before '\n}\n'
+        n = len(self._offsets)
+        complete = n == 0 or (self._offsets[0] == 2 and self._mm.find(b'\n', self._offsets[n - 1]) == len(self._mm) - 3)
+        if self._mm[:2] != b'{\n' or not complete:
+            raise ValueError(f"The offset file does not belong to {path}.")
+
+    def _key(self, row: int) -> bytes:
+        return _KEY.match(self._mm, self._offsets[row]).group()
+
+    def row(self, accession: str) -> Optional[int]:
+        """Returns the position of an entry in the parsed data, None if there is no entry with this accession ID."""
+        key = json.dumps(accession).encode() + b':'
+        slot = zlib.crc32(key[:-1]) & self._mask
+        while True:
+            row = self._table[slot]
+            if row == -1:
+                return None
+            offset = self._offsets[row]
+            if self._mm[offset:offset + len(key)] == key:
+                return row
+            slot = (slot + 1) & self._mask
+
+    def _line(self, row: int) -> str:
+        """Returns the line of the entry at a position: '"<accession ID>": {entry info}', possibly followed by ','."""
+        offset = self._offsets[row]
+        return self._mm[offset:self._mm.find(b'\n', offset)].decode()
+
+    def entry(self, row: int) -> Tuple[str, dict]:
+        """Decodes the entry at a position, returns (accession ID, {entry info})."""
+        line = self._line(row)
+        accession, end = _DECODER.raw_decode(line)
+        return accession, _DECODER.raw_decode(line, end + 2)[0]
+
+    def __getitem__(self, accession: str) -> dict:
+        row = self.row(accession) if isinstance(accession, str) else None
+        if row is None:
+            raise KeyError(accession)
+        return _DECODER.raw_decode(self._line(row), len(json.dumps(accession)) + 2)[0]
+
+    def __contains__(self, accession) -> bool:
+        return isinstance(accession, str) and self.row(accession) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for row in range(len(self._offsets)):
+            yield json.loads(self._key(row))
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """Iterates over (accession ID, {entry info}) in the order of the file, each entry decoded once."""
+        return (self.entry(row) for row in range(len(self._offsets)))
+
+    def values(self) -> Iterator[dict]:
+        """Iterates over the entries in the order of the file."""
+        return (self.entry(row)[1] for row in range(len(self._offsets)))
+
+
+class _Rows(Mapping):
+    """Read-only dictionary of accession ID: position of the entry of a MappedEntries."""
+    def __init__(self, entries: MappedEntries):
+        self.entries = entries
+
+    def __getitem__(self, accession: str) -> int:
+        row = self.entries.row(accession)
+        if row is None:
+            raise KeyError(accession)
+        return row
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class Snapshot:
+    """A parsed database file loaded into memory, together with the signature of the file it was read from."""
+    def __init__(self, path: str, signature: Tuple[int, int, int], data: Union[Dict[str, dict], MappedEntries]):
+        self.path = path
+        self.signature = signature
+        self.data = data
+        # inverted symbol index, attached on first symbol lookup
+        self.symbol_index = None
+        # memory-mapped sequence file and the row of each accession in it, attached on first sequence lookup
+        self.sequences = None
+        self.rows = None
+
+
+def file_signature(path: str) -> Tuple[int, int, int]:
+    """
+    Determines the signature of a file, which changes whenever the file is rewritten or replaced.
+    :param str path: the filepath to the file to check
+    :return: tuple of modification time (ns), size and inode of the file
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def load_snapshot(path: str) -> Snapshot:
+    """
+    Returns the in-process snapshot of a parsed json file. The file is only read again if its signature changed
+    since it was last loaded.
+    :param str path: the filepath to the parsed json file
+    :return: snapshot of the file
+    """
+    signature = file_signature(path)
+    snapshot = _snapshots.get(path)
+    if snapshot is not None and snapshot.signature == signature:
+        return snapshot
+    with _lock:
+        # another thread might have loaded the file in the meantime
+        snapshot = _snapshots.get(path)
+        if snapshot is not None and snapshot.signature == signature:
+            return snapshot
+        data = None
+        if dbinspector.startup.SNAPSHOT == 'mapped':
+            data = map_entries(path)
+        if data is None:
+            data = read_entries(path)
+        snapshot = Snapshot(path, signature, data)
+        _snapshots[path] = snapshot
+    return snapshot
+
+
+def read_entries(path: str) -> Dict[str, Union[Entry, dict]]:
+    """
+    Reads a parsed json file into memory, one entry at a time, with each entry converted into its record,
+    see records.Entry.
+    :param str path: the filepath to the parsed json file
+    :return: dictionary of accession ID: entry
+    """
+    from dbinspector.entries import iter_entries
+    logger.info(f"Loading snapshot of {path} ...")
+    return {sys.intern(acc): compact_entry(entry, acc) for acc, entry in iter_entries(path)}
+
+
+def map_entries(path: str) -> Optional[MappedEntries]:
+    """
+    Memory-maps a parsed json file and its offset file, see MappedEntries.
+    :param str path: the filepath to the parsed json file
+    :return: the entries, None if the file was not written with an offset file
+    """
+    offset_path = osp.splitext(path)[0] + '.offsets'
+    if not osp.exists(offset_path):
+        logger.warning(f"{path} has no offset file and is loaded into memory.")
+        return None
+    logger.info(f"Mapping snapshot of {path} ...")
+    try:
+        return MappedEntries(path, offset_path)
+    except ValueError as error:
+        logger.warning(f"{error} It is loaded into memory.")
+        return None
+
+
+def get_data(database: str) -> Dict[str, dict]:
+    """
+    Returns the parsed data of a database from the in-process snapshot. The returned dictionary is shared between
+    all callers and must not be modified. Its entries are records which read like dictionaries, see records.Entry.
+    :param str database: either 'refseq' or 'uniprot'
+    :return: dictionary of accession ID: {entry info}
+    """
+    return load_snapshot(PARSED_FILES[database]).data
+
+
+def preload(freeze: bool = False) -> None:
+    """
+    Loads the snapshots of all parsed databases that are available, together with their sequence files and symbol
+    indexes, e.g. at the start of the web app. Worker processes forked afterwards, e.g. by a pre-forking WSGI server
+    loading the app before it forks, share them instead of loading their own copies.
+    :param bool freeze: move all objects allocated so far out of the reach of the garbage collector (gc.freeze()),
+        whose passes would otherwise write to every object and thereby copy the shared memory into each worker
+    """
+    from dbinspector.index import get_symbol_index
+    from dbinspector.sequences import get_sequence_file, SEQUENCE_FILES
+    for database, path in PARSED_FILES.items():
+        if osp.exists(path):
+            load_snapshot(path)
+            if osp.exists(SEQUENCE_FILES[database][0]):
+                get_sequence_file(database)
+            get_symbol_index(database)
+        else:
+            logger.warning(f"Parsed {database} data could not be preloaded because {path} does not exist.")
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+
+def clear() -> None:
+    """Drops all loaded snapshots."""
+    with _lock:
+        _snapshots.clear()
@@ -0,0 +1,98 @@
+from dbinspector.fingerprints import Fingerprints
+from dbinspector.utils import measure_stage, peak_rss
+from dbinspector.progress import ProgressCallback, report_stage
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Callable, Dict, List, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class Stage(NamedTuple):
+    """
+    A stage of the parse pipeline, run by run_stages() once all stages it requires are done. If inputs and outputs
+    are given, the stage only runs if their fingerprints changed since it last ran and they are recorded afterwards,
+    which checkpoints the stage. Otherwise run() checks itself what is left to do and returns whether it did anything.
+    """
+    name: str
+    run: Callable[[], Optional[bool]]
+    requires: Tuple[str, ...] = ()
+    inputs: Optional[List[str]] = None
+    outputs: Optional[List[str]] = None
+
+
+def run_stages(stages: List[Stage], fingerprints: Fingerprints, workers: Optional[int] = None,
+               progress: Optional[ProgressCallback] = None) -> Dict[str, bool]:
+    """
+    Runs a graph of stages. Each stage starts as soon as the stages it requires are done, so independent stages run
+    at the same time in separate threads. If a stage fails, the stages that do not depend on it still run to
+    completion and are recorded, so that a re-run resumes after the last completed stages; the first error is raised
+    once all of them are done. The peak memory of the process is shared by the stages running at the same time, so it
+    is logged per stage only if they run one at a time (workers=1), otherwise once for all stages.
+    :param list stages: the stages, see Stage
+    :param Fingerprints fingerprints: the fingerprints recorded when the stages last ran
+    :param int workers: the maximum number of stages running at the same time, by default no limit
+    :param progress: callback receiving the state of each stage, see progress.ProgressCallback
+    :return: dictionary of stage: whether it ran
+    :raises ValueError: if a stage requires a stage that is not in the graph
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = set(stage.requires) - names
+        if unknown:
+            raise ValueError(f"The stage {stage.name} requires the unknown stages {', '.join(sorted(unknown))}.")
+    pending, running, done, ran, errors = list(stages), {}, set(), {}, []
+    serial = workers == 1
+    if not serial:
+        peak_rss(reset=True)
+    with ThreadPoolExecutor(max_workers=workers or len(stages) or 1) as executor:
+        while pending or running:
+            for stage in [stage for stage in pending if done.issuperset(stage.requires)]:
+                pending.remove(stage)
+                running[executor.submit(run_stage, stage, fingerprints, progress, serial)] = stage
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    ran[stage.name] = future.result()
+                    done.add(stage.name)
+                except Exception as error:
+                    logger.error(f"The stage {stage.name} failed: {error!r}")
+                    report_stage(progress, stage.name, 'failed')
+                    errors.append(error)
+    if not serial:
+        logger.info(f"The peak memory of the {len(stages)} stages was {peak_rss() / 1e6:.1f} MB.")
+    for stage in pending:
+        logger.warning(f"The stage {stage.name} was not run, because a stage it requires failed.")
+        report_stage(progress, stage.name, 'not run')
+    if errors:
+        raise errors[0]
+    return ran
+
+
+def run_stage(stage: Stage, fingerprints: Fingerprints, progress: Optional[ProgressCallback] = None,
+              measure_peak: bool = True) -> bool:
+    """
+    Runs a single stage if its inputs or outputs changed, and logs its wall time and peak memory.
+    :param Stage stage: the stage
+    :param Fingerprints fingerprints: the fingerprints recorded when the stages last ran
+    :param progress: callback receiving the state of the stage, see progress.ProgressCallback
+    :param bool measure_peak: measure the peak memory, only if no other stage runs at the same time
+    :return: whether the stage ran
+    """
+    checkpointed = stage.inputs is not None
+    if checkpointed and not fingerprints.changed(stage.name, stage.inputs, stage.outputs or []):
+        logger.info(f"The inputs of the stage {stage.name} are unchanged, skipping it.")
+        report_stage(progress, stage.name, 'skipped')
+        return False
+    report_stage(progress, stage.name, 'running')
+    with measure_stage(stage.name, peak=measure_peak):
+        result = stage.run()
+    if checkpointed:
+        fingerprints.record(stage.name, stage.inputs, stage.outputs or [])
+        result = True
+    report_stage(progress, stage.name, 'done')
+    return bool(result)
@@ -1,26 +1,64 @@
-from pathlib import Path
 import os
 import os.path as osp
 import logging
 
-# set up directories
-HOME = str(Path.home())
-CACHE = osp.join(HOME, '.dbinspector')
+# directories, created by setup()
+HOME = osp.expanduser('~')
+# cache directory for downloaded and parsed data, ~/.dbinspector unless set with DBINSPECTOR_CACHE
+CACHE = os.environ.get('DBINSPECTOR_CACHE') or osp.join(HOME, '.dbinspector')
 LOGS = osp.join(CACHE, 'logs')
 # parsed
 UNIPROT = osp.join(CACHE, 'uniprot')
 REFSEQ = osp.join(CACHE, 'refseq')
+REFSEQ_SHARDS = osp.join(REFSEQ, 'shards')
+STORE = osp.join(CACHE, 'store')
+SQLITE = osp.join(STORE, 'dbinspector.sqlite')
+# fingerprints of the inputs and outputs of each parse stage
+FINGERPRINTS = osp.join(STORE, 'fingerprints.json')
+# summary statistics computed at the end of parsing, with the fingerprints of the data they were computed from
+SUMMARY = osp.join(STORE, 'summary.json')
 # downloads
 DATA = osp.join(CACHE, 'data')
 REFSEQ_FASTA = osp.join(DATA, 'refseq_fasta')
+# remote size, modification time and checksum of each downloaded file
+MANIFEST = osp.join(DATA, 'manifest.json')
+# state and progress of the parse jobs of the web app, shared by its worker processes
+JOBS = osp.join(CACHE, 'parse_jobs.json')
 
-for folder in [CACHE, LOGS, UNIPROT, REFSEQ, DATA, REFSEQ_FASTA]:
-    os.makedirs(folder, exist_ok=True)
+FOLDERS = [CACHE, LOGS, UNIPROT, REFSEQ, REFSEQ_SHARDS, STORE, DATA, REFSEQ_FASTA]
+
+# storage backend used for lookups: 'json' (default) or 'sqlite'
+BACKEND = os.environ.get('DBINSPECTOR_BACKEND', 'json')
+# approximate memory in MB for the batches of entries written to the store while parsing TrEMBL
+MEMORY_LIMIT = int(os.environ.get('DBINSPECTOR_MEMORY_LIMIT', 512))
+# Unix domain socket of the daemon started with dbi serve, used by the CLI if it is running
+SOCKET = os.environ.get('DBINSPECTOR_SOCKET', osp.join(CACHE, 'dbinspector.sock'))
+# seconds the CLI waits for the daemon to answer a request before running it in-process
+DAEMON_TIMEOUT = float(os.environ.get('DBINSPECTOR_DAEMON_TIMEOUT', 60))
+# how the parsed json files are held by the snapshots: 'memory' (default) loads them as dictionaries, 'mapped' reads
+# the entries from the memory-mapped files, which forked worker processes share
+SNAPSHOT = os.environ.get('DBINSPECTOR_SNAPSHOT', 'memory')
+# output formats of the comparisons of several queries (compare --input), see compare.write_comparisons()
+OUTPUT_FORMATS = ['tsv', 'jsonl']
 
-# logging
-logging.basicConfig(filename=osp.join(LOGS, 'dbinspection.log'),
-                    filemode='a',
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    datefmt='%d/%m/%Y %I:%M:%S %p')
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
+
+_is_setup = False
+
+
+def setup() -> None:
+    """
+    Creates the cache directories and sets up logging to the log file. Importing the package has no side effects,
+    this is done by the CLI, the web app and the functions writing into the cache, the first time one of them is used.
+    """
+    global _is_setup
+    if _is_setup:
+        return
+    for folder in FOLDERS:
+        os.makedirs(folder, exist_ok=True)
+    logging.basicConfig(filename=osp.join(LOGS, 'dbinspection.log'),
+                        filemode='a',
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        datefmt='%d/%m/%Y %I:%M:%S %p')
+    _is_setup = True
@@ -0,0 +1,340 @@
+import os
+import os.path as osp
+import dbinspector.startup
+from dbinspector.startup import MEMORY_LIMIT, setup
+from dbinspector.snapshot import file_signature
+from dbinspector.exceptions import FileMissingError
+from dbinspector.sequences import SequenceHash, hash_sequence
+from dbinspector.uniprot import UniProtRecord
+import logging
+import threading
+from collections.abc import Mapping
+from typing import Optional, Dict, List, Iterator, Iterable, Tuple, Union
+
+import sqlite3
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+SCHEMA = """
+CREATE TABLE entries (database TEXT NOT NULL, accession TEXT NOT NULL, sequence TEXT,
+                      length INTEGER, crc64 TEXT, digest BLOB, PRIMARY KEY (database, accession));
+CREATE TABLE symbols (database TEXT NOT NULL, accession TEXT NOT NULL, symbol TEXT NOT NULL,
+                      position INTEGER NOT NULL);
+CREATE TABLE xrefs (database TEXT NOT NULL, accession TEXT NOT NULL, target TEXT NOT NULL,
+                    position INTEGER NOT NULL);
+"""
+
+INDEXES = """
+CREATE INDEX symbols_symbol ON symbols (database, symbol);
+CREATE INDEX symbols_accession ON symbols (database, accession);
+CREATE INDEX xrefs_accession ON xrefs (database, accession);
+CREATE INDEX xrefs_target ON xrefs (database, target);
+"""
+
+# key under which the cross-references of each database are given in an entry
+XREF_KEYS = {'refseq': 'UniProt ID', 'uniprot': 'RefSeq ID', 'trembl': 'RefSeq ID'}
+# entries stored under each database name: UniProt lookups cover the reviewed (Swiss-Prot) and unreviewed (TrEMBL)
+# entries, TrEMBL entries are only kept in the store
+SOURCES = {'refseq': ('refseq',), 'uniprot': ('uniprot', 'trembl')}
+# estimated memory used by a record besides its strings, see spill_records()
+RECORD_OVERHEAD = 1000
+# parsed entries inserted at a time by write_store() and update_store()
+INSERT_BATCH = 10000
+
+_connections = threading.local()
+
+
+def write_store(uniprot_data: Union[Dict[str, dict], Iterable[Tuple[str, dict]]],
+                refseq_data: Union[Dict[str, dict], Iterable[Tuple[str, dict]]], path: Optional[str] = None) -> None:
+    """
+    Writes the parsed UniProt and RefSeq data into an indexed SQLite file. The file is written next to the target
+    and moved in place once complete, so readers never see a partially written store.
+    :param uniprot_data: dictionary of uniprot_id: {entry info}, or an iterator of (uniprot_id, {entry info})
+    :param refseq_data: dictionary of refseq_id: {entry info}, or an iterator of (refseq_id, {entry info})
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    """
+    path = path or dbinspector.startup.SQLITE
+    setup()
+    logger.info(f"Writing parsed data to the SQLite store {path} ...")
+    tmp_path = path + '.tmp'
+    if osp.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        for database, data in [('uniprot', uniprot_data), ('refseq', refseq_data)]:
+            _insert_database(conn, database, data)
+        conn.executescript(INDEXES)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    logger.info(f"...Finished writing the SQLite store {path}.")
+
+
+def update_store(database: str, data: Union[Dict[str, dict], Iterable[Tuple[str, dict]]],
+                 path: Optional[str] = None) -> None:
+    """
+    Replaces the entries of one database in an existing SQLite store, e.g. after only this database was parsed again.
+    The entries of the other database are kept. The store is updated in a single transaction, so readers see either
+    the old or the new entries.
+    :param str database: either 'refseq' or 'uniprot'
+    :param data: dictionary of accession ID: {entry info}, or an iterator of (accession ID, {entry info})
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    """
+    path = path or dbinspector.startup.SQLITE
+    setup()
+    logger.info(f"Updating the {database} entries in the SQLite store {path} ...")
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            for table in ['entries', 'symbols', 'xrefs']:
+                conn.execute(f'DELETE FROM {table} WHERE database = ?', (database,))
+            _insert_database(conn, database, data)
+    finally:
+        conn.close()
+    logger.info(f"...Finished updating the SQLite store {path}.")
+
+
+def _insert_database(conn: sqlite3.Connection, database: str,
+                     data: Union[Dict[str, dict], Iterable[Tuple[str, dict]]]) -> None:
+    """Inserts the entries of one database into the tables of the store, INSERT_BATCH entries at a time."""
+    entries = data.items() if isinstance(data, Mapping) else data
+    batch = []
+    for item in entries:
+        batch.append(item)
+        if len(batch) >= INSERT_BATCH:
+            _insert_entries(conn, database, batch)
+            batch = []
+    _insert_entries(conn, database, batch)
+
+
+def _insert_entries(conn: sqlite3.Connection, database: str, entries: List[Tuple[str, dict]]) -> None:
+    """Inserts a batch of (accession ID, {entry info}) into the tables of the store."""
+    conn.executemany('INSERT INTO entries (database, accession, sequence, length, crc64, digest) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((database, acc, entry['sequence'], *_hash_columns(entry['sequence'])) for acc, entry in entries))
+    conn.executemany('INSERT INTO symbols (database, accession, symbol, position) VALUES (?, ?, ?, ?)',
+                     ((database, acc, symbol, i) for acc, entry in entries for i, symbol in enumerate(entry['symbol'])))
+    conn.executemany('INSERT INTO xrefs (database, accession, target, position) VALUES (?, ?, ?, ?)',
+                     ((database, acc, target, i) for acc, entry in entries
+                      for i, target in enumerate(_xrefs(database, entry))))
+
+
+def _hash_columns(sequence: Optional[str],
+                  checksum: Optional[str] = None) -> Tuple[Optional[int], Optional[str], Optional[bytes]]:
+    """Returns length, CRC64 checksum (computed unless given) and digest of a sequence for the entries table."""
+    sequence_hash = hash_sequence(sequence, checksum)
+    if sequence_hash is None:
+        return None, None, None
+    return sequence_hash.length, sequence_hash.crc64, sequence_hash.digest
+
+
+def spill_records(database: str, records: Iterable[UniProtRecord], memory_limit: int = MEMORY_LIMIT,
+                  path: Optional[str] = None) -> int:
+    """
+    Writes UniProt records into an existing SQLite store as they are parsed, replacing the entries previously stored
+    under the database name. Records are collected and inserted in batches, a batch is written once the records
+    collected are estimated to take up more than the memory limit. The update is committed once all records are
+    written, so readers see either the old or the new entries. Of an accession ID listed more than once, the first
+    record is kept, as by parse.parse_uniprot().
+    :param str database: the name the entries are stored under, e.g. 'trembl'
+    :param records: iterator of UniProtRecord
+    :param int memory_limit: the approximate memory in MB that the collected records and the SQLite page cache may
+        take up each
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    :return: the number of records written
+    """
+    path = path or dbinspector.startup.SQLITE
+    setup()
+    logger.info(f"Writing {database} entries to the SQLite store {path} in batches of up to {memory_limit} MB ...")
+    limit, count = memory_limit * 1024 * 1024, 0
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f'PRAGMA cache_size = -{memory_limit * 1024}')
+        with conn:
+            for table in ['entries', 'symbols', 'xrefs']:
+                conn.execute(f'DELETE FROM {table} WHERE database = ?', (database,))
+            batch, size, seen = [], 0, set()
+            for record in records:
+                if record.accession in seen:
+                    logger.warning(f"The {database} entry {record.accession} is listed twice, keeping the first one.")
+                    continue
+                seen.add(record.accession)
+                batch.append(record)
+                size += RECORD_OVERHEAD + len(record.sequence or '') + sum(map(len, record.symbols)) \
+                    + sum(map(len, record.refseq_ids))
+                if size >= limit:
+                    _insert_records(conn, database, batch)
+                    count += len(batch)
+                    logger.debug(f"Spilled {count} {database} entries to the SQLite store.")
+                    batch, size = [], 0
+            _insert_records(conn, database, batch)
+            count += len(batch)
+    finally:
+        conn.close()
+    logger.info(f"...Finished writing {count} {database} entries to the SQLite store {path}.")
+    return count
+
+
+def _insert_records(conn: sqlite3.Connection, database: str, records: List[UniProtRecord]) -> None:
+    """Inserts a batch of UniProt records into the tables of the store."""
+    conn.executemany('INSERT INTO entries (database, accession, sequence, length, crc64, digest) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((database, record.accession, record.sequence, *_hash_columns(record.sequence, record.checksum))
+                      for record in records))
+    conn.executemany('INSERT INTO symbols (database, accession, symbol, position) VALUES (?, ?, ?, ?)',
+                     ((database, record.accession, symbol, i) for record in records
+                      for i, symbol in enumerate(record.symbols)))
+    conn.executemany('INSERT INTO xrefs (database, accession, target, position) VALUES (?, ?, ?, ?)',
+                     ((database, record.accession, target, i) for record in records
+                      for i, target in enumerate(record.refseq_ids)))
+
+
+def _xrefs(database: str, entry: dict) -> List[str]:
+    """Returns the cross-references of an entry as a list, RefSeq entries have a single UniProt ID or None."""
+    xrefs = entry[XREF_KEYS[database]]
+    if database == 'refseq':
+        return [xrefs] if xrefs else []
+    return xrefs
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Returns a read-only connection to the SQLite store. Connections are kept open per thread and reopened once the
+    store was rewritten.
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    :raises FileMissingError: if the store has not been written yet
+    """
+    path = path or dbinspector.startup.SQLITE
+    if not osp.exists(path):
+        logger.error(f"The SQLite store {path} does not exist.")
+        raise FileMissingError("The SQLite store is not found. Try running parse with the sqlite backend.")
+    signature = file_signature(path)
+    cache = _connections.__dict__.setdefault('cache', {})
+    if path in cache and cache[path][0] == signature:
+        return cache[path][1]
+    if path in cache:
+        cache[path][1].close()
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    cache[path] = (signature, conn)
+    return conn
+
+
+def _build_entry(conn: sqlite3.Connection, source: str, accession: str, sequence) -> dict:
+    """Assembles a single entry in the structure of the parsed json data."""
+    symbols = [row[0] for row in conn.execute(
+        'SELECT symbol FROM symbols WHERE database = ? AND accession = ? ORDER BY position', (source, accession))]
+    xrefs = [row[0] for row in conn.execute(
+        'SELECT target FROM xrefs WHERE database = ? AND accession = ? ORDER BY position', (source, accession))]
+    if source == 'refseq':
+        return {'symbol': symbols, 'UniProt ID': xrefs[0] if xrefs else None, 'sequence': sequence}
+    return {'symbol': symbols, 'RefSeq ID': xrefs, 'sequence': sequence}
+
+
+def _in(database: str) -> Tuple[str, tuple]:
+    """Returns the SQL condition on the database column for a database and its parameters, see SOURCES."""
+    sources = SOURCES.get(database, (database,))
+    return f"database IN ({', '.join('?' * len(sources))})", sources
+
+
+def get_entry(database: str, accession: str, path: Optional[str] = None, hashed: bool = False) -> Optional[dict]:
+    """
+    Retrieves a single entry by accession ID from the SQLite store.
+    :param str database: either 'refseq' or 'uniprot' (which includes TrEMBL entries, if parsed)
+    :param str accession: the accession ID of the entry
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    :param bool hashed: give the SequenceHash instead of the sequence, which is enough for comparisons
+    :return: the entry in the structure of the parsed json data, None if not found
+    """
+    conn = connect(path)
+    condition, sources = _in(database)
+    if hashed:
+        row = conn.execute(f'SELECT database, length, crc64, digest FROM entries WHERE {condition} AND accession = ?',
+                           (*sources, accession)).fetchone()
+        if row is None:
+            return None
+        return _build_entry(conn, row[0], accession, SequenceHash(*row[1:]) if row[1] is not None else None)
+    row = conn.execute(f'SELECT database, sequence FROM entries WHERE {condition} AND accession = ?',
+                       (*sources, accession)).fetchone()
+    if row is None:
+        return None
+    return _build_entry(conn, row[0], accession, row[1])
+
+
+def find_by_symbol(database: str, symbols: List[str], path: Optional[str] = None,
+                   hashed: bool = False) -> List[Tuple[str, dict]]:
+    """
+    Retrieves all entries which list any of the given symbols, in the order in which they were parsed.
+    :param str database: either 'refseq' or 'uniprot' (which includes TrEMBL entries, if parsed)
+    :param list symbols: gene symbols to search for
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    :param bool hashed: give the SequenceHash instead of the sequence, which is enough for comparisons
+    :return: list of (accession ID, entry)
+    """
+    conn = connect(path)
+    condition, sources = _in(database)
+    placeholders = ', '.join('?' * len(symbols))
+    columns = 'e.length, e.crc64, e.digest' if hashed else 'e.sequence'
+    rows = conn.execute(f'SELECT e.database, e.accession, {columns} FROM entries e JOIN '
+                        f'(SELECT DISTINCT database, accession FROM symbols WHERE {condition} '
+                        f'AND symbol IN ({placeholders})) s '
+                        f'ON e.database = s.database AND e.accession = s.accession ORDER BY e.rowid',
+                        (*sources, *symbols)).fetchall()
+    if hashed:
+        return [(acc, _build_entry(conn, source, acc, SequenceHash(*row) if row[0] is not None else None))
+                for source, acc, *row in rows]
+    return [(acc, _build_entry(conn, source, acc, sequence)) for source, acc, sequence in rows]
+
+
+def read_data(database: str, path: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Reads all entries of a database from the SQLite store. For UniProt, only the reviewed entries are read: the
+    TrEMBL entries are only looked up one at a time.
+    :param str database: either 'refseq' or 'uniprot'
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    :return: dictionary of accession ID: {entry info}
+    """
+    conn = connect(path)
+    symbols, xrefs = {}, {}
+    for acc, symbol in conn.execute('SELECT accession, symbol FROM symbols WHERE database = ? '
+                                    'ORDER BY accession, position', (database,)):
+        symbols.setdefault(acc, []).append(symbol)
+    for acc, target in conn.execute('SELECT accession, target FROM xrefs WHERE database = ? '
+                                    'ORDER BY accession, position', (database,)):
+        xrefs.setdefault(acc, []).append(target)
+    data = {}
+    for acc, sequence in conn.execute('SELECT accession, sequence FROM entries WHERE database = ? ORDER BY rowid',
+                                      (database,)):
+        if database == 'refseq':
+            data[acc] = {'symbol': symbols.get(acc, []), 'UniProt ID': xrefs[acc][0] if acc in xrefs else None,
+                         'sequence': sequence}
+        else:
+            data[acc] = {'symbol': symbols.get(acc, []), 'RefSeq ID': xrefs.get(acc, []), 'sequence': sequence}
+    return data
+
+
+def count_entries(database: str, path: Optional[str] = None) -> int:
+    """Returns the number of entries of a database in the SQLite store, for UniProt including TrEMBL entries."""
+    condition, sources = _in(database)
+    return connect(path).execute(f'SELECT COUNT(*) FROM entries WHERE {condition}', sources).fetchone()[0]
+
+
+def linked_pairs(path: Optional[str] = None) -> Iterator[Tuple[str, str, str]]:
+    """
+    Streams all pairs of RefSeq and UniProt entries that are linked by a cross-reference, in the same way as
+    summary_statistics() finds them in the parsed json data.
+    :param str path: the filepath of the SQLite file, startup.SQLITE by default
+    :return: iterator of (RefSeq ID, UniProt ID, database which lists the cross-reference)
+    """
+    conn = connect(path)
+    # UniProt IDs in RefSeq entries that are also IDs of UniProt entries
+    yield from ((rsid, upid, 'refseq') for rsid, upid in conn.execute(
+        "SELECT x.accession, x.target FROM xrefs x JOIN entries u ON u.database IN ('uniprot', 'trembl') "
+        "AND u.accession = x.target WHERE x.database = 'refseq'"))
+    # RefSeq IDs in UniProt entries whose RefSeq entry does not point back
+    yield from ((rsid, upid, 'uniprot') for upid, rsid in conn.execute(
+        "SELECT x.accession, x.target FROM xrefs x JOIN entries r ON r.database = 'refseq' "
+        "AND r.accession = x.target WHERE x.database IN ('uniprot', 'trembl') AND NOT EXISTS "
+        "(SELECT 1 FROM xrefs y WHERE y.database = 'refseq' AND y.accession = x.target AND y.target = x.accession)"))
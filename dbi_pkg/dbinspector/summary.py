@@ -0,0 +1,177 @@
+from dbinspector.snapshot import get_data
+from dbinspector.sequences import SequenceFile, SequenceHash, get_sequence_file, hash_sequence
+import dbinspector.store
+import logging
+from typing import Optional, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+CATEGORIES = ["Symbol", "RefSeq ID", "UniProt ID", "Sequence", "Sequence length"]
+# CRC64 and the two halves of the 128 bit digest of a sequence, as stored in the checksum files
+HASH_DTYPE = np.dtype([('crc64', '>u8'), ('digest_high', '>u8'), ('digest_low', '>u8')])
+
+
+class Columns(NamedTuple):
+    """
+    Columnar view of the entries of a database for summary_counts(). Accession IDs are given by their position in
+    accessions, sequences by their length (-1 without sequence) and the CRC64 and digest of their sequence (zero
+    without sequence) in the rows of hashes.
+    """
+    accessions: pd.Index
+    lengths: np.ndarray
+    hashes: np.ndarray
+    # the position of the entry and the value of each symbol and cross-reference, in the order of the entries
+    symbol_rows: np.ndarray
+    symbols: np.ndarray
+    xref_rows: np.ndarray
+    xrefs: np.ndarray
+
+
+def summary_counts(refseq: Columns, uniprot: Columns) -> Dict[str, Tuple[int, int]]:
+    """
+    Counts the matches between linked RefSeq and UniProt entries in the same way as compare.update_stats(), with
+    vectorized joins and comparisons on the columns of both databases. Pairs are RefSeq entries with the UniProt ID
+    of a UniProt entry, and RefSeq entries listed in a UniProt entry that does not point back.
+    :param Columns refseq: the RefSeq entries, whose cross-reference is their UniProt ID
+    :param Columns uniprot: the UniProt entries, whose cross-references are their RefSeq IDs
+    :return: dictionary of category: (number of matching pairs, number of matching UniProt entries)
+    """
+    # UniProt ID of each RefSeq entry, None if it has none
+    refseq_uniprot = _first(refseq.xref_rows, refseq.xrefs, len(refseq.accessions))
+    refseq_uniprot_row = uniprot.accessions.get_indexer(refseq_uniprot)
+    # (1) UniProt IDs in RefSeq entries that are also IDs of UniProt entries
+    refseq_first = np.flatnonzero(refseq_uniprot_row >= 0)
+    # (2) RefSeq IDs in UniProt entries whose RefSeq entry does not point back
+    xref_refseq_row = refseq.accessions.get_indexer(uniprot.xrefs)
+    linked = xref_refseq_row >= 0
+    linked[linked] = refseq_uniprot_row[xref_refseq_row[linked]] != uniprot.xref_rows[linked]
+    rs = np.concatenate([refseq_first, xref_refseq_row[linked]])
+    up = np.concatenate([refseq_uniprot_row[refseq_first], uniprot.xref_rows[linked]])
+    uniprot_first = np.arange(len(rs)) >= len(refseq_first)
+
+    # symbol: the first symbol of the RefSeq entry is one of the symbols of the UniProt entry
+    first_symbol = _first(refseq.symbol_rows, refseq.symbols, len(refseq.accessions))
+    symbol_index = pd.Index(pd.unique(uniprot.symbols))
+    symbol_codes = symbol_index.get_indexer(first_symbol[rs])
+    symbol = (symbol_codes >= 0) & np.isin(_keys(up, symbol_codes, len(symbol_index)),
+                                           _keys(uniprot.symbol_rows, symbol_index.get_indexer(uniprot.symbols),
+                                                 len(symbol_index)))
+    # RefSeq ID: given for pairs found in UniProt, else the RefSeq ID has to be listed in the UniProt entry
+    refseq_id = uniprot_first.copy()
+    refseq_id[~uniprot_first] = np.isin(_keys(up[~uniprot_first], rs[~uniprot_first], len(refseq.accessions)),
+                                        _keys(uniprot.xref_rows[xref_refseq_row >= 0],
+                                              xref_refseq_row[xref_refseq_row >= 0], len(refseq.accessions)))
+    # UniProt ID: given for pairs found in RefSeq, else tested like update_stats() does, only a few pairs
+    uniprot_id = ~uniprot_first
+    uniprot_id[uniprot_first] = [bool(target) and uniprot.accessions[row] in target for row, target
+                                 in zip(up[uniprot_first], refseq_uniprot[rs[uniprot_first]])]
+    # sequences are compared by length and hash, entries without sequence are equal to each other
+    lengths = refseq.lengths[rs], uniprot.lengths[up]
+    sequence = (lengths[0] == lengths[1]) & (refseq.hashes[rs] == uniprot.hashes[up])
+    sequence_length = sequence | ((lengths[0] > 0) & (lengths[0] == lengths[1]))
+
+    masks = dict(zip(CATEGORIES, [symbol, refseq_id, uniprot_id, sequence, sequence_length]))
+    return {category: (int(mask.sum()), len(np.unique(up[mask]))) for category, mask in masks.items()}
+
+
+def _first(rows: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """Returns the first value of each entry, None for entries without values."""
+    first = np.full(size, None, dtype=object)
+    if len(rows):
+        start = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        first[rows[start]] = values[start]
+    return first
+
+
+def _keys(rows: np.ndarray, codes: np.ndarray, size: int) -> np.ndarray:
+    """Combines the position of an entry and the code of a value into a single key for np.isin()."""
+    return rows.astype(np.int64) * max(size, 1) + codes
+
+
+def json_columns(database: str) -> Columns:
+    """
+    Reads the columns of a database from the parsed json data and its sequence and checksum files.
+    :param str database: either 'refseq' or 'uniprot'
+    """
+    data = get_data(database)
+    sequences = get_sequence_file(database) if data and 'sequence' not in next(iter(data.values())) else None
+    return data_columns(database, data, sequences)
+
+
+def data_columns(database: str, data: Dict[str, dict], sequences: Optional[SequenceFile] = None) -> Columns:
+    """
+    Converts the entries of a database into columns.
+    :param str database: either 'refseq' or 'uniprot'
+    :param dict data: dictionary of accession ID: {entry info}
+    :param SequenceFile sequences: the sequence file of the entries, if they do not hold their 'sequence'
+    """
+    key = 'UniProt ID' if database == 'refseq' else 'RefSeq ID'
+    symbol_rows, symbols, xref_rows, xrefs = [], [], [], []
+    for row, entry in enumerate(data.values()):
+        # read once, the entries of the snapshots hand out a new list each time, see records.Entry
+        entry_symbols = entry['symbol']
+        symbol_rows.extend([row] * len(entry_symbols))
+        symbols.extend(entry_symbols)
+        targets = entry[key]
+        if database == 'refseq':
+            targets = [targets] if targets else []
+        xref_rows.extend([row] * len(targets))
+        xrefs.extend(targets)
+    if sequences is not None:
+        lengths, hashes = _sequence_columns(sequences)
+    else:
+        lengths, hashes = _hash_columns([hash_sequence(entry['sequence']) for entry in data.values()])
+    return Columns(pd.Index(list(data)), lengths, hashes, np.array(symbol_rows, dtype=np.int64),
+                   np.array(symbols, dtype=object), np.array(xref_rows, dtype=np.int64), np.array(xrefs, dtype=object))
+
+
+def _sequence_columns(sequences: SequenceFile) -> Tuple[np.ndarray, np.ndarray]:
+    """Reads the lengths and hashes of all sequences from the index and checksum files of a sequence file."""
+    lengths = np.frombuffer(sequences.index, dtype=np.int64)[1::2]
+    if sequences.checksums is None:
+        return lengths, _hash_columns([sequences.hash(row) for row in range(len(sequences))])[1]
+    return lengths, np.frombuffer(sequences.checksums, dtype=HASH_DTYPE)
+
+
+def _hash_columns(hashes: List[Optional[SequenceHash]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Converts SequenceHash objects into the lengths and hashes columns."""
+    lengths = np.array([-1 if sequence_hash is None else sequence_hash.length for sequence_hash in hashes],
+                       dtype=np.int64)
+    records = np.zeros(len(hashes), dtype=HASH_DTYPE)
+    for row, sequence_hash in enumerate(hashes):
+        if sequence_hash is not None:
+            records[row] = (int(sequence_hash.crc64, 16), int.from_bytes(sequence_hash.digest[:8], 'big'),
+                            int.from_bytes(sequence_hash.digest[8:], 'big'))
+    return lengths, records
+
+
+def store_columns(database: str, path: Optional[str] = None) -> Columns:
+    """
+    Reads the columns of a database from the SQLite store, for UniProt including TrEMBL entries. If an accession ID
+    is stored under several of these, the first entry is used, as by store.get_entry().
+    :param str database: either 'refseq' or 'uniprot'
+    :param str path: the filepath of the SQLite file, by default that of the store
+    """
+    conn = dbinspector.store.connect(*([path] if path else []))
+    condition, sources = dbinspector.store._in(database)
+    entries = pd.read_sql_query(f'SELECT database, accession, length, crc64, digest FROM entries WHERE {condition} '
+                                'ORDER BY rowid', conn, params=sources)
+    entries = entries.drop_duplicates('accession').reset_index(drop=True)
+    present = entries['length'].notna().to_numpy()
+    records = np.zeros(len(entries), dtype=HASH_DTYPE)
+    records['crc64'][present] = [int(crc, 16) for crc in entries['crc64'][present]]
+    digests = np.frombuffer(b''.join(entries['digest'][present]), dtype='>u8').reshape(-1, 2)
+    records['digest_high'][present], records['digest_low'][present] = digests[:, 0], digests[:, 1]
+    keys = entries[['database', 'accession']].assign(row=np.arange(len(entries)))
+    columns = []
+    for table, value in [('symbols', 'symbol'), ('xrefs', 'target')]:
+        rows = pd.read_sql_query(f'SELECT database, accession, {value} FROM {table} WHERE {condition} '
+                                 'ORDER BY position', conn, params=sources)
+        rows = rows.merge(keys, on=['database', 'accession']).sort_values('row', kind='stable')
+        columns.extend([rows['row'].to_numpy(dtype=np.int64), rows[value].to_numpy(dtype=object)])
+    return Columns(pd.Index(entries['accession']), entries['length'].fillna(-1).to_numpy(dtype=np.int64), records,
+                   *columns)
@@ -0,0 +1,178 @@
+import os
+import os.path as osp
+from dbinspector.startup import DATA
+from dbinspector.utils import worker_context
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from time import time
+from typing import Optional, Dict, List, Iterator, NamedTuple, Union, BinaryIO, Tuple, TYPE_CHECKING
+
+import gzip
+
+if TYPE_CHECKING:
+    from lxml import etree
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+NAMESPACE = '{http://uniprot.org/uniprot}'
+ENTRY = NAMESPACE + 'entry'
+ACCESSION = NAMESPACE + 'accession'
+GENE = NAMESPACE + 'gene'
+NAME = NAMESPACE + 'name'
+DBREFERENCE = NAMESPACE + 'dbReference'
+SEQUENCE = NAMESPACE + 'sequence'
+
+UNIPROT_XML = osp.join(DATA, 'uniprot_sprot_human.xml.gz')
+# unreviewed entries, optional
+TREMBL_XML = osp.join(DATA, 'uniprot_trembl_human.xml.gz')
+# uncompressed bytes of XML handed to a worker process at a time
+BATCH_SIZE = 8 * 1024 * 1024
+ENTRY_START, ENTRY_END, ROOT_END = b'<entry', b'</entry>', b'</uniprot>'
+
+
+class UniProtRecord(NamedTuple):
+    """The information parsed from a single UniProt entry."""
+    accession: str
+    symbols: List[str]
+    symbol_types: Dict[str, str]
+    refseq_ids: List[str]
+    sequence: Optional[str]
+    checksum: Optional[str]
+
+
+def iter_uniprot(source: Union[str, BinaryIO]) -> Iterator[UniProtRecord]:
+    """
+    Streams the entries of a UniProt XML file. The parser only reports the end of each <entry>, when the entry is
+    complete; the entry is read in one pass and then removed from the tree, so memory use does not grow with the file.
+    :param source: the filepath of the gzipped XML file, or an open binary file with the (uncompressed) XML
+    :return: iterator of UniProtRecord, one per entry, in the order of the file
+    """
+    if isinstance(source, str):
+        with gzip.open(source, 'rb') as filehandle:
+            yield from iter_uniprot(filehandle)
+        return
+    # lxml is only imported for parsing, lookups of stored entries only need UniProtRecord
+    from lxml import etree
+    for _, entry in etree.iterparse(source, events=('end',), tag=ENTRY):
+        yield read_entry(entry)
+        # delete the entry and the preceding ones to save memory
+        entry.clear()
+        while entry.getprevious() is not None:
+            del entry.getparent()[0]
+
+
+def read_entry(entry: 'etree._Element') -> UniProtRecord:
+    """
+    Reads a complete <entry> element. The entry is listed under its last <accession>. Symbols are the primary and
+    synonym names of its genes; RefSeq IDs and symbols are kept once each, in the order of their first occurrence.
+    :param entry: the <entry> element
+    :return: the record of the entry
+    """
+    accession, sequence, checksum = None, None, None
+    symbols, symbol_types, refseq_ids, seen_ids = [], {}, [], set()
+    for elem in entry.iter(ACCESSION, GENE, DBREFERENCE, SEQUENCE):
+        tag = elem.tag
+        if tag == ACCESSION:
+            accession = elem.text
+        elif tag == GENE:
+            for name in elem.iterchildren(NAME):
+                symbol_type = name.get('type')
+                if (symbol_type == 'primary' or symbol_type == 'synonym') and name.text not in symbol_types:
+                    symbols.append(name.text)
+                    symbol_types[name.text] = symbol_type
+        elif tag == DBREFERENCE:
+            if elem.get('type') == 'RefSeq':
+                refseq_id = elem.get('id')
+                if refseq_id not in seen_ids:
+                    seen_ids.add(refseq_id)
+                    refseq_ids.append(refseq_id)
+        else:
+            # the sequence of the entry follows those referenced by isoforms, which have no text
+            sequence = elem.text
+            checksum = elem.get('checksum')
+    return UniProtRecord(accession, symbols, symbol_types, refseq_ids, sequence, checksum)
+
+
+def iter_batches(filehandle: BinaryIO, batch_size: int = BATCH_SIZE) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Cuts an uncompressed UniProt XML stream into batches of complete entries.
+    :param filehandle: the open binary file with the XML
+    :param int batch_size: the approximate size of a batch in bytes
+    :return: iterator of (the XML up to and including the start tag of the root element, a batch of <entry> elements)
+    """
+    header, buffer = None, b''
+    while True:
+        block = filehandle.read(batch_size)
+        buffer += block
+        if header is None:
+            start = buffer.find(ENTRY_START)
+            if start < 0:
+                if not block:
+                    return
+                continue
+            header, buffer = buffer[:start], buffer[start:]
+        cut = buffer.rfind(ENTRY_END)
+        if cut >= 0 and (len(buffer) >= batch_size or not block):
+            cut += len(ENTRY_END)
+            yield header, buffer[:cut]
+            buffer = buffer[cut:]
+        if not block:
+            return
+
+
+def parse_batch(header: bytes, batch: bytes) -> List[UniProtRecord]:
+    """Parses a batch of entries as cut by iter_batches(), run by the worker processes of iter_uniprot_parallel()."""
+    return list(iter_uniprot(BytesIO(header + batch + ROOT_END)))
+
+
+def iter_uniprot_parallel(path: Union[str, BinaryIO], jobs: int,
+                          batch_size: int = BATCH_SIZE) -> Iterator[UniProtRecord]:
+    """
+    Streams the entries of a UniProt XML file like iter_uniprot(), parsed by several worker processes: the file is
+    decompressed and cut into batches of complete entries here, the workers parse the batches and the records are
+    returned in the order of the file. At most two batches per worker are held at a time.
+    :param path: the filepath of the gzipped XML file, or the open gzipped file
+    :param int jobs: the number of worker processes
+    :param int batch_size: the approximate size of a batch in bytes
+    :return: iterator of UniProtRecord, one per entry, in the order of the file
+    """
+    with gzip.open(path, 'rb') as filehandle, \
+            ProcessPoolExecutor(max_workers=jobs, mp_context=worker_context()) as executor:
+        pending = deque()
+        for header, batch in iter_batches(filehandle, batch_size):
+            pending.append(executor.submit(parse_batch, header, batch))
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def benchmark(path: str = UNIPROT_XML, jobs: int = 1) -> Dict[str, float]:
+    """
+    Measures the throughput of the UniProt parser on a gzipped XML file.
+    :param str path: the filepath of the gzipped XML file
+    :param int jobs: the number of worker processes, see iter_uniprot_parallel()
+    :return: dictionary with the number of 'entries', the 'seconds' taken, 'entries/s' and 'MB/s' of the compressed
+        and uncompressed ('MB/s XML') file
+    """
+    t0 = time()
+    if jobs > 1:
+        entries = sum(1 for _ in iter_uniprot_parallel(path, jobs))
+    else:
+        entries = sum(1 for _ in iter_uniprot(path))
+    seconds = time() - t0
+    with gzip.open(path, 'rb') as filehandle:
+        xml_size = filehandle.seek(0, 2)
+    result = {'entries': entries, 'seconds': seconds, 'entries/s': entries / seconds,
+              'MB/s': osp.getsize(path) / 1e6 / seconds, 'MB/s XML': xml_size / 1e6 / seconds}
+    logger.info(f"Parsed {entries} UniProt entries in {seconds:.2f} seconds: {result['entries/s']:.0f} entries/s, "
+                f"{result['MB/s']:.1f} MB/s ({result['MB/s XML']:.1f} MB/s uncompressed).")
+    return result
+
+
+if __name__ == '__main__':
+    print(benchmark())
+    print(benchmark(jobs=os.cpu_count()))
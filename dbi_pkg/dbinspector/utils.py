@@ -1,13 +1,15 @@
-from urllib import request
 import logging
 import os.path as osp
-import ftputil
 import os
 import re
-from typing import Union, Dict
+import multiprocessing
+from multiprocessing.context import BaseContext
+from contextlib import contextmanager
+from typing import Union, Dict, Iterator, Tuple
 import time
 from dbinspector.exceptions import FileMissingError
 import gzip
+import sys
 
 
 logger = logging.getLogger(__name__)
@@ -20,10 +22,8 @@ def get_uniprot(url: str, download_dir: str) -> None:
     :param str download_dir: the place where the file should be stored
     :return: None; alternatively downloads the data in specified location
     """
-    filename = osp.basename(url)
-    logger.info(f'Beginning download from {filename}...')
-    request.urlretrieve(url, osp.join(download_dir, filename))
-    logger.info(f'...Finished file download for {filename}.')
+    from dbinspector.download import Transfer, download_files  # ftputil is only imported for downloads
+    download_files([Transfer(url, download_dir)])
 
 
 def get_ncbi(url: str, download_dir: str) -> None:
@@ -32,14 +32,32 @@ def get_ncbi(url: str, download_dir: str) -> None:
     :param str download_dir: the place where the file should be stored
     :return: None; alternatively downloads the data in specified location
     """
-    url = url.replace('https://', '')
-    hostdir = osp.dirname(url).replace('ftp.ncbi.nlm.nih.gov', '') + '/'
-    filename = osp.basename(url)
-    host = ftputil.FTPHost('ftp.ncbi.nlm.nih.gov', 'anonymous', 'password')
-    host.chdir(hostdir)
-    logger.info(f'Beginning download from {filename}...')
-    host.download(filename, osp.join(download_dir, filename))
-    logger.info(f'...Finished file download for {filename}.')
+    from dbinspector.download import Transfer, download_files
+    download_files([Transfer(url.replace('https://', 'ftp://'), download_dir)])
+
+
+def iter_fasta(filename: str, prefix: str = 'NP_') -> Iterator[Tuple[str, str]]:
+    """
+    Streams the records of a gzipped file containing multiple FASTA sequences, one record at a time.
+    :param str filename: should be the name of the file to be read
+    :param str prefix: only records whose accession starts with this prefix are returned, the sequence lines of all
+        other records are skipped without being collected
+    :return: iterator of (accession, sequence)
+    """
+    with gzip.open(filename, 'rt') as fc:
+        ref_id, lines = None, []
+        for line in fc:
+            if line.startswith('>'):
+                if ref_id is not None:
+                    yield ref_id, ''.join(lines)
+                ref_id = line[1:].split(maxsplit=1)[0]
+                if not ref_id.startswith(prefix):
+                    ref_id = None
+                lines = []
+            elif ref_id is not None:
+                lines.append(line.rstrip())
+        if ref_id is not None:
+            yield ref_id, ''.join(lines)
 
 
 def read_fasta(filename: str) -> Dict[str, str]:
@@ -48,16 +66,7 @@ def read_fasta(filename: str) -> Dict[str, str]:
     :param str filename: should be the name of the open file to be read
     :return: dict containing the header: the sequence
     """
-    seq_dict = {}
-    with gzip.open(filename, 'rt') as fc:
-        all_lines = str(fc.read())
-        seqs = all_lines.split('>')
-        for seq in seqs[1:]:
-            seq = seq.strip('"').split('\n')
-            ref_id, prot_name = seq[0].replace(' [Homo sapiens]', '').split(' ', 1)
-            if "NP_" in ref_id:
-                seq_dict[ref_id] = ''.join(seq[1:])
-        return seq_dict
+    return dict(iter_fasta(filename))
 
 
 def clear_dir(directory: str) -> None:
@@ -120,3 +129,64 @@ def check_data_age(file_path: str, data_name: str) -> int:
     else:
         logger.warning(f"The age of {file_path} can not be determined because this file or directory does not exist.")
         raise FileMissingError
+
+
+def peak_rss(reset: bool = False) -> int:
+    """
+    Returns the peak resident memory (high water mark) of this process in bytes, read from /proc on Linux and from
+    getrusage elsewhere, 0 where neither is available (Windows).
+    :param bool reset: reset the high water mark to the current memory use afterwards, only possible on Linux
+    :return: peak memory in bytes
+    """
+    try:
+        with open('/proc/self/status') as filehandle:
+            peak = next(int(line.split()[1]) * 1024 for line in filehandle if line.startswith('VmHWM:'))
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as filehandle:
+                filehandle.write('5')
+        return peak
+    except (OSError, StopIteration):
+        try:
+            import resource  # only available on Unix
+        except ImportError:
+            return 0
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def worker_context() -> BaseContext:
+    """
+    Returns the multiprocessing context for the worker processes of the parsers. The parse stages run in threads, so
+    the workers are not forked from this process while another thread may hold a lock (e.g. of logging or SQLite):
+    they are started by a fork server where there is one, and spawned otherwise.
+    """
+    return multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                                       else 'spawn')
+
+
+@contextmanager
+def measure_stage(name: str, peak: bool = True) -> Iterator[Dict[str, float]]:
+    """
+    Measures the wall time and peak resident memory of a stage of work and logs them once the stage is done.
+    The peak is that of the whole process since the stage started, so it is only measured for a stage that runs on
+    its own; where the high water mark cannot be reset (outside Linux), it is the peak of the process so far. Worker
+    processes are not included.
+    :param str name: the name of the stage, for the log
+    :param bool peak: measure the peak memory, which resets the high water mark of the process
+    :return: dictionary that holds the 'seconds' and, with peak, the 'peak RSS MB' once the stage is done
+    """
+    if peak:
+        peak_rss(reset=True)
+    report = {}
+    t0 = time.time()
+    try:
+        yield report
+    finally:
+        report['seconds'] = time.time() - t0
+        if peak:
+            report['peak RSS MB'] = peak_rss() / 1e6
+            logger.info(f"Stage {name} took {report['seconds']:.2f} seconds, "
+                        f"peak memory {report['peak RSS MB']:.1f} MB.")
+        else:
+            logger.info(f"Stage {name} took {report['seconds']:.2f} seconds.")
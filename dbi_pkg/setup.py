@@ -18,7 +18,7 @@ requirements = ['click',
                 'tox',
                 'tqdm']
 
-test_requirements = ['pytest>=3', ]
+test_requirements = ['pytest>=3', 'pyftpdlib', ]
 
 setup(
     author="Lauren D., Rebeca F., Simon M., Maren P.",
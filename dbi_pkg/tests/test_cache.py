@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from dbinspector.cache import ResultCache
+
+
+class TestResultCache:
+    """Test class for the cache of rendered results."""
+
+    def test_lru(self):
+        """Checks that the least recently used results are dropped and all of them once the version changes."""
+        cache = ResultCache(maxsize=2)
+        assert cache.get(1, 'a', lambda: 'A') == 'A'
+        cache.get(1, 'b', lambda: 'B')
+        assert cache.get(1, 'a', lambda: 'recomputed') == 'A'
+        cache.get(1, 'c', lambda: 'C')
+        assert list(cache.results) == ['a', 'c']
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert cache.get(2, 'a', lambda: 'A2') == 'A2'
+        assert list(cache.results) == ['a']
+
+    def test_errors(self):
+        """Checks that errors are raised and not cached."""
+        cache = ResultCache()
+
+        def fail():
+            raise KeyError('a')
+
+        with pytest.raises(KeyError):
+            cache.get(1, 'a', fail)
+        assert cache.get(1, 'a', lambda: 'A') == 'A'
+
+    def test_coalescing(self):
+        """Checks that concurrent requests for the same result share one computation."""
+        cache = ResultCache()
+        started, release, calls, results = threading.Event(), threading.Event(), [], []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'A'
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get(1, 'a', compute))) for _ in range(5)]
+        threads[0].start()
+        assert started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while cache.coalesced < 4:
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert len(calls) == 1 and results == ['A'] * 5
@@ -0,0 +1,81 @@
+import socket
+import threading
+
+import pandas as pd
+import pytest
+
+import dbinspector.startup
+from dbinspector.store import write_store
+from dbinspector.daemon import make_server, DaemonClient
+from dbinspector.cli import batch_records
+from dbinspector.exceptions import DaemonUnavailableError, QueryNotFoundError, InputError
+
+from tests.test_store import UNIPROT_DATA, REFSEQ_DATA
+
+
+class TestDaemon:
+    """Test class for the daemon answering requests over a Unix domain socket."""
+
+    def test_requests(self, tmp_path, monkeypatch):
+        """Checks that the daemon answers compare, summary and lookup requests and raises their errors again."""
+        monkeypatch.setattr(dbinspector.startup, 'SQLITE', str(tmp_path / 'test.sqlite'))
+        monkeypatch.setattr(dbinspector.startup, 'SUMMARY', str(tmp_path / 'summary.json'))
+        write_store(UNIPROT_DATA, REFSEQ_DATA)
+        monkeypatch.setattr(dbinspector.startup, 'BACKEND', 'sqlite')
+        path = str(tmp_path / 'test.sock')
+        server = make_server(path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with DaemonClient(path) as client:
+                comparison = client.request('compare', uniprot_id='upid4')
+                assert list(comparison) == ['UniProt entry 1', 'RefSeq entry 1', 'RefSeq entry 2']
+                assert comparison['RefSeq entry 2']['RefSeq ID'] == ['rsid5']
+                text, tsv = client.request('compare', render=True, uniprot_id='upid4')
+                assert text.splitlines()[0].endswith('UniProt entry 1 RefSeq entry 1 RefSeq entry 2')
+                assert tsv.startswith('\tUniProt entry 1\t')
+                assert list(pd.DataFrame(**client.request('summary'))['Number of matches']) == [4, 7, 7, 3, 5]
+                assert client.request('lookup', symbol='EIGHT')['RefSeq'][0]['RefSeq ID'] == 'rsid8'
+                with pytest.raises(QueryNotFoundError):
+                    client.request('compare', symbol='NOTHING')
+                with pytest.raises(InputError):
+                    client.request('unknown')
+                # the connection is still usable after an error
+                records = client.request('compare_batch', queries=['EIGHT', 'NOTHING'])
+                assert [record['found'] for record in records] == [True, False]
+            # the CLI sends the queries of compare --input to the daemon in batches
+            assert [record['found'] for record in batch_records(['EIGHT', 'NOTHING'], path)] == [True, False]
+            # a second daemon cannot listen on the same socket
+            with pytest.raises(InputError):
+                make_server(path)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_unavailable(self, tmp_path):
+        """Checks that a missing daemon or one left behind without a process is reported as unavailable."""
+        path = str(tmp_path / 'test.sock')
+        with pytest.raises(DaemonUnavailableError):
+            DaemonClient(path)
+        server = make_server(path)
+        server.server_close()
+        with pytest.raises(DaemonUnavailableError):
+            DaemonClient(path)
+        # the stale socket is replaced by the next daemon
+        make_server(path).server_close()
+
+    def test_timeout(self, tmp_path):
+        """Checks that a daemon which does not answer a request in time is reported as unavailable."""
+        path = str(tmp_path / 'test.sock')
+        # the connection is accepted by the listening socket, but nothing ever answers it
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen()
+        try:
+            client = DaemonClient(path, timeout=0.1)
+            with pytest.raises(DaemonUnavailableError):
+                client.request('summary')
+            client.close()
+        finally:
+            listener.close()
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from dbinspector.download import Transfer, FTPSessions, download_files
+from dbinspector.exceptions import DownloadError
+
+CONTENT = {f'file{i}.txt': bytes(range(256)) * 1000 * i for i in range(1, 5)}
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files of a directory, honouring 'Range: bytes=<offset>-' headers like the download servers."""
+
+    def send_head(self):
+        range_header = self.headers.get('Range')
+        if not range_header:
+            return super().send_head()
+        path = self.translate_path(self.path)
+        offset, size = int(range_header[len('bytes='):-1]), os.path.getsize(path)
+        if offset >= size:
+            self.send_error(416)
+            return None
+        filehandle = open(path, 'rb')
+        filehandle.seek(offset)
+        self.send_response(206)
+        self.send_header('Content-Length', str(size - offset))
+        self.send_header('Content-Range', f'bytes {offset}-{size - 1}/{size}')
+        self.end_headers()
+        return filehandle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """Directory with the remote files."""
+    remote_dir = tmp_path / 'remote'
+    remote_dir.mkdir()
+    for filename, content in CONTENT.items():
+        (remote_dir / filename).write_bytes(content)
+    return remote_dir
+
+
+@pytest.fixture
+def http_server(remote):
+    """Local HTTP server serving the remote files, yields its base URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(RangeRequestHandler, directory=str(remote)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ftp_server(remote):
+    """Local anonymous FTP server serving the remote files, yields its base URL."""
+    authorizers = pytest.importorskip('pyftpdlib.authorizers')
+    handlers = pytest.importorskip('pyftpdlib.handlers')
+    servers = pytest.importorskip('pyftpdlib.servers')
+    authorizer = authorizers.DummyAuthorizer()
+    authorizer.add_anonymous(str(remote))
+    handler = type('Handler', (handlers.FTPHandler,), {'authorizer': authorizer})
+    server = servers.ThreadedFTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'timeout': 0.1}, daemon=True)
+    thread.start()
+    yield f'ftp://127.0.0.1:{server.address[1]}/'
+    server.close_all()
+
+
+class TestDownload:
+    """Test class for the download manager."""
+
+    def test_http_download(self, http_server, tmp_path):
+        """Checks that several files are downloaded concurrently and reported."""
+        local = tmp_path / 'local'
+        reports = download_files([Transfer(http_server + filename, str(local)) for filename in CONTENT],
+                                 max_connections=2)
+        assert [report['file'] for report in reports] == [str(local / filename) for filename in CONTENT]
+        assert [report['bytes'] for report in reports] == [len(content) for content in CONTENT.values()]
+        assert all(report['resumed from'] == 0 and report['MB/s'] >= 0 for report in reports)
+        for filename, content in CONTENT.items():
+            assert (local / filename).read_bytes() == content
+        # no partial files are left behind
+        assert sorted(os.listdir(local)) == sorted(CONTENT)
+
+    def test_progress(self, http_server, tmp_path):
+        """Checks that the bytes downloaded of each file are reported to the progress callback."""
+        events = []
+        download_files([Transfer(http_server + filename, str(tmp_path)) for filename in CONTENT],
+                       progress=events.append)
+        for filename, content in CONTENT.items():
+            done = [event['done'] for event in events if event['task'] == filename]
+            assert done == sorted(done) and done[-1] == len(content)
+            assert all(event['total'] == len(content) for event in events if event['task'] == filename)
+
+    def test_http_resume(self, http_server, tmp_path):
+        """Checks that a partial file of an interrupted download is continued instead of downloaded again."""
+        local = tmp_path / 'local'
+        local.mkdir()
+        content = CONTENT['file2.txt']
+        (local / 'file2.txt.part').write_bytes(content[:1000])
+        (local / 'file3.txt.part').write_bytes(CONTENT['file3.txt'])
+        reports = download_files([Transfer(http_server + 'file2.txt', str(local)),
+                                  Transfer(http_server + 'file3.txt', str(local))])
+        assert reports[0]['resumed from'] == 1000
+        assert reports[0]['bytes'] == len(content) - 1000
+        assert (local / 'file2.txt').read_bytes() == content
+        # a partial file that is complete already is only renamed
+        assert reports[1]['bytes'] == 0
+        assert (local / 'file3.txt').read_bytes() == CONTENT['file3.txt']
+        assert sorted(os.listdir(local)) == ['file2.txt', 'file3.txt']
+
+    def test_ftp_download(self, ftp_server, tmp_path):
+        """Checks that FTP downloads reuse the sessions of a host and resume partial files."""
+        local = tmp_path / 'local'
+        local.mkdir()
+        (local / 'file4.txt.part').write_bytes(CONTENT['file4.txt'][:5000])
+        sessions = FTPSessions()
+        try:
+            reports = download_files([Transfer(ftp_server + filename, str(local)) for filename in CONTENT],
+                                     max_connections=2, sessions=sessions)
+            # at most one session per connection is opened and kept for the next transfers
+            assert 1 <= sum(len(hosts) for hosts in sessions._idle.values()) <= 2
+        finally:
+            sessions.close()
+        assert reports[3]['resumed from'] == 5000
+        for filename, content in CONTENT.items():
+            assert (local / filename).read_bytes() == content
+        assert sorted(os.listdir(local)) == sorted(CONTENT)
+
+    def test_refresh(self, http_server, remote, tmp_path):
+        """Checks that only files which changed upstream are downloaded again, and verified against their md5."""
+        local, manifest = tmp_path / 'local', str(tmp_path / 'manifest.json')
+        (remote / 'md5sums.txt').write_text(''.join(f'{hashlib.md5(content).hexdigest()}  ./{filename}\n'
+                                                    for filename, content in CONTENT.items()))
+        transfers = [Transfer(http_server + filename, str(local), http_server + 'md5sums.txt') for filename in CONTENT]
+        reports = download_files(transfers, manifest_path=manifest)
+        assert not any(report['skipped'] for report in reports)
+        reports = download_files(transfers, manifest_path=manifest)
+        assert all(report['skipped'] for report in reports)
+        # a file changes upstream
+        (remote / 'file2.txt').write_bytes(b'changed')
+        os.utime(remote / 'file2.txt', (0, 0))
+        (remote / 'md5sums.txt').write_text(f'{hashlib.md5(b"changed").hexdigest()}  ./file2.txt\n')
+        reports = download_files(transfers, manifest_path=manifest)
+        assert [report['skipped'] for report in reports] == [True, False, True, True]
+        assert (local / 'file2.txt').read_bytes() == b'changed'
+
+    def test_refresh_corrupted(self, http_server, remote, tmp_path):
+        """Checks that a download which does not match its published md5 is rejected."""
+        local, manifest = tmp_path / 'local', str(tmp_path / 'manifest.json')
+        (remote / 'file1.txt.md5').write_text(hashlib.md5(b'other content').hexdigest())
+        with pytest.raises(DownloadError):
+            download_files([Transfer(http_server + 'file1.txt', str(local), http_server + 'file1.txt.md5')],
+                           manifest_path=manifest)
+        assert not (local / 'file1.txt').exists()
+
+    def test_refresh_corrupted_update(self, http_server, remote, tmp_path):
+        """Checks that a corrupted download of a changed file keeps the previous file and its manifest record."""
+        local, manifest = tmp_path / 'local', str(tmp_path / 'manifest.json')
+        (remote / 'file1.txt.md5').write_text(hashlib.md5(CONTENT['file1.txt']).hexdigest())
+        transfers = [Transfer(http_server + 'file1.txt', str(local), http_server + 'file1.txt.md5')]
+        download_files(transfers, manifest_path=manifest)
+        with open(manifest) as filehandle:
+            records = json.load(filehandle)
+        (remote / 'file1.txt').write_bytes(b'changed')
+        os.utime(remote / 'file1.txt', (0, 0))
+        with pytest.raises(DownloadError):
+            download_files(transfers, manifest_path=manifest)
+        assert (local / 'file1.txt').read_bytes() == CONTENT['file1.txt']
+        assert os.listdir(local) == ['file1.txt']
+        with open(manifest) as filehandle:
+            assert json.load(filehandle) == records
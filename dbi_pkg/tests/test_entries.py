@@ -0,0 +1,47 @@
+import json
+
+import dbinspector.entries
+from dbinspector.entries import EntryWriter, iter_entries, read_entry_at
+
+DATA = {'rsid1': {'symbol': ['ONE'], 'UniProt ID': 'upid1'},
+        'rsid2': {'symbol': [], 'UniProt ID': None},
+        'rsid3': {'symbol': ['TRÊS', 'THREE'], 'UniProt ID': 'upid3'}}
+
+
+class TestEntries:
+    """Test class for the streamed parsed json file."""
+
+    def test_entry_writer(self, tmp_path, monkeypatch):
+        """Checks that the streamed file is valid json with one entry per line, and that entries are read by row."""
+        path, offset_path = str(tmp_path / 'refseq.json'), str(tmp_path / 'refseq.offsets')
+        with EntryWriter(path, offset_path) as writer:
+            for acc, entry in DATA.items():
+                writer.add(acc, entry)
+            assert writer.close() == 3
+        with open(path) as filehandle:
+            assert json.load(filehandle) == DATA
+        assert list(iter_entries(path)) == list(DATA.items())
+        monkeypatch.setitem(dbinspector.entries.PARSED_FILES, 'refseq', path)
+        monkeypatch.setitem(dbinspector.entries.OFFSET_FILES, 'refseq', offset_path)
+        assert [read_entry_at('refseq', row) for row in [2, 0, 1]] == [(acc, DATA[acc]) for acc in
+                                                                       ['rsid3', 'rsid1', 'rsid2']]
+
+    def test_empty_and_discarded(self, tmp_path):
+        """Checks that a file without entries is valid json and that a failed write leaves no files behind."""
+        path, offset_path = str(tmp_path / 'test.json'), str(tmp_path / 'test.offsets')
+        with EntryWriter(path, offset_path) as writer:
+            writer.close()
+        assert list(iter_entries(path)) == []
+        try:
+            with EntryWriter(str(tmp_path / 'failed.json'), str(tmp_path / 'failed.offsets')) as writer:
+                writer.add('rsid1', DATA['rsid1'])
+                raise ValueError
+        except ValueError:
+            pass
+        assert sorted(p.name for p in tmp_path.iterdir()) == ['test.json', 'test.offsets']
+
+    def test_iter_entries_single_line(self, tmp_path):
+        """Checks that parsed json files written in one piece are still read."""
+        path = tmp_path / 'old.json'
+        path.write_text(json.dumps(DATA))
+        assert list(iter_entries(str(path))) == list(DATA.items())
@@ -0,0 +1,47 @@
+import os
+
+from dbinspector.fingerprints import Fingerprints, fingerprint
+
+
+class TestFingerprints:
+    """Test class for the fingerprints of the parse stages."""
+
+    def test_fingerprint(self, tmp_path):
+        """Checks that a fingerprint consists of size and modification time."""
+        path = tmp_path / 'input.txt'
+        assert fingerprint(str(path)) is None
+        path.write_text('input')
+        assert fingerprint(str(path)) == [5, os.stat(path).st_mtime_ns]
+
+    def test_changed(self, tmp_path):
+        """Checks that a stage only has to run again if one of its inputs or outputs changed."""
+        inputs, outputs = [str(tmp_path / 'input.txt')], [str(tmp_path / 'output.txt')]
+        (tmp_path / 'input.txt').write_text('input')
+        fingerprints = Fingerprints(str(tmp_path / 'fingerprints.json'))
+        assert fingerprints.changed('stage', inputs, outputs)
+        (tmp_path / 'output.txt').write_text('output')
+        fingerprints.record('stage', inputs, outputs)
+        assert not fingerprints.changed('stage', inputs, outputs)
+        # the fingerprints are saved
+        assert not Fingerprints(str(tmp_path / 'fingerprints.json')).changed('stage', inputs, outputs)
+        # a changed input
+        os.utime(tmp_path / 'input.txt', ns=(0, 0))
+        assert fingerprints.changed('stage', inputs, outputs)
+        fingerprints.record('stage', inputs, outputs)
+        # a missing output
+        os.remove(tmp_path / 'output.txt')
+        assert fingerprints.changed('stage', inputs, outputs)
+        fingerprints.clear()
+        assert fingerprints.changed('stage', inputs, inputs)
+
+    def test_forget(self, tmp_path):
+        """Checks that a forgotten stage has to run again and the other stages do not."""
+        inputs = [str(tmp_path / 'input.txt')]
+        (tmp_path / 'input.txt').write_text('input')
+        fingerprints = Fingerprints(str(tmp_path / 'fingerprints.json'))
+        fingerprints.record('stage', inputs, [])
+        fingerprints.record('other', inputs, [])
+        fingerprints.forget('stage')
+        fingerprints = Fingerprints(str(tmp_path / 'fingerprints.json'))
+        assert fingerprints.changed('stage', inputs, [])
+        assert not fingerprints.changed('other', inputs, [])
@@ -0,0 +1,72 @@
+import json
+import os
+import os.path as osp
+import subprocess
+import sys
+import threading
+
+import dbinspector.startup
+from dbinspector.store import write_store
+from dbinspector.daemon import make_server
+
+from tests.test_store import UNIPROT_DATA, REFSEQ_DATA
+
+# seconds which importing and running the CLI may take for the help and for a command answered by the daemon
+IMPORT_BUDGET = 1.0
+# modules which only the commands doing the work may import
+HEAVY_MODULES = ['pandas', 'numpy', 'lxml', 'ftputil', 'tqdm']
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from dbinspector.cli import cli
+try:
+    cli({args!r}, standalone_mode=False)
+finally:
+    print(json.dumps({{'seconds': time.perf_counter() - start,
+                      'heavy': [module for module in {heavy!r} if module in sys.modules]}}))
+'''
+
+
+def run_cli(args, cache):
+    """Runs the CLI in a new interpreter with its own cache directory, returns its output and the report."""
+    process = subprocess.run([sys.executable, '-c', SCRIPT.format(args=args, heavy=HEAVY_MODULES)],
+                             cwd=osp.dirname(osp.dirname(osp.abspath(__file__))), capture_output=True, text=True,
+                             env={**os.environ, 'DBINSPECTOR_CACHE': cache}, check=True)
+    *output, report = process.stdout.splitlines()
+    return '\n'.join(output), json.loads(report)
+
+
+class TestImportTime:
+    """Test class for the start-up time of the CLI."""
+
+    def test_help(self, tmp_path):
+        """Checks that the help of the CLI and its commands neither imports the heavy dependencies nor creates the
+        cache directory."""
+        cache = str(tmp_path / 'cache')
+        output, report = run_cli(['--help'], cache)
+        assert 'compare' in output
+        assert report['heavy'] == []
+        assert report['seconds'] < IMPORT_BUDGET
+        assert not osp.exists(cache)
+        output, report = run_cli(['compare', '--help'], cache)
+        assert '--query' in output and report['heavy'] == []
+        assert not osp.exists(cache)
+
+    def test_daemon_compare(self, tmp_path, monkeypatch):
+        """Checks that a comparison answered by the daemon does not import the heavy dependencies in the CLI."""
+        monkeypatch.setattr(dbinspector.startup, 'SQLITE', str(tmp_path / 'test.sqlite'))
+        monkeypatch.setattr(dbinspector.startup, 'BACKEND', 'sqlite')
+        write_store(UNIPROT_DATA, REFSEQ_DATA)
+        path = str(tmp_path / 'test.sock')
+        server = make_server(path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            output, report = run_cli(['compare', '-q', 'EIGHT', '-s', path], str(tmp_path / 'cache'))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        assert 'upid8' in output and 'rsid8' in output
+        assert report['heavy'] == []
+        assert report['seconds'] < IMPORT_BUDGET
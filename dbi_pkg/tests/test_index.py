@@ -0,0 +1,22 @@
+from dbinspector.index import build_symbol_index
+
+DATA = {'upid4': {'symbol': ['FOUR', 'CUATRO'], 'RefSeq ID': ['rsid4', 'rsid5'], 'sequence': 'CUATRO44'},
+        'upid7': {'symbol': ['EIGHT'], 'RefSeq ID': [], 'sequence': ''},
+        'upid8': {'symbol': ['Eight', 'OCHO'], 'RefSeq ID': [], 'sequence': ''}}
+
+
+class TestIndex:
+    """Test class for the inverted symbol index."""
+
+    def test_build_symbol_index(self):
+        """Checks that symbols are indexed case-insensitively and keep their type and original spelling."""
+        index = build_symbol_index(DATA, {'upid4': {'FOUR': 'primary', 'CUATRO': 'synonym'},
+                                          'upid8': {'Eight': 'primary', 'OCHO': 'synonym'}})
+        assert set(index) == {'FOUR', 'CUATRO', 'EIGHT', 'OCHO'}
+        assert index['CUATRO'] == [['upid4', 'CUATRO', 'synonym']]
+        assert index['EIGHT'] == [['upid7', 'EIGHT', 'primary'], ['upid8', 'Eight', 'primary']]
+
+    def test_build_symbol_index_without_types(self):
+        """Checks that all symbols are treated as primary if no types are given."""
+        index = build_symbol_index(DATA)
+        assert all(symbol_type == 'primary' for postings in index.values() for _, _, symbol_type in postings)
@@ -0,0 +1,113 @@
+import json
+import subprocess
+import sys
+import threading
+from io import BytesIO
+
+import dbinspector.jobs
+from dbinspector.jobs import ParseJobs
+from dbinspector.progress import Progress, ProgressReader, track
+
+
+class TestJobs:
+    """Test class for the parse jobs run in the background."""
+
+    def test_attach(self, tmp_path):
+        """Checks that a job submitted while another one runs attaches to it and the progress can be polled."""
+        started, release = threading.Event(), threading.Event()
+
+        def parse(progress, **kwargs):
+            progress({'stage': 'uniprot', 'state': 'running'})
+            progress({'task': 'parsing UniProt', 'done': 1000, 'total': None, 'unit': 'entries'})
+            started.set()
+            release.wait(5)
+            progress({'stage': 'uniprot', 'state': 'done'})
+
+        jobs = ParseJobs(parse, str(tmp_path / 'jobs.json'))
+        job, submitted = jobs.submit(jobs=2)
+        assert submitted and job.kwargs == {'jobs': 2}
+        assert started.wait(5)
+        attached, submitted = jobs.submit()
+        assert attached is job and not submitted
+        status = jobs.get(job.id).status()
+        assert status['state'] == 'running' and status['stages'] == {'uniprot': 'running'}
+        assert status['tasks'] == {'parsing UniProt': {'done': 1000, 'total': None, 'unit': 'entries'}}
+        release.set()
+        job.future.result(5)
+        assert jobs.get().status()['state'] == 'done' and job.progress.stages == {'uniprot': 'done'}
+        # a finished job is not attached to
+        assert jobs.submit()[0] is not job
+        jobs.shutdown()
+
+    def test_failed(self, tmp_path):
+        """Checks that the error of a failed job is reported."""
+        def parse(progress):
+            raise RuntimeError('no connection')
+
+        jobs = ParseJobs(parse, str(tmp_path / 'jobs.json'))
+        job, _ = jobs.submit()
+        job.future.result(5)
+        assert job.status()['state'] == 'failed' and job.error == 'no connection'
+        assert job.finished >= job.started
+        assert jobs.get('unknown') is None
+        jobs.shutdown()
+
+    def test_shared(self, tmp_path):
+        """Checks that the jobs of another process are attached to and reported from the shared state."""
+        started, release = threading.Event(), threading.Event()
+
+        def parse(progress, **kwargs):
+            progress({'stage': 'uniprot', 'state': 'running'})
+            started.set()
+            release.wait(5)
+
+        path = str(tmp_path / 'jobs.json')
+        jobs, other = ParseJobs(parse, path), ParseJobs(parse, path)
+        job, _ = jobs.submit()
+        assert started.wait(5)
+        attached, submitted = other.submit()
+        assert not submitted and attached is not job and attached.id == job.id
+        assert other.get().status()['stages'] == {'uniprot': 'running'}
+        release.set()
+        job.future.result(5)
+        assert other.get(job.id).state == 'done' and other.get(job.id).finished == job.finished
+        jobs.shutdown()
+        other.shutdown()
+
+    def test_exited(self, tmp_path):
+        """Checks that a job whose process exited is reported as failed and does not block new jobs."""
+        path = str(tmp_path / 'jobs.json')
+        process = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True,
+                                 text=True, check=True)
+        status = {'id': 'exited', 'state': 'running', 'submitted': 0., 'started': 0., 'finished': None, 'error': None,
+                  'stages': {}, 'tasks': {}, 'updated': 0., 'pid': int(process.stdout)}
+        with open(path, 'w') as filehandle:
+            json.dump({'exited': status}, filehandle)
+        jobs = ParseJobs(lambda progress: None, path)
+        assert jobs.get('exited').state == 'failed'
+        job, submitted = jobs.submit()
+        assert submitted
+        job.future.result(5)
+        jobs.shutdown()
+
+    def test_progress(self):
+        """Checks that the parsers report the entries and the bytes of the file read."""
+        progress = Progress()
+        assert list(track(range(2500), 'entries', progress, every=1000)) == list(range(2500))
+        reader = ProgressReader(BytesIO(b'x' * 3000), 'file', 3000, progress)
+        while reader.read(1000):
+            pass
+        assert progress.status()['tasks'] == {'entries': {'done': 2500, 'total': None, 'unit': 'entries'},
+                                              'file': {'done': 3000, 'total': 3000, 'unit': 'bytes'}}
+
+    def test_without_flock(self, tmp_path, monkeypatch):
+        """Checks that the jobs are still run and attached to within the process where there is no file lock."""
+        monkeypatch.setattr(dbinspector.jobs, 'fcntl', None)
+        release = threading.Event()
+        jobs = ParseJobs(lambda progress: release.wait(5), str(tmp_path / 'jobs.json'))
+        job, submitted = jobs.submit()
+        assert submitted and jobs.submit() == (job, False)
+        release.set()
+        job.future.result(5)
+        assert jobs.get().state == 'done'
+        jobs.shutdown()
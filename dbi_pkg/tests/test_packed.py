@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from dbinspector.packed import ALPHABET, PackedSequence, pack_sequence, unpack_sequence, packed_size
+
+
+class TestPacked:
+    """Test class for the packed amino acid sequences."""
+
+    def test_round_trip(self):
+        """Checks that sequences of any length and residues come back unchanged from their packed form."""
+        rng = random.Random(0)
+        for length in [*range(20), 1000, 34350]:
+            sequence = ''.join(rng.choice(ALPHABET) for _ in range(length))
+            packed = pack_sequence(sequence)
+            assert len(packed) == length and len(packed.data) == packed_size(length)
+            assert str(packed) == unpack_sequence(packed.data, length) == sequence
+
+    def test_alphabet(self):
+        """Checks that all IUPAC codes, the stop and the gap are packed, and other characters rejected."""
+        assert str(pack_sequence('MXUOBZJ*-')) == 'MXUOBZJ*-'
+        for sequence in ['CUATRO44', 'mvls', 'MVLSÄ', 'MV LS']:
+            with pytest.raises(ValueError):
+                pack_sequence(sequence)
+
+    def test_compare(self):
+        """Checks that packed sequences compare and hash like the sequences they hold."""
+        assert pack_sequence('MVLSPADK') == pack_sequence('MVLSPADK')
+        assert pack_sequence('MVLSPADK') != pack_sequence('MVLSPADKA')
+        # 'A' is packed into zero bits, like the padding
+        assert pack_sequence('MVLSPA') != pack_sequence('MVLSP')
+        assert len({pack_sequence('MVLS'), pack_sequence('MVLS'), pack_sequence('')}) == 2
+        assert not pack_sequence('') and pack_sequence('') == PackedSequence(0, b'')
+        assert pack_sequence('MVLS') != 'MVLS'
@@ -1,11 +1,18 @@
 import pytest
 import os.path as osp
+import gzip
 from time import time
 import json
 from dbinspector.startup import DATA, REFSEQ, REFSEQ_FASTA, UNIPROT
 from dbinspector.utils import clear_dir
 from dbinspector.parse import download_data, map_refseq_to_uniprot, map_refseq_to_symbol
-from dbinspector.parse import parse_uniprot, parse_refseq, parse_all
+from dbinspector.parse import parse_uniprot, parse_refseq, parse_all, cache_refseq_shards, index_refseq_shards
+from dbinspector.sequences import SequenceFile, SEQUENCE_FILES, CHECKSUM_FILES
+from dbinspector.entries import OFFSET_FILES
+from dbinspector.snapshot import PARSED_FILES
+from dbinspector.index import SYMBOL_INDEX_FILES
+from dbinspector.uniprot import UniProtRecord
+import dbinspector.parse
 
 
 class TestParse:
@@ -32,18 +39,40 @@ class TestParse:
         """Tests that parsing the uniprot download into json metadata file works"""
         parse_uniprot()
         assert osp.exists(osp.join(UNIPROT, "uniprot.json"))
-        assert osp.getsize(osp.join(UNIPROT, "uniprot.json")) > 13000000
+        assert osp.getsize(osp.join(UNIPROT, "uniprot.json")) > 1000000
+        assert osp.getsize(SEQUENCE_FILES['uniprot'][0]) > 10000000
         with open(osp.join(UNIPROT, "uniprot.json"), 'r') as uniprot_json:
             uniprot_dict = json.load(uniprot_json)
         assert uniprot_dict['Q9BWD0'] == {"symbol": ["ZWINT"],
-                                          "RefSeq ID": ["NP_001005413.1", "NP_008988.2", "NP_127490.1"],
-                                          "sequence": "MEAAETEAEAAALEVLAEVAGILEPVGLQEEAELPAKILVEFVVDSQKKDKLLCSQLQVADFLQ"
-                                                      "NILAQEDTAKGLDPLASEDTSRQKAIAAKEQWKELKATYREHVEAIKIGLTKALTQMEEAQRKR"
-                                                      "TQLREAFEQLQAKKQMAMEKRRAVQNQWQLQQEKHLQHLAEVSAEVRERKTGTQQELDRVFQKL"
-                                                      "GNLKQQAEQERDKLQRYQTFLQLLYTLQGKLLFPEAEAEAENLPDDKPQQPTRPQEQSTGDTMG"
-                                                      "RDPGVSFKAVGLQPAGDVNLP"}
+                                          "RefSeq ID": ["NP_001005413.1", "NP_008988.2", "NP_127490.1"]}
+        sequences = SequenceFile(*SEQUENCE_FILES['uniprot'])
+        assert sequences.get(list(uniprot_dict).index('Q9BWD0')) == (
+            "MEAAETEAEAAALEVLAEVAGILEPVGLQEEAELPAKILVEFVVDSQKKDKLLCSQLQVADFLQ"
+            "NILAQEDTAKGLDPLASEDTSRQKAIAAKEQWKELKATYREHVEAIKIGLTKALTQMEEAQRKR"
+            "TQLREAFEQLQAKKQMAMEKRRAVQNQWQLQQEKHLQHLAEVSAEVRERKTGTQQELDRVFQKL"
+            "GNLKQQAEQERDKLQRYQTFLQLLYTLQGKLLFPEAEAEAENLPDDKPQQPTRPQEQSTGDTMG"
+            "RDPGVSFKAVGLQPAGDVNLP")
         clear_dir(UNIPROT)
 
+    def test_parse_uniprot_duplicates(self, tmp_path, monkeypatch):
+        """Tests that of an accession ID listed twice in the UniProt XML, the first entry is kept"""
+        records = [UniProtRecord('P1', ['ONE'], {'ONE': 'primary'}, ['NP_1.1'], 'MEEP', None),
+                   UniProtRecord('P2', ['TWO'], {'TWO': 'primary'}, [], 'MKKT', None),
+                   UniProtRecord('P1', ['UNO'], {'UNO': 'primary'}, ['NP_9.1'], 'MLLA', None)]
+        monkeypatch.setattr(dbinspector.parse, 'read_uniprot_xml', lambda *args: iter(records))
+        for files in [PARSED_FILES, OFFSET_FILES, CHECKSUM_FILES, SYMBOL_INDEX_FILES]:
+            monkeypatch.setitem(files, 'uniprot', str(tmp_path / osp.basename(files['uniprot'])))
+        monkeypatch.setitem(SEQUENCE_FILES, 'uniprot', tuple(str(tmp_path / osp.basename(path))
+                                                             for path in SEQUENCE_FILES['uniprot']))
+        assert parse_uniprot() == 2
+        with open(PARSED_FILES['uniprot']) as uniprot_json:
+            assert json.load(uniprot_json) == {'P1': {'symbol': ['ONE'], 'RefSeq ID': ['NP_1.1']},
+                                               'P2': {'symbol': ['TWO'], 'RefSeq ID': []}}
+        sequences = SequenceFile(*SEQUENCE_FILES['uniprot'])
+        assert [sequences.get(row) for row in range(2)] == ['MEEP', 'MKKT']
+        with open(SYMBOL_INDEX_FILES['uniprot']) as index_json:
+            assert 'UNO' not in json.load(index_json)['symbols']
+
     def test_parse_refseq(self):
         """Tests that parsing the refseq download into json metadata file works"""
         t0 = time()
@@ -51,22 +80,45 @@ class TestParse:
         refseq_to_symbol = map_refseq_to_symbol()  # (2) map RefSeq ID -> gene symbol
         parse_refseq(refseq_to_uniprot, refseq_to_symbol)
         assert osp.exists(osp.join(REFSEQ, "refseq.json"))
-        assert osp.getsize(osp.join(REFSEQ, "refseq.json")) > 39000000
+        assert osp.getsize(osp.join(REFSEQ, "refseq.json")) > 2000000
+        assert osp.getsize(SEQUENCE_FILES['refseq'][0]) > 35000000
         with open(osp.join(REFSEQ, "refseq.json"), 'r') as refseq_json:
             refseq_dict = json.load(refseq_json)
         assert refseq_dict['NP_001009958.1'] == {"symbol": ["ZNF655"],
-                                                 "UniProt ID": "Q8N720",
-                                                 "sequence": "MEEIPAQEAAGSPRVQFQSLETQSECLSPEPQFVQDTDMEQGLTGGILLRLPTTRI"
-                                                             "HSVNSCPALSHTQASAFSGETLAVLTAGISKRWPKYRLPIDIARPCSETPFPRL"}
+                                                 "UniProt ID": "Q8N720"}
+        sequences = SequenceFile(*SEQUENCE_FILES['refseq'])
+        assert sequences.get(list(refseq_dict).index('NP_001009958.1')) == (
+            "MEEIPAQEAAGSPRVQFQSLETQSECLSPEPQFVQDTDMEQGLTGGILLRLPTTRI"
+            "HSVNSCPALSHTQASAFSGETLAVLTAGISKRWPKYRLPIDIARPCSETPFPRL")
         clear_dir(REFSEQ)
 
+    def test_cache_refseq_shards(self, tmp_path):
+        """Tests that reading the RefSeq shards in parallel gives the same records in the same order"""
+        paths = []
+        for i in range(1, 4):
+            paths.append(str(tmp_path / f'human.{i}.protein.faa.gz'))
+            with gzip.open(paths[-1], 'wt') as fasta:
+                for j in range(50):
+                    fasta.write(f'>NP_{i:03}{j:03}.1 protein [Homo sapiens]\n{"MEEP" * (i + j)}\nLLA\n')
+                    fasta.write(f'>XP_{i:03}{j:03}.1 predicted protein [Homo sapiens]\nMKKT\n')
+        records = {}
+        for jobs in [1, 3]:
+            cache_dir = tmp_path / f'cache{jobs}'
+            cache_dir.mkdir()
+            cache_refseq_shards(paths, jobs=jobs, cache_dir=str(cache_dir))
+            rows = index_refseq_shards(paths, cache_dir=str(cache_dir))
+            records[jobs] = [(rsid, sequences.get(row)) for rsid, (sequences, row) in rows.items()]
+        assert len(records[1]) == 150
+        assert records[1][0] == ('NP_001000.1', 'MEEPLLA')
+        assert records[3] == records[1]
+
     def test_parse_all(self):
         """Tests if the whole parse_all() pipeline works"""
         parse_all()
         assert osp.exists(osp.join(UNIPROT, "uniprot.json"))
-        assert osp.getsize(osp.join(UNIPROT, "uniprot.json")) > 13000000
+        assert osp.getsize(SEQUENCE_FILES['uniprot'][0]) > 10000000
         assert osp.exists(osp.join(REFSEQ, "refseq.json"))
-        assert osp.getsize(osp.join(REFSEQ, "refseq.json")) > 39000000
+        assert osp.getsize(SEQUENCE_FILES['refseq'][0]) > 35000000
         clear_dir(UNIPROT)
         clear_dir(REFSEQ)
 
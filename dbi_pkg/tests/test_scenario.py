@@ -1,14 +1,17 @@
+import io
 import json
 import pandas as pd
 import os
 import os.path as osp
+from collections.abc import Mapping
 from pathlib import Path
 
 from dbinspector.map import read_refseq_data, read_uniprot_data, get_refseq_entry, get_uniprot_entry, \
     retrieve_by_refseq_id, retrieve_by_uniprot_id, retrieve_by_symbol, find_entries
-from dbinspector.compare import summary_statistics
+import dbinspector.compare
+from dbinspector.compare import summary_statistics, pairwise_statistics, compare_entries_batch, write_comparisons
 
-from dbinspector.startup import REFSEQ, UNIPROT, CACHE
+from dbinspector.startup import REFSEQ, UNIPROT, CACHE, setup
 REFSEQ_DATA = osp.join(REFSEQ, 'refseq.json')
 REFSEQ_TEMP = osp.join(CACHE, 'refseq.json')
 UNIPROT_DATA = osp.join(UNIPROT, 'uniprot.json')
@@ -35,9 +38,9 @@ class TestEnvironment:
             Path(REFSEQ_DATA).rename(REFSEQ_TEMP)
             Path(UNIPROT_DATA).rename(UNIPROT_TEMP)
             assert osp.isfile(REFSEQ_TEMP)
-            assert osp.getsize(REFSEQ_TEMP) > 39000000
+            assert osp.getsize(REFSEQ_TEMP) > 2000000
             assert osp.isfile(UNIPROT_TEMP)
-            assert osp.getsize(UNIPROT_TEMP) > 13000000
+            assert osp.getsize(UNIPROT_TEMP) > 1000000
         # replace data by test data
         create_test_data()
         assert osp.isfile(REFSEQ_DATA)
@@ -56,10 +59,10 @@ class TestMap:
         # data structure
         assert isinstance(refseq, dict)
         assert all([isinstance(key, str) for key in refseq.keys()])
-        assert all([isinstance(val, dict) for val in refseq.values()])
+        assert all([isinstance(val, Mapping) for val in refseq.values()])
         assert isinstance(uniprot, dict)
         assert all([isinstance(key, str) for key in uniprot.keys()])
-        assert all([isinstance(val, dict) for val in uniprot.values()])
+        assert all([isinstance(val, Mapping) for val in uniprot.values()])
         # number of entries
         assert len(refseq) == 11
         assert len(uniprot) == 9
@@ -261,6 +264,40 @@ class TestCompare:
         assert refseq['Sequence'] == '27.27%'
         assert refseq['Sequence length'] == '45.45%'
 
+    def test_pairwise_statistics(self) -> None:
+        """Checks that the vectorized summary statistics are the same as those computed one pair at a time."""
+        assert summary_statistics().equals(pairwise_statistics())
+
+    def test_compare_entries_batch(self, monkeypatch) -> None:
+        """Checks the records of a batch of queries and that they are written as TSV and JSON Lines."""
+        # the accession IDs of the test data are not recognized as such
+        monkeypatch.setattr(dbinspector.compare, 'determine_identifier_type', lambda query: {
+            'refseq_id': query if query.startswith('rsid') else None,
+            'uniprot_id': query if query.startswith('upid') else None,
+            'symbol': query if not query.startswith(('rsid', 'upid')) else None})
+        queries = ['upid4\n', 'rsid1\n', '\n', 'EIGHT\n', 'nothing\n']
+        records = list(compare_entries_batch(queries))
+        assert [record['query'] for record in records] == ['upid4', 'rsid1', 'EIGHT', 'nothing']
+        assert [record['identifier type'] for record in records] == ['UniProt ID', 'RefSeq ID', 'symbol', 'symbol']
+        assert [record['found'] for record in records] == [True, True, True, False]
+        assert records[0]['RefSeq ID'] == ['rsid4', 'rsid5']
+        assert records[0]['symbol'] == ['FOUR', 'CUATRO']
+        assert records[0]['RefSeq sequence length'] == [8, 8]
+        assert not records[0]['sequence matches']
+        assert records[1]['UniProt ID'] == ['upid1']
+        assert records[1]['sequence matches'] == [['upid1', 'rsid1']]
+        assert records[2]['sequence matches'] == [['upid7', 'upid8', 'rsid8']]
+        assert records[3]['UniProt ID'] == records[3]['RefSeq ID'] == []
+        filehandle = io.StringIO()
+        assert write_comparisons(iter(records), filehandle) == ['nothing']
+        lines = filehandle.getvalue().splitlines()
+        assert lines[0].split('\t') == dbinspector.compare.BATCH_COLUMNS
+        assert lines[2].split('\t') == ['rsid1', 'RefSeq ID', 'True', 'upid1', 'rsid1', 'ONE', '9', '9',
+                                        'upid1, rsid1']
+        filehandle = io.StringIO()
+        assert write_comparisons(iter(records), filehandle, 'jsonl') == ['nothing']
+        assert [json.loads(line) for line in filehandle.getvalue().splitlines()] == records
+
 
 class TestEnvironmentRestore:
     def test_environment_exit(self):
@@ -272,13 +309,14 @@ class TestEnvironmentRestore:
         if osp.exists(REFSEQ_TEMP) and osp.exists(UNIPROT_TEMP):
             Path(REFSEQ_TEMP).rename(REFSEQ_DATA)
             Path(UNIPROT_TEMP).rename(UNIPROT_DATA)
-            assert osp.getsize(REFSEQ_DATA) > 39000000
-            assert osp.getsize(UNIPROT_DATA) > 13000000
+            assert osp.getsize(REFSEQ_DATA) > 2000000
+            assert osp.getsize(UNIPROT_DATA) > 1000000
         assert not osp.isfile(REFSEQ_TEMP)
         assert not osp.isfile(UNIPROT_TEMP)
 
 
 def create_test_data() -> None:
+    setup()
     refseq = {'rsid1': {'symbol': ['ONE'], 'UniProt ID': 'upid1', 'sequence': 'ONEONEONE'},
               'rsid2': {'symbol': ['TWO'], 'UniProt ID': 'upid2', 'sequence': 'TWOTWOTWO'},
               'rsid3': {'symbol': ['THREE'], 'UniProt ID': 'upid3', 'sequence': 'THREETHREE'},
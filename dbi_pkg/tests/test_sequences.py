@@ -0,0 +1,126 @@
+import logging
+from array import array
+
+from dbinspector.sequences import (SequenceFile, SequenceWriter, write_sequence_file, strip_sequences, crc64,
+                                   hash_sequence)
+from dbinspector.packed import pack_sequence
+
+# hemoglobin subunit alpha, UniProt P69905
+HBA_SEQUENCE = ('MVLSPADKTNVKAAWGKVGAHAGEYGAEALERMFLSFPTTKTYFPHFDLSHGSAQVKGHGKKVADALTNAVAHVDDMPNALSALSDLHAHKLRVDPV'
+                'NFKLLSHCLLVTLAAHLPAEFTPAVHASLDKFLASVSTVLTSKYR')
+
+
+class TestSequences:
+    """Test class for the memory-mapped sequence file."""
+
+    def test_sequence_file(self, tmp_path):
+        """Checks that sequences are written to one file and sliced out of it by row."""
+        paths = str(tmp_path / 'test.seq'), str(tmp_path / 'test.seqidx'), str(tmp_path / 'test.seqsum')
+        sequences = [('ONEONEONE', None), (None, None), ('', None), ('TWOTWOTWO', None)]
+        assert write_sequence_file(sequences, *paths) == 18
+        sequences = SequenceFile(*paths)
+        assert len(sequences) == 4
+        assert sequences.get(0) == 'ONEONEONE'
+        assert sequences.get(1) is None
+        assert sequences.get(2) == ''
+        assert sequences.get(3) == 'TWOTWOTWO'
+        assert sequences.length(1) is None
+        assert sequences.length(3) == 9
+        # the sequences are packed into 5 bits per residue
+        assert sequences.packed and sequences.packed_sequence(3) == pack_sequence('TWOTWOTWO')
+        assert sequences.packed_sequence(1) is None and len(sequences.packed_sequence(2)) == 0
+        # checksums
+        assert sequences.hash(0) == hash_sequence('ONEONEONE')
+        assert sequences.hash(1) is None
+        assert sequences.hash(2) == hash_sequence('')
+        assert sequences.hash(3) != sequences.hash(0)
+
+    def test_empty_sequence_file(self, tmp_path):
+        """Checks that a sequence file without any residues can be read."""
+        paths = str(tmp_path / 'test.seq'), str(tmp_path / 'test.seqidx'), str(tmp_path / 'test.seqsum')
+        write_sequence_file([(None, None), ('', None)], *paths)
+        sequences = SequenceFile(*paths)
+        assert sequences.get(0) is None
+        assert sequences.get(1) == ''
+
+    def test_sequence_writer(self, tmp_path):
+        """Checks that sequences added one at a time are only moved in place once complete."""
+        paths = str(tmp_path / 'test.seq'), str(tmp_path / 'test.seqidx'), str(tmp_path / 'test.seqsum')
+        try:
+            with SequenceWriter(*paths) as writer:
+                writer.add('ONEONEONE')
+                raise ValueError
+        except ValueError:
+            pass
+        assert list(tmp_path.iterdir()) == []
+        with SequenceWriter(*paths) as writer:
+            writer.add('ONEONEONE', '0000000000000001')
+            writer.add(None)
+            assert writer.close() == 9
+        sequences = SequenceFile(*paths)
+        assert sequences.get(0) == 'ONEONEONE' and sequences.get(1) is None
+        assert sequences.hash(0).crc64 == '0000000000000001'
+
+    def test_strip_sequences(self):
+        """Checks that the sequences are removed from the entries saved as json."""
+        data = {'rsid1': {'symbol': ['ONE'], 'UniProt ID': 'upid1', 'sequence': 'ONEONEONE'}}
+        assert strip_sequences(data) == {'rsid1': {'symbol': ['ONE'], 'UniProt ID': 'upid1'}}
+        assert data['rsid1']['sequence'] == 'ONEONEONE'
+
+    def test_crc64(self):
+        """Checks that the CRC64 is the same as the checksum given by UniProt."""
+        assert crc64(HBA_SEQUENCE) == '15E13666573BBBAE'
+
+    def test_hash_sequence(self):
+        """Checks that sequence hashes compare like the sequences they stand for."""
+        assert hash_sequence(None) is None
+        assert hash_sequence(HBA_SEQUENCE) == hash_sequence(HBA_SEQUENCE)
+        assert hash_sequence(HBA_SEQUENCE) != hash_sequence(HBA_SEQUENCE[::-1])
+        assert len(hash_sequence(HBA_SEQUENCE)) == 142
+        assert not hash_sequence('')
+        # a known checksum is used as given
+        assert hash_sequence('ONE', '0000000000000001').crc64 == '0000000000000001'
+
+    def test_ascii_sequence_file(self, tmp_path):
+        """Checks that sequence files written before the sequences were packed are still read."""
+        paths = str(tmp_path / 'test.seq'), str(tmp_path / 'test.seqidx'), str(tmp_path / 'test.seqsum')
+        (tmp_path / 'test.seq').write_bytes(b'ONEONEONETWOTWOTWO')
+        (tmp_path / 'test.seqidx').write_bytes(array('q', [0, 9, 9, -1, 9, 9]).tobytes())
+        sequences = SequenceFile(*paths)
+        assert not sequences.packed
+        assert sequences.get(0) == 'ONEONEONE' and sequences.get(1) is None and sequences.get(2) == 'TWOTWOTWO'
+        assert sequences.packed_sequence(2) == pack_sequence('TWOTWOTWO')
+        assert sequences.hash(2) == hash_sequence('TWOTWOTWO')
+
+    def test_copy_packed(self, tmp_path):
+        """Checks that packed sequences are copied into another sequence file together with their hashes."""
+        source = str(tmp_path / 'a.seq'), str(tmp_path / 'a.seqidx'), str(tmp_path / 'a.seqsum')
+        target = str(tmp_path / 'b.seq'), str(tmp_path / 'b.seqidx'), str(tmp_path / 'b.seqsum')
+        write_sequence_file([(HBA_SEQUENCE, None), (None, None)], *source)
+        sequences = SequenceFile(*source)
+        with SequenceWriter(*target) as writer:
+            for row in [1, 0]:
+                writer.add_packed(sequences.packed_sequence(row), sequences.hash(row))
+            assert writer.close() == 142
+        copied = SequenceFile(*target)
+        assert copied.get(0) is None and copied.get(1) == HBA_SEQUENCE
+        assert copied.hash(1) == hash_sequence(HBA_SEQUENCE)
+
+    def test_invalid_residue(self, tmp_path, caplog):
+        """Checks that a sequence with a character which is not an amino acid code is logged and written unpacked."""
+        paths = str(tmp_path / 'test.seq'), str(tmp_path / 'test.seqidx'), str(tmp_path / 'test.seqsum')
+        with caplog.at_level(logging.WARNING, logger='dbinspector'):
+            assert write_sequence_file([('ONE', None, 'acc1'), ('CUATRO44', None, 'acc4'), ('TWO', None)], *paths) == 14
+        assert any('acc4' in message for message in caplog.messages)
+        sequences = SequenceFile(*paths)
+        assert [sequences.get(row) for row in range(3)] == ['ONE', 'CUATRO44', 'TWO']
+        assert sequences.packed_sequence(1) == 'CUATRO44' and sequences.packed_sequence(2) == pack_sequence('TWO')
+        assert sequences.length(1) == 8 and sequences.hash(1) == hash_sequence('CUATRO44')
+        # copied as they are, packed or not
+        target = str(tmp_path / 'copy.seq'), str(tmp_path / 'copy.seqidx'), str(tmp_path / 'copy.seqsum')
+        with SequenceWriter(*target) as writer:
+            for row in range(3):
+                writer.add_packed(sequences.packed_sequence(row), sequences.hash(row))
+            writer.close()
+        copied = SequenceFile(*target)
+        assert [copied.get(row) for row in range(3)] == ['ONE', 'CUATRO44', 'TWO']
@@ -0,0 +1,91 @@
+import json
+import os
+
+import dbinspector.startup
+from dbinspector.entries import EntryWriter
+from dbinspector.snapshot import load_snapshot, clear, MappedEntries
+from dbinspector.records import UniProtEntry, RefSeqEntry, compact_entry, compact_index
+from dbinspector.packed import PackedSequence
+
+ENTRIES = {f'acc{i}': {'symbol': [f'S{i % 7}'], 'UniProt ID': f'P{i}' if i % 3 else None} for i in range(500)}
+
+
+class TestSnapshot:
+    """Test class for the in-process snapshot of parsed data."""
+
+    def test_load_snapshot(self, tmp_path):
+        """Checks that a parsed file is only loaded once and reloaded as soon as it is rewritten."""
+        path = str(tmp_path / 'refseq.json')
+        with open(path, 'w') as filehandle:
+            json.dump({'rsid1': {'symbol': ['ONE'], 'UniProt ID': 'upid1', 'sequence': 'ONEONEONE'}}, filehandle)
+        first = load_snapshot(path)
+        assert load_snapshot(path) is first
+        assert first.data['rsid1']['symbol'] == ['ONE']
+        # rewrite the file with new content
+        with open(path, 'w') as filehandle:
+            json.dump({'rsid2': {'symbol': ['TWO'], 'UniProt ID': 'upid2', 'sequence': 'TWOTWOTWO'}}, filehandle)
+        os.utime(path, ns=(first.signature[0] + 10**9, first.signature[0] + 10**9))
+        second = load_snapshot(path)
+        assert second is not first
+        assert set(second.data) == {'rsid2'}
+
+    def test_clear(self, tmp_path):
+        """Checks that clearing the snapshots forces a reload."""
+        path = str(tmp_path / 'uniprot.json')
+        with open(path, 'w') as filehandle:
+            json.dump({}, filehandle)
+        first = load_snapshot(path)
+        clear()
+        assert load_snapshot(path) is not first
+
+    def test_mapped_entries(self, tmp_path, monkeypatch):
+        """Checks that the mapped snapshot gives the same entries as the loaded one, without loading the file."""
+        path, offset_path = str(tmp_path / 'refseq.json'), str(tmp_path / 'refseq.offsets')
+        with EntryWriter(path, offset_path) as writer:
+            for acc, entry in ENTRIES.items():
+                writer.add(acc, entry)
+            writer.close()
+        monkeypatch.setattr(dbinspector.startup, 'SNAPSHOT', 'mapped')
+        data = load_snapshot(path).data
+        assert isinstance(data, MappedEntries)
+        assert len(data) == 500 and list(data) == list(ENTRIES) and dict(data.items()) == ENTRIES
+        assert data['acc42'] == ENTRIES['acc42'] and data.rows['acc42'] == 42
+        assert 'acc499' in data and 'acc500' not in data and data.get('acc500') is None
+        # a lookup hands out a new dictionary, the snapshot cannot be modified
+        data['acc1']['symbol'].append('X')
+        assert data['acc1'] == ENTRIES['acc1']
+        clear()
+        # files written in one piece are loaded into memory
+        with open(path, 'w') as filehandle:
+            json.dump(ENTRIES, filehandle)
+        assert load_snapshot(path).data == ENTRIES
+        clear()
+
+    def test_records(self, tmp_path, monkeypatch):
+        """Checks that the loaded entries are records which read and compare like the parsed dictionaries."""
+        monkeypatch.setattr(dbinspector.startup, 'SNAPSHOT', 'memory')
+        path = str(tmp_path / 'refseq.json')
+        with EntryWriter(path, str(tmp_path / 'refseq.offsets')) as writer:
+            for acc, entry in ENTRIES.items():
+                writer.add(acc, entry)
+            writer.close()
+        data = load_snapshot(path).data
+        assert all(isinstance(entry, RefSeqEntry) for entry in data.values())
+        assert data == ENTRIES and list(data['acc1']) == ['symbol', 'UniProt ID'] and data['acc3']['UniProt ID'] is None
+        # the symbols listed by several entries are held once
+        assert data['acc1'].symbols[0] is data['acc8'].symbols[0]
+        # lists are handed out as new lists, copies are dictionaries
+        data['acc1']['symbol'].append('X')
+        copy = data['acc1'].copy()
+        assert copy == ENTRIES['acc1'] and type(copy) is dict
+        copy['sequence'] = 'SEQ'
+        assert 'sequence' not in data['acc1']
+        entry = compact_entry({'symbol': ['ONE'], 'RefSeq ID': ['rsid1'], 'sequence': 'ONEONEONE'})
+        assert isinstance(entry, UniProtEntry) and entry['RefSeq ID'] == ['rsid1'] and entry.get('UniProt ID') is None
+        # sequences are held packed and handed out as strings, unless they are not amino acid sequences
+        assert isinstance(entry.sequence, PackedSequence) and entry['sequence'] == 'ONEONEONE'
+        assert entry.copy()['sequence'] == 'ONEONEONE'
+        assert compact_entry({'symbol': [], 'UniProt ID': None, 'sequence': 'CUATRO44'}).sequence == 'CUATRO44'
+        assert compact_entry({'symbol': ['ONE'], 'other': 1}) == {'symbol': ['ONE'], 'other': 1}
+        assert compact_index({'ONE': [['rsid1', 'One', 'primary']]}) == {'ONE': [('rsid1', 'One', 'primary')]}
+        clear()
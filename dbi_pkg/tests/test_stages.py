@@ -0,0 +1,112 @@
+import logging
+import threading
+
+import pytest
+
+from dbinspector.fingerprints import Fingerprints
+from dbinspector.stages import Stage, run_stages
+import dbinspector.parse
+
+
+def write(path, text):
+    """Returns a stage function that writes a file."""
+    return lambda: path.write_text(text)
+
+
+class TestStages:
+    """Test class for the graph of parse stages."""
+
+    def test_concurrent_branches(self, tmp_path):
+        """Checks that independent stages run at the same time and dependent ones after those they require."""
+        fingerprints = Fingerprints(str(tmp_path / 'fingerprints.json'))
+        # both branches have to wait for each other, which only works if they run concurrently
+        barrier, order = threading.Barrier(2, timeout=5), []
+
+        def branch(name):
+            def run():
+                barrier.wait()
+                order.append(name)
+            return run
+
+        stages = [Stage('join', lambda: order.append('join') or True, requires=('left', 'right')),
+                  Stage('left', branch('left')), Stage('right', branch('right'))]
+        assert run_stages(stages, fingerprints) == {'left': False, 'right': False, 'join': True}
+        assert order[-1] == 'join' and sorted(order[:2]) == ['left', 'right']
+
+    def test_resume(self, tmp_path):
+        """Checks that a failed stage does not discard the completed ones and a re-run resumes after them."""
+        fingerprints = Fingerprints(str(tmp_path / 'fingerprints.json'))
+        source, left, right, result = (tmp_path / name for name in ['source', 'left', 'right', 'result'])
+        source.write_text('source')
+
+        def fail():
+            raise RuntimeError('crash')
+
+        stages = [Stage('left', write(left, 'left'), inputs=[str(source)], outputs=[str(left)]),
+                  Stage('right', fail, inputs=[str(source)], outputs=[str(right)]),
+                  Stage('result', write(result, 'result'), requires=('left', 'right'),
+                        inputs=[str(left), str(right)], outputs=[str(result)])]
+        with pytest.raises(RuntimeError):
+            run_stages(stages, fingerprints)
+        assert left.exists() and not result.exists()
+        stages[1] = Stage('right', write(right, 'right'), inputs=[str(source)], outputs=[str(right)])
+        ran = run_stages(stages, Fingerprints(str(tmp_path / 'fingerprints.json')))
+        assert ran == {'left': False, 'right': True, 'result': True}
+        assert result.read_text() == 'result'
+
+    def test_progress(self, tmp_path):
+        """Checks that the state of each stage is reported to the progress callback."""
+        fingerprints = Fingerprints(str(tmp_path / 'fingerprints.json'))
+        source, result = tmp_path / 'source', tmp_path / 'result'
+        source.write_text('source')
+        events = []
+
+        def fail():
+            raise RuntimeError('crash')
+
+        stages = [Stage('result', write(result, 'result'), inputs=[str(source)], outputs=[str(result)]),
+                  Stage('fail', fail), Stage('after', lambda: True, requires=('fail',))]
+        with pytest.raises(RuntimeError):
+            run_stages(stages, fingerprints, progress=events.append)
+        states = [(event['stage'], event['state']) for event in events]
+        assert sorted(states) == [('after', 'not run'), ('fail', 'failed'), ('fail', 'running'), ('result', 'done'),
+                                  ('result', 'running')]
+        events.clear()
+        run_stages(stages[:1], fingerprints, progress=events.append)
+        assert events == [{'stage': 'result', 'state': 'skipped'}]
+
+    def test_unknown_requirement(self, tmp_path):
+        """Checks that a graph with a missing stage is rejected before anything runs."""
+        with pytest.raises(ValueError):
+            run_stages([Stage('stage', lambda: True, requires=('missing',))],
+                       Fingerprints(str(tmp_path / 'fingerprints.json')))
+
+    def test_peak_memory(self, tmp_path, caplog):
+        """Checks that the peak memory is logged per stage only if the stages run one at a time."""
+        stages = [Stage('first', lambda: True), Stage('second', lambda: True)]
+        with caplog.at_level(logging.INFO, logger='dbinspector'):
+            run_stages(stages, Fingerprints(str(tmp_path / 'serial.json')), workers=1)
+        assert sum('peak memory' in message for message in caplog.messages) == 2
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger='dbinspector'):
+            run_stages(stages, Fingerprints(str(tmp_path / 'concurrent.json')))
+        peaks = [message for message in caplog.messages if 'peak memory' in message]
+        assert len(peaks) == 1 and peaks[0].startswith('The peak memory of the 2 stages')
+
+    def test_shared_refseq_index(self, tmp_path, monkeypatch):
+        """Checks that the RefSeq sequences and join stages index the cached records only once."""
+        calls = []
+        monkeypatch.setattr(dbinspector.parse, 'refseq_fasta_paths', lambda: [])
+        monkeypatch.setattr(dbinspector.parse, 'index_refseq_shards', lambda paths: calls.append(paths) or {})
+        monkeypatch.setattr(dbinspector.parse, 'write_refseq_sequences', lambda rows: None)
+        monkeypatch.setattr(dbinspector.parse, 'join_refseq', lambda rows, *mappings: None)
+        monkeypatch.setattr(dbinspector.parse, 'map_refseq_to_uniprot', lambda progress: {})
+        monkeypatch.setattr(dbinspector.parse, 'map_refseq_to_symbol', lambda: {})
+        stages = {stage.name: stage for stage in
+                  dbinspector.parse.parse_graph(Fingerprints(str(tmp_path / 'fingerprints.json')))}
+        threads = [threading.Thread(target=stages[name].run) for name in ['refseq sequences', 'refseq join']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert calls == [[]]
@@ -0,0 +1,165 @@
+import os
+import os.path as osp
+
+import pytest
+
+import dbinspector.startup
+import dbinspector.store
+from dbinspector.store import (write_store, update_store, spill_records, get_entry, find_by_symbol, read_data,
+                               count_entries, linked_pairs)
+from dbinspector.map import find_entries, EntryLookup
+from dbinspector.compare import summary_statistics, pairwise_statistics, read_summary, write_summary, \
+    data_version
+from dbinspector.uniprot import UniProtRecord
+
+REFSEQ_DATA = {'rsid1': {'symbol': ['ONE'], 'UniProt ID': 'upid1', 'sequence': 'ONEONEONE'},
+               'rsid2': {'symbol': ['TWO'], 'UniProt ID': 'upid2', 'sequence': 'TWOTWOTWO'},
+               'rsid3': {'symbol': ['THREE'], 'UniProt ID': 'upid3', 'sequence': 'THREETHREE'},
+               'rsid4': {'symbol': ['FOUR'], 'UniProt ID': 'upid4', 'sequence': 'FOURFOUR'},
+               'rsid5': {'symbol': [], 'UniProt ID': None, 'sequence': 'FIVEFIVE'},
+               'rsid6': {'symbol': ['SIX'], 'UniProt ID': None, 'sequence': 'SIXSIX'},
+               'rsid7': {'symbol': [], 'UniProt ID': None, 'sequence': ''},
+               'rsid8': {'symbol': ['EIGHT', 'ACHT'], 'UniProt ID': None, 'sequence': ''},
+               'rsid9': {'symbol': ['NEUN'], 'UniProt ID': 'upid9', 'sequence': 'NEUNNEUN'},
+               'rsid10': {'symbol': ['NEUF'], 'UniProt ID': 'upid9', 'sequence': 'NUEVENUEVE'},
+               'rsid11': {'symbol': ['NUEVE'], 'UniProt ID': 'upid9', 'sequence': 'NINENINE'}}
+
+UNIPROT_DATA = {'upid1': {'symbol': ['ONE'], 'RefSeq ID': ['rsid1'], 'sequence': 'ONEONEONE'},
+                'upid2': {'symbol': ['ZWEI'], 'RefSeq ID': ['rsid2'], 'sequence': 'ZWEIZWEIZWEI'},
+                'upid3': {'symbol': ['THREE'], 'RefSeq ID': [], 'sequence': 'THREETHREE'},
+                'upid4': {'symbol': ['FOUR', 'CUATRO'], 'RefSeq ID': ['rsid4', 'rsid5'], 'sequence': 'CUATRO44'},
+                'upid5': {'symbol': [], 'RefSeq ID': [], 'sequence': ''},
+                'upid6': {'symbol': ['SIX'], 'RefSeq ID': [], 'sequence': 'SIXSIX'},
+                'upid7': {'symbol': ['EIGHT'], 'RefSeq ID': [], 'sequence': ''},
+                'upid8': {'symbol': ['EIGHT', 'OCHO'], 'RefSeq ID': [], 'sequence': ''},
+                'upid9': {'symbol': ['NUEVE'], 'RefSeq ID': ['rsid9', 'rsid10', 'rsid11'], 'sequence': 'NUEVENUEVE'}}
+
+TREMBL_RECORDS = [UniProtRecord('tr1', ['SIX', 'SEIS'], {}, ['rsid6'], 'SIXSIX', None),
+                  UniProtRecord('tr2', ['EIGHT'], {}, [], 'ACHT', '0000000000000001'),
+                  UniProtRecord('tr3', [], {}, ['rsid7'], None, None)]
+
+
+class TestStore:
+    """Test class for the SQLite storage backend."""
+
+    def test_write_and_read(self, tmp_path):
+        """Checks that entries are written to and read back from the store unchanged."""
+        path = str(tmp_path / 'test.sqlite')
+        write_store(UNIPROT_DATA, REFSEQ_DATA, path)
+        assert osp.isfile(path)
+        assert read_data('refseq', path) == REFSEQ_DATA
+        assert read_data('uniprot', path) == UNIPROT_DATA
+        assert list(read_data('refseq', path)) == list(REFSEQ_DATA)
+        assert count_entries('refseq', path) == 11
+        assert count_entries('uniprot', path) == 9
+        assert get_entry('refseq', 'rsid6', path) == REFSEQ_DATA['rsid6']
+        assert get_entry('uniprot', 'upid4', path) == UNIPROT_DATA['upid4']
+        assert get_entry('uniprot', 'rsid1', path) is None
+
+    def test_update_store(self, tmp_path):
+        """Checks that the entries of one database are replaced and those of the other are kept."""
+        path = str(tmp_path / 'test.sqlite')
+        write_store(UNIPROT_DATA, REFSEQ_DATA, path)
+        refseq_data = {'rsid1': {'symbol': ['UNO'], 'UniProt ID': 'upid2', 'sequence': 'ONE'},
+                       'rsid12': {'symbol': [], 'UniProt ID': None, 'sequence': None}}
+        update_store('refseq', refseq_data, path)
+        assert read_data('refseq', path) == refseq_data
+        assert read_data('uniprot', path) == UNIPROT_DATA
+        assert [acc for acc, entry in find_by_symbol('refseq', ['UNO'], path)] == ['rsid1']
+
+    def test_write_store_streamed(self, tmp_path, monkeypatch):
+        """Checks that entries given as an iterator are inserted in batches."""
+        monkeypatch.setattr(dbinspector.store, 'INSERT_BATCH', 2)
+        path = str(tmp_path / 'test.sqlite')
+        write_store(iter(UNIPROT_DATA.items()), iter(REFSEQ_DATA.items()), path)
+        assert read_data('uniprot', path) == UNIPROT_DATA
+        assert read_data('refseq', path) == REFSEQ_DATA
+
+    def test_spill_records(self, tmp_path, monkeypatch):
+        """Checks that TrEMBL entries are written in batches and looked up together with the UniProt entries."""
+        path = str(tmp_path / 'test.sqlite')
+        write_store(UNIPROT_DATA, REFSEQ_DATA, path)
+        # every record fills a batch of its own
+        monkeypatch.setattr(dbinspector.store, 'RECORD_OVERHEAD', 1024 * 1024)
+        assert spill_records('trembl', iter(TREMBL_RECORDS), memory_limit=1, path=path) == 3
+        assert count_entries('uniprot', path) == 12
+        assert get_entry('uniprot', 'tr1', path) == {'symbol': ['SIX', 'SEIS'], 'RefSeq ID': ['rsid6'],
+                                                      'sequence': 'SIXSIX'}
+        assert get_entry('uniprot', 'tr2', path, hashed=True)['sequence'].crc64 == '0000000000000001'
+        assert [acc for acc, entry in find_by_symbol('uniprot', ['EIGHT'], path)] == ['upid7', 'upid8', 'tr2']
+        assert ('rsid6', 'tr1', 'uniprot') in set(linked_pairs(path))
+        # the reviewed entries can be replaced without the TrEMBL entries, and the other way round
+        update_store('uniprot', {}, path)
+        assert count_entries('uniprot', path) == 3
+        spill_records('trembl', iter(TREMBL_RECORDS[:1]), path=path)
+        assert count_entries('uniprot', path) == 1
+
+    def test_spill_duplicates(self, tmp_path, monkeypatch):
+        """Checks that of a TrEMBL accession ID listed twice, the first record is kept, also across batches."""
+        path = str(tmp_path / 'test.sqlite')
+        write_store(UNIPROT_DATA, REFSEQ_DATA, path)
+        monkeypatch.setattr(dbinspector.store, 'RECORD_OVERHEAD', 1024 * 1024)
+        duplicate = UniProtRecord('tr1', ['UNO'], {}, ['rsid1'], 'ONEONE', None)
+        assert spill_records('trembl', iter([*TREMBL_RECORDS, duplicate]), memory_limit=1, path=path) == 3
+        assert get_entry('uniprot', 'tr1', path) == {'symbol': ['SIX', 'SEIS'], 'RefSeq ID': ['rsid6'],
+                                                      'sequence': 'SIXSIX'}
+        assert find_by_symbol('uniprot', ['UNO'], path) == []
+
+    def test_find_by_symbol(self, tmp_path):
+        """Checks the lookup of entries by gene symbol."""
+        path = str(tmp_path / 'test.sqlite')
+        write_store(UNIPROT_DATA, REFSEQ_DATA, path)
+        assert [acc for acc, entry in find_by_symbol('uniprot', ['EIGHT'], path)] == ['upid7', 'upid8']
+        assert [acc for acc, entry in find_by_symbol('refseq', ['acht', 'ACHT'], path)] == ['rsid8']
+        assert not find_by_symbol('refseq', ['ZWEI'], path)
+
+    def test_linked_pairs(self, tmp_path):
+        """Checks that all cross-referenced pairs of entries are found exactly once."""
+        path = str(tmp_path / 'test.sqlite')
+        write_store(UNIPROT_DATA, REFSEQ_DATA, path)
+        assert sorted(linked_pairs(path)) == [('rsid1', 'upid1', 'refseq'), ('rsid10', 'upid9', 'refseq'),
+                                              ('rsid11', 'upid9', 'refseq'), ('rsid2', 'upid2', 'refseq'),
+                                              ('rsid3', 'upid3', 'refseq'), ('rsid4', 'upid4', 'refseq'),
+                                              ('rsid5', 'upid4', 'uniprot'), ('rsid9', 'upid9', 'refseq')]
+
+    def test_sqlite_backend(self, tmp_path, monkeypatch):
+        """Checks that lookups and summary statistics give the same results from the SQLite backend."""
+        monkeypatch.setattr(dbinspector.startup, 'SQLITE', str(tmp_path / 'test.sqlite'))
+        write_store(UNIPROT_DATA, REFSEQ_DATA)
+        monkeypatch.setattr(dbinspector.startup, 'BACKEND', 'sqlite')
+        res = find_entries(uniprot_id='upid4')
+        assert [entry['RefSeq ID'] for entry in res['RefSeq']] == [['rsid4'], ['rsid5']]
+        assert res['UniProt'][0]['UniProt ID'] == 'upid4'
+        res = find_entries(symbol='eight')
+        assert [entry['UniProt ID'] for entry in res['UniProt']] == ['upid7', 'upid8']
+        assert [entry['RefSeq ID'] for entry in res['RefSeq']] == ['rsid8']
+        matches = summary_statistics()['Number of matches']
+        assert list(matches) == [4, 7, 7, 3, 5]
+        assert summary_statistics().equals(pairwise_statistics())
+        res = EntryLookup().find(symbol='eight')
+        assert [entry['UniProt ID'] for entry in res['UniProt']] == ['upid7', 'upid8']
+        assert [entry['sequence'].length for entry in res['RefSeq']] == [0]
+        res = EntryLookup().find(uniprot_id='upid4')
+        assert [entry['RefSeq ID'] for entry in res['RefSeq']] == [['rsid4'], ['rsid5']]
+
+    def test_stored_summary(self, tmp_path, monkeypatch):
+        """Checks that the stored summary statistics are served until the data they were computed from changes."""
+        path = str(tmp_path / 'summary.json')
+        monkeypatch.setattr(dbinspector.startup, 'SQLITE', str(tmp_path / 'test.sqlite'))
+        monkeypatch.setattr(dbinspector.startup, 'SUMMARY', str(tmp_path / 'default_summary.json'))
+        write_store(UNIPROT_DATA, REFSEQ_DATA)
+        version = data_version('sqlite')
+        assert version[1] == pytest.approx(os.path.getmtime(dbinspector.startup.SQLITE))
+        assert data_version('sqlite') == version
+        assert read_summary('sqlite', path) is None
+        table = write_summary('sqlite', path)
+        assert list(table['Number of matches']) == [4, 7, 7, 3, 5]
+        assert read_summary('sqlite', path).equals(table)
+        assert read_summary('json', path) is None
+        update_store('refseq', {'rsid1': REFSEQ_DATA['rsid1']})
+        assert data_version('sqlite')[0] != version[0]
+        assert read_summary('sqlite', path) is None
+        assert list(write_summary('sqlite', path)['Number of matches']) == [1, 1, 1, 1, 1]
+        # the stored summary statistics are written to startup.SUMMARY by default
+        write_summary('sqlite')
+        assert read_summary('sqlite', dbinspector.startup.SUMMARY).equals(read_summary('sqlite', path))
@@ -0,0 +1,50 @@
+import random
+
+from dbinspector.compare import update_stats
+from dbinspector.summary import summary_counts, data_columns, CATEGORIES
+
+SEQUENCES = [None, '', 'MEEP', 'MEEL', 'MKKTAA']
+
+
+def random_data(seed):
+    """Random RefSeq and UniProt entries with all the cases compared by update_stats()."""
+    rng = random.Random(seed)
+    symbols = ['ONE', 'TWO', 'THREE', 'uno']
+    uniprot_ids = ['P1', 'P12', 'P2', 'P3', 'P4', 'Q9']
+    refseq_ids = [f'NP_{i}.1' for i in range(12)]
+    uniprot = {upid: {'symbol': rng.sample(symbols, rng.randint(0, 3)),
+                      'RefSeq ID': [rng.choice(refseq_ids + ['NP_99.1']) for _ in range(rng.randint(0, 3))],
+                      'sequence': rng.choice(SEQUENCES)} for upid in uniprot_ids[:5]}
+    refseq = {rsid: {'symbol': rng.sample(symbols, rng.randint(0, 1)),
+                     'UniProt ID': rng.choice(uniprot_ids + [None, None]),
+                     'sequence': rng.choice(SEQUENCES)} for rsid in refseq_ids}
+    return refseq, uniprot
+
+
+def pairwise_counts(refseq, uniprot):
+    """Counts the matches one pair at a time, as compare.summary_statistics() did before."""
+    consensus = {key: {"matches": 0, "UniProt entry": set()} for key in CATEGORIES}
+    for rsid, entry in refseq.items():
+        if entry['UniProt ID'] and entry['UniProt ID'] in uniprot:
+            update_stats(entry, uniprot[entry['UniProt ID']], rsid, entry['UniProt ID'], 'refseq', consensus)
+    for upid, entry in uniprot.items():
+        for rsid in entry['RefSeq ID']:
+            if rsid in refseq and upid != refseq[rsid]['UniProt ID']:
+                update_stats(refseq[rsid], entry, rsid, upid, 'uniprot', consensus)
+    return {key: (value['matches'], len(value['UniProt entry'])) for key, value in consensus.items()}
+
+
+class TestSummary:
+    """Test class for the vectorized summary statistics."""
+
+    def test_summary_counts(self):
+        """Checks that the vectorized counts are the same as those of update_stats() on random data."""
+        for seed in range(200):
+            refseq, uniprot = random_data(seed)
+            counts = summary_counts(data_columns('refseq', refseq), data_columns('uniprot', uniprot))
+            assert counts == pairwise_counts(refseq, uniprot), seed
+
+    def test_empty(self):
+        """Checks that databases without entries or links give no matches."""
+        counts = summary_counts(data_columns('refseq', {}), data_columns('uniprot', {}))
+        assert counts == {category: (0, 0) for category in CATEGORIES}
@@ -0,0 +1,74 @@
+import gzip
+
+from dbinspector.uniprot import iter_uniprot, iter_uniprot_parallel, iter_batches, benchmark, UniProtRecord
+
+ENTRY = """<entry dataset="Swiss-Prot" created="2001-01-11" modified="2021-06-02" version="170">
+  <accession>P{0}</accession>
+  <accession>Q{0}</accession>
+  <name>TEST{0}_HUMAN</name>
+  <gene>
+    <name type="primary">GENE{0}</name>
+    <name type="synonym">SYN{0}</name>
+    <name type="ORF">ORF{0}</name>
+    <name type="synonym">GENE{0}</name>
+  </gene>
+  <reference key="1">
+    <citation type="journal article"><dbReference type="PubMed" id="1{0}"/></citation>
+  </reference>
+  <comment type="alternative products">
+    <isoform><id>P{0}-2</id><sequence type="described" ref="VSP_0{0}"/></isoform>
+  </comment>
+  <dbReference type="EMBL" id="AB{0}"/>
+  <dbReference type="RefSeq" id="NP_{0}.1"><property type="nucleotide sequence ID" value="NM_{0}.1"/></dbReference>
+  <dbReference type="RefSeq" id="NP_{0}.2"/>
+  <dbReference type="RefSeq" id="NP_{0}.1"/>
+  <evidence type="ECO:0000269" key="1"><source><dbReference type="PubMed" id="2{0}"/></source></evidence>
+  <sequence length="8" mass="900" checksum="000000000000000{0}" modified="2001-01-11" version="1">MSEQ{0}AAA</sequence>
+</entry>
+"""
+
+
+def write_xml(path, n):
+    with gzip.open(path, 'wt') as filehandle:
+        filehandle.write('<?xml version="1.0" encoding="UTF-8"?>\n<uniprot xmlns="http://uniprot.org/uniprot">\n')
+        for i in range(n):
+            filehandle.write(ENTRY.format(i))
+        filehandle.write('<copyright>Copyrighted by the UniProt Consortium</copyright>\n</uniprot>\n')
+
+
+class TestUniProt:
+    """Test class for the UniProt XML parser."""
+
+    def test_iter_uniprot(self, tmp_path):
+        """Checks that each entry is read completely and symbols and RefSeq IDs are listed once."""
+        path = str(tmp_path / 'test.xml.gz')
+        write_xml(path, 3)
+        records = list(iter_uniprot(path))
+        assert [record.accession for record in records] == ['Q0', 'Q1', 'Q2']
+        assert records[1] == UniProtRecord('Q1', ['GENE1', 'SYN1'], {'GENE1': 'primary', 'SYN1': 'synonym'},
+                                           ['NP_1.1', 'NP_1.2'], 'MSEQ1AAA', '0000000000000001')
+
+    def test_iter_batches(self, tmp_path):
+        """Checks that the XML is cut into batches of complete entries."""
+        path = str(tmp_path / 'test.xml.gz')
+        write_xml(path, 20)
+        with gzip.open(path, 'rb') as filehandle:
+            batches = list(iter_batches(filehandle, batch_size=3000))
+        assert len(batches) > 1
+        assert all(header.endswith(b'<uniprot xmlns="http://uniprot.org/uniprot">\n') for header, _ in batches)
+        assert all(batch.lstrip().startswith(b'<entry') and batch.endswith(b'</entry>') for _, batch in batches)
+        assert sum(batch.count(b'<entry ') for _, batch in batches) == 20
+
+    def test_iter_uniprot_parallel(self, tmp_path):
+        """Checks that the worker processes give the same records in the same order."""
+        path = str(tmp_path / 'test.xml.gz')
+        write_xml(path, 50)
+        assert list(iter_uniprot_parallel(path, jobs=3, batch_size=2000)) == list(iter_uniprot(path))
+
+    def test_benchmark(self, tmp_path):
+        """Checks that the benchmark counts all entries."""
+        path = str(tmp_path / 'test.xml.gz')
+        write_xml(path, 100)
+        result = benchmark(path)
+        assert result['entries'] == 100
+        assert result['entries/s'] > 0 and result['MB/s'] > 0
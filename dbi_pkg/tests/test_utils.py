@@ -1,9 +1,13 @@
 import pytest
 from dbinspector.utils import determine_identifier_type, format_list_entry, check_data_age, clear_dir
-from dbinspector.utils import get_ncbi, get_uniprot
+from dbinspector.utils import get_ncbi, get_uniprot, iter_fasta, read_fasta, measure_stage, peak_rss
+import dbinspector.utils
 from dbinspector.exceptions import FileMissingError
 import os
 import os.path as osp
+import gzip
+import resource
+import sys
 from pathlib import Path
 
 
@@ -32,6 +36,17 @@ class TestUtils:
         assert format_list_entry(str_list) == 'a, b, c'
         assert format_list_entry([]) == ''
 
+    def test_iter_fasta(self, tmp_path):
+        """Test that FASTA records are streamed one by one and filtered by accession prefix"""
+        filename = str(tmp_path / 'test.protein.faa.gz')
+        with gzip.open(filename, 'wt') as fasta:
+            fasta.write('>NP_000001.1 first protein [Homo sapiens]\nMEEP\nLLA\n'
+                        '>XP_000002.1 predicted protein [Homo sapiens]\nMKKT\n'
+                        '>NP_000003.2 third protein [Homo sapiens]\nMAAA\n')
+        assert list(iter_fasta(filename)) == [('NP_000001.1', 'MEEPLLA'), ('NP_000003.2', 'MAAA')]
+        assert list(iter_fasta(filename, prefix='XP_')) == [('XP_000002.1', 'MKKT')]
+        assert read_fasta(filename) == {'NP_000001.1': 'MEEPLLA', 'NP_000003.2': 'MAAA'}
+
     def test_check_data_age(self):
         """Test if file age works properly"""
         with open(osp.join(TEST_SUB, 'test.txt'), 'w') as outfile:
@@ -65,3 +80,22 @@ class TestUtils:
         assert osp.join(TEST, dirs[0]) == TEST_SUB
         assert len(files) == 0
         assert len(os.listdir(TEST_SUB)) == 0
+
+    def test_measure_stage(self):
+        """Test that the wall time and the peak memory of a stage are measured"""
+        with measure_stage('test') as report:
+            block = bytearray(50 * 1024 * 1024)
+        del block
+        assert report['seconds'] >= 0
+        assert report['peak RSS MB'] > 50
+
+    def test_peak_rss_getrusage(self, monkeypatch):
+        """Test that ru_maxrss is read as kilobytes on Linux and as bytes on macOS without /proc"""
+        def no_proc(*args, **kwargs):
+            raise OSError
+        monkeypatch.setattr(dbinspector.utils, 'open', no_proc, raising=False)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        monkeypatch.setattr(sys, 'platform', 'linux')
+        assert peak_rss() >= maxrss * 1024
+        monkeypatch.setattr(sys, 'platform', 'darwin')
+        assert maxrss <= peak_rss() < maxrss * 1024
@@ -1,10 +1,18 @@
 from os import path as pt
 import time
+import hashlib
+import json
+from datetime import datetime, timezone
+from functools import partial
+from typing import Optional, Tuple
 import pandas as pd
-from flask import Flask, request, redirect, render_template
-from dbinspector.startup import CACHE, UNIPROT, REFSEQ
-import dbinspector.parse
-from dbinspector.compare import compare_entries, summary_statistics
+from flask import Flask, request, redirect, render_template, jsonify, make_response, Response
+from werkzeug.http import is_resource_modified
+from dbinspector.startup import CACHE, UNIPROT, REFSEQ, setup
+import dbinspector.snapshot
+from dbinspector.jobs import ParseJobs
+from dbinspector.cache import ResultCache
+from dbinspector.compare import compare_entries, get_summary, data_version
 from dbinspector.exceptions import QueryNotFoundError
 from dbinspector.utils import determine_identifier_type, format_list_entry
 
@@ -16,6 +24,17 @@ app.secret_key = "someSecretKey;)" + time.strftime('%d%H')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_PATH'] = 10 * 1024 * 1024  # Max 10MB
 
+setup()
+# load the parsed databases once, all requests are answered from the in-process snapshot. Pre-forking servers which
+# import the app before forking (e.g. gunicorn --preload) share it between their workers, as memory-mapped files with
+# DBINSPECTOR_SNAPSHOT=mapped; the frozen objects are not copied into each worker by its garbage collector.
+dbinspector.snapshot.preload(freeze=True)
+# the databases are parsed in the background, the snapshot is reloaded once the parsed files changed. The jobs are
+# shared by all worker processes through a file in the cache directory, any worker attaches to and reports them
+PARSE_JOBS = ParseJobs()
+# rendered comparison tables of the current parsed data, by query
+COMPARISONS = ResultCache()
+
 
 @app.route("/")
 def home():
@@ -29,9 +48,13 @@ def summary():
     will be displayed. Otherwise the summary table will be shown.
     :return:
     """
+    job = PARSE_JOBS.get()
+    if job is not None and job.active:
+        return render_template('home.html', job=job.id, message='The databases are being parsed...',
+                               current_time=time.strftime('%d.%m.%Y'))
     if pt.exists(CACHE) and pt.exists(pt.join(REFSEQ, 'refseq.json')) and pt.exists(pt.join(UNIPROT, 'uniprot.json')):
         try:
-            summary: pd.DataFrame = summary_statistics()
+            summary: pd.DataFrame = get_summary()
             summary_html = summary.to_html(classes='data table table-striped', header="true", index=True, border=0,
                                            justify='left', na_rep=' ', table_id="results")
             return render_template('home.html', results=summary_html, parsed=True,
@@ -39,6 +62,9 @@ def summary():
         except Exception:
             return render_template('home.html', error="Summary could not be generated, try delete the cache and rerun!",
                                    current_time=time.strftime('%d.%m.%Y'))
+    elif job is not None and job.state == 'failed':
+        return render_template('home.html', error=f"Parsing the databases failed: {job.error}",
+                               current_time=time.strftime('%d.%m.%Y'))
     else:
         return render_template('home.html', message='Load databases!', current_time=time.strftime('%d.%m.%Y'))
 
@@ -56,35 +82,79 @@ def comparison():
 def populate():
     """
     If necessary cache files do not exist, this REST route is called. It kicks of the parsing, mapping and
-    saving of the databases.
+    saving of the databases in the background, or attaches to the parse that is running already. Clients asking for
+    json get the job ID and the URL of its status with 202 Accepted, browsers are redirected to the summary page,
+    which shows the progress.
     :return:
     """
-    dbinspector.parse.parse_all()
+    job, _ = PARSE_JOBS.submit()
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'id': job.id, 'state': job.state, 'status': f'/populate/status?job={job.id}'}), 202
     return redirect('/summary')
 
 
+@app.route('/populate/status', methods=['GET'])
+def populate_status():
+    """
+    Reports the state of a parse job and the progress of its stages, downloads (bytes) and parsers as json, see
+    ParseJob.status(). Without the job argument, the job submitted last is reported.
+    :return:
+    """
+    job = PARSE_JOBS.get(request.args.get('job'))
+    if job is None:
+        return jsonify({'error': 'No such parse job.'}), 404
+    return jsonify(job.status())
+
+
+def render_comparison(query: dict) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Compares the entries of a query across the databases and renders the comparison table.
+    :param dict query: the query as given by determine_identifier_type
+    :return: the html table and None, or None and the error message if the query was not found
+    """
+    try:
+        query_res: pd.DataFrame = compare_entries(**query)
+    except QueryNotFoundError:
+        return None, 'The queried identifier was not found!'
+    query_res = query_res.applymap(lambda c: format_list_entry(c) if type(c) == list else c)
+    return query_res.to_html(classes='data table table-striped', header="true", index=True, border=0,
+                             justify='left', na_rep=' ', table_id="results"), None
+
+
 @app.route('/info', methods=['GET'])
 def get_info():
     """
     The comparison form calls this REST route. Type of identifier is estimated and used to lookup and compare
-    the entries in the cached databases.
+    the entries in the cached databases. The rendered tables are cached per query until the data is parsed again,
+    and identical queries that arrive at the same time are compared only once. Browsers revalidate the page with its
+    ETag or modification time and get 304 Not Modified as long as the data did not change.
     :return:
     """
     if request.method == 'GET':
-        # print(request.args)
         symbol = request.args.get('identifier')
-        query = determine_identifier_type(symbol)
+        query = determine_identifier_type(symbol.strip() if symbol else symbol)
         if query:
-            try:
-                query_res: pd.DataFrame = compare_entries(**query)
-                query_res = query_res.applymap(lambda c: format_list_entry(c) if type(c) == list else c)
-                res_html = query_res.to_html(classes='data table table-striped', header="true", index=True,
-                                             border=0, justify='left', na_rep=' ', table_id="results")
-                return render_template('comparison.html', results=res_html, query=symbol,
-                                       current_time=time.strftime('%d.%m.%Y'))
-            except QueryNotFoundError:
-                return render_template('comparison.html', error='The queried identifier was not found!',
-                                       current_time=time.strftime('%d.%m.%Y'))
+            current_time = time.strftime('%d.%m.%Y')
+            version, modified = data_version()
+            # the page shows the query as entered and the current date, the table only depends on the data
+            etag = hashlib.blake2b(json.dumps([version, symbol, current_time]).encode(), digest_size=16).hexdigest()
+            today = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+            last_modified = max(datetime.fromtimestamp(modified, timezone.utc), today) if modified else today
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = Response(status=304)
+            else:
+                results, error = COMPARISONS.get(version, tuple(sorted(query.items())),
+                                                 partial(render_comparison, query))
+                if error:
+                    response = make_response(render_template('comparison.html', error=error,
+                                                             current_time=current_time))
+                else:
+                    response = make_response(render_template('comparison.html', results=results, query=symbol,
+                                                             current_time=current_time))
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
         else:
             return render_template('comparison.html', error='Empty input!', current_time=time.strftime('%d.%m.%Y'))
 